@@ -0,0 +1,147 @@
+import time
+import asyncio
+import socket
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+from core.metrics import inc, observe, register_gauge, time_stage
+from core.log import get_logger
+from uplink_packet_handling.uplink_packet_entry_point import handle_uplink_packet
+from NS_shim.gateway_routing import update_gateway_route
+from NS_shim.uplink_work_queue import schedule_result
+from NS_shim import json_codec
+from NS_shim.downlink_scheduler import start_downlink_scheduler
+from NS_shim.server import (CFG, PUSH_DATA, PUSH_ACK, PULL_DATA, PULL_ACK, TX_ACK,
+                            build_ack, send_pull_resp, configure_pipeline)
+
+# asyncio server mode (CFG["SERVER_MODE"] = "asyncio")
+# The event loop only receives datagrams and sends PUSH_ACK / PULL_ACK, so keepalives
+# never wait behind uplink processing. PUSH_DATA bodies go into a bounded asyncio.Queue
+# and a set of worker tasks run the (blocking) uplink pipeline on a thread pool.
+
+log = get_logger(__name__)
+
+
+class SemtechUDPProtocol(asyncio.DatagramProtocol):
+    """Receives Semtech UDP datagrams, acks them on the loop and queues uplink work."""
+
+    def __init__(self, uplink_queue: asyncio.Queue):
+        self.transport = None
+        self.uplink_queue = uplink_queue
+        # Most recent PULL_DATA sender: fallback for gateways without a live route
+        self.last_pull_addr = None
+
+    def connection_made(self, transport) -> None:
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        rx_clock = time.perf_counter()
+        if len(data) < 12:
+            log.warning("[NS] Packet too short (%d B) from %s", len(data), addr)
+            return
+
+        ver = data[0]
+        token = data[1:3]
+        pkt_type = data[3]
+        gateway_mac = data[4:12].hex().upper()
+
+        if pkt_type == PUSH_DATA:
+            # Ack first, the JSON body is handled by the uplink workers
+            self.transport.sendto(build_ack(ver, token, PUSH_ACK), addr)
+            observe("push_ack_latency_seconds", time.perf_counter() - rx_clock)
+            try:
+                self.uplink_queue.put_nowait((data[12:], addr, gateway_mac))
+            except asyncio.QueueFull:
+                inc("uplink_queue_dropped_total")
+                log.warning("[NS] Uplink queue full, PUSH_DATA from %s dropped", addr)
+
+        elif pkt_type == PULL_DATA:  # gateway keepalive / TX channel
+            self.transport.sendto(build_ack(ver, token, PULL_ACK), addr)
+            observe("pull_ack_latency_seconds", time.perf_counter() - rx_clock)
+            update_gateway_route(gateway_mac, addr)
+            self.last_pull_addr = addr
+
+        elif pkt_type == TX_ACK:
+            payload = data[12:].decode("utf-8", errors="ignore")
+            log.debug("[NS] TX_ACK from %s: %s", addr, payload if payload else "<no body>")
+
+        else:
+            log.warning("[NS] Unknown packet type: 0x%02X", pkt_type)
+
+    def error_received(self, exc: Exception) -> None:
+        log.error("[NS] Receive error: %s", exc)
+
+
+def process_push_data_body(body: bytes, gateway_mac: str, on_result: Callable[[Dict[str, Any]], None]) -> None:
+    """Decodes a PUSH_DATA JSON body and hands its frames to the uplink pipeline (runs on a worker thread)."""
+    with time_stage("json_decode"):
+        msg = json_codec.decode_push_data(body)
+    if msg is None or "rxpk" not in msg:
+        return  # stat-only report, nothing to process
+    handle_uplink_packet(msg, gateway_mac, on_result)
+
+
+async def uplink_worker(protocol: SemtechUDPProtocol, queue: asyncio.Queue, executor: ThreadPoolExecutor) -> None:
+    """Pulls PUSH_DATA bodies from the queue; their results schedule any resulting PULL_RESP."""
+    loop = asyncio.get_running_loop()
+    while True:
+        body, addr, gateway_mac = await queue.get()
+        try:
+            fallback_addr = protocol.last_pull_addr or (CFG["GATEWAY_IP"], CFG["UDP_PORT"])
+            # Results arrive from the dedup dispatch threads (schedule_downlink is thread-safe)
+            await loop.run_in_executor(executor, process_push_data_body, body, gateway_mac,
+                                       lambda result: schedule_result(result, fallback_addr))
+        except Exception as e:
+            inc("uplink_handler_errors_total")
+            log.error("[NS] Uplink handler error (%s): %s", addr, e)
+        finally:
+            queue.task_done()
+
+
+async def serve_async(sock: socket.socket | None = None) -> None:
+    """
+    Runs the asyncio Semtech UDP server until cancelled.
+
+    Args:
+        sock: optional pre-bound UDP socket; if None, binds CFG["SERVER_IP"]:CFG["UDP_PORT"]
+    """
+    loop = asyncio.get_running_loop()
+    configure_pipeline()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=CFG.get("UPLINK_QUEUE_SIZE", 1024))
+    register_gauge("uplink_queue_depth", queue.qsize)
+    register_gauge("uplink_queue_capacity", lambda: queue.maxsize)
+    n_workers = CFG.get("UPLINK_WORKERS", 4)
+    executor = ThreadPoolExecutor(max_workers=n_workers, thread_name_prefix="uplink")
+
+    if sock is None:
+        transport, protocol = await loop.create_datagram_endpoint(
+            lambda: SemtechUDPProtocol(queue),
+            local_addr=(CFG["SERVER_IP"], CFG["UDP_PORT"]),
+        )
+    else:
+        transport, protocol = await loop.create_datagram_endpoint(
+            lambda: SemtechUDPProtocol(queue), sock=sock
+        )
+
+    # The scheduler thread hands each due PULL_RESP to the loop (transports are not thread-safe)
+    start_downlink_scheduler(
+        lambda down_json, addr: loop.call_soon_threadsafe(send_pull_resp, transport, down_json, addr))
+
+    log.info("[NS] (asyncio) Listening on %s:%s with %d uplink workers",
+             CFG["SERVER_IP"], CFG["UDP_PORT"], n_workers)
+
+    workers = [asyncio.create_task(uplink_worker(protocol, queue, executor)) for _ in range(n_workers)]
+    try:
+        await asyncio.Future()  # run forever
+    finally:
+        for w in workers:
+            w.cancel()
+        transport.close()
+        executor.shutdown(wait=False)
+
+
+def start_async_server(sock: socket.socket | None = None) -> None:
+    """Blocking entry point for the asyncio server mode."""
+    try:
+        asyncio.run(serve_async(sock))
+    except KeyboardInterrupt:
+        log.info("[NS] Server stopped")
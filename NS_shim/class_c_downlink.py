@@ -0,0 +1,121 @@
+from typing import Iterable
+from core.log import get_logger
+from core.metrics import inc
+from features.adr import device_adr_enabled
+from features.airtime import txpk_airtime_us
+from NS_shim import downlink_scheduler
+from NS_shim.downlink_json_obj_generator import downlink_wrap_pkt_into_json
+from NS_shim.gateway_routing import get_gateway_pull_addr
+from NS_shim.time_stamp import MICROSECONDS
+from downlink_pkt_handler.downlink_queue import enqueue_app_payload, build_next_downlink, max_frm_payload, pending_downlinks
+from uplink_packet_handling.processing.session_store import load_device
+from uplink_packet_handling.processing.device_registry import get_device_class
+
+# Class C downlinks.
+# A Class C device listens on RX2 whenever it is not transmitting, so its downlinks do not
+# have to wait for an uplink: queue_downlink() puts the payload on the device's queue
+# (downlink_queue.py) and, for a Class C device, sends it right away as an "imme" txpk on the
+# RX2 frequency / data rate through the downlink scheduler (duty cycle still applies).
+# The gateway is taken from the device's latest uplink metadata: the best gateway first,
+# then the other gateways that heard it, the first one with a live PULL_DATA route wins.
+# Frames of one burst are spaced by their airtime plus FRAME_GAP_S so the gateway does
+# not get overlapping "imme" packets. Without a reachable gateway the data stays queued and
+# goes out with the device's next uplink.
+# After a Class A reply to a Class C device, whatever is still queued follows once the
+# reply's RX2 window is over.
+#
+# CFG keys (all optional):
+#   CLASS_C_DEVICES       []    DevEUIs handled as Class C (besides DeviceClass: C in the record)
+#   CLASS_C_FRAME_GAP_MS  100   pause between consecutive Class C frames to one device
+
+FRAME_GAP_S = 0.100
+
+_class_c_devices: frozenset = frozenset()
+
+log = get_logger(__name__)
+
+
+def configure_class_c(dev_euis: Iterable[str] = (), frame_gap_ms: float = 100) -> None:
+    global _class_c_devices, FRAME_GAP_S
+    _class_c_devices = frozenset(dev_eui.upper() for dev_eui in dev_euis)
+    FRAME_GAP_S = max(0.0, frame_gap_ms / 1000.0)
+
+
+def is_class_c(dev_eui: str) -> bool:
+    return dev_eui.upper() in _class_c_devices or get_device_class(dev_eui) == "C"
+
+
+def _pick_gateway(metadata: dict) -> tuple[str, tuple] | None:
+    """(gateway MAC, PULL_DATA address) of the best gateway of the last uplink that is still reachable."""
+    candidates = [metadata.get("gateway_mac")]
+    gateways = sorted(metadata.get("Gateways") or [],
+                      key=lambda gw: gw.get("lsnr") if gw.get("lsnr") is not None else float("-inf"),
+                      reverse=True)
+    candidates += [gw.get("gateway_mac") for gw in gateways]
+    for gateway_mac in candidates:
+        addr = get_gateway_pull_addr(gateway_mac)
+        if addr is not None:
+            return gateway_mac, addr
+    return None
+
+
+def send_class_c_downlinks(dev_eui: str, delay_s: float = 0.0) -> int:
+    """
+    Sends everything queued for a Class C device as "imme" RX2 frames.
+
+    Args:
+        dev_eui: target device
+        delay_s: when the first frame may leave (seconds from now)
+
+    Returns the number of frames handed to the scheduler.
+    """
+    record = load_device(dev_eui)
+    if record is None or not record.get("DevAddr") or not record.get("NwkSKey"):
+        log.warning("[NS] Class C downlink for %s skipped: device has not joined", dev_eui)
+        return 0
+    route = _pick_gateway(record.get("Metadata") or {})
+    if route is None:
+        inc("downlink_class_c_no_gateway_total")
+        log.warning("[NS] Class C downlink for %s deferred: no reachable gateway", dev_eui)
+        return 0
+    gateway_mac, addr = route
+
+    dev_addr = bytes.fromhex(record["DevAddr"])  # stored in on-air (little-endian) order
+    adr = device_adr_enabled(dev_eui)
+    rx2_freq, rx2_datr = downlink_scheduler.RX2_FREQ, downlink_scheduler.RX2_DATR
+    max_payload = max_frm_payload(rx2_datr)
+    sent = 0
+    while pending_downlinks(dev_eui):
+        built = build_next_downlink(dev_eui, dev_addr, max_payload, adr=adr)
+        if built is None:
+            break  # only payloads too large for RX2 are left
+        downlink_pkt, requeue = built
+        down_json = downlink_wrap_pkt_into_json(downlink_pkt, rx2_freq, 0, 14, "LORA", rx2_datr, "4/5", True, None)
+        downlink_scheduler.schedule_immediate(down_json, addr, gateway_mac, delay_s, on_drop=requeue)
+        delay_s += txpk_airtime_us(down_json["txpk"]) / MICROSECONDS + FRAME_GAP_S
+        sent += 1
+    if sent:
+        inc("downlink_class_c_total", sent)
+        log.debug("[NS] %d Class C frame(s) for %s via gateway %s", sent, dev_eui, gateway_mac)
+    return sent
+
+
+def queue_downlink(dev_eui: str, payload: bytes, fport: int = 1, confirmed: bool = False) -> int:
+    """
+    Queues an application payload for the device; a Class C device gets it immediately.
+    Returns the number of frames sent now (0: it waits for the device's next uplink).
+    """
+    enqueue_app_payload(dev_eui, payload, fport, confirmed)
+    if is_class_c(dev_eui):
+        return send_class_c_downlinks(dev_eui)
+    return 0
+
+
+def delay_after_class_a_reply(meta_data: dict, reply_size: int, now: float) -> float:
+    """Seconds from `now` until the RX2 window of the uplink in `meta_data` (with a reply of `reply_size` bytes) is over."""
+    rx2_tmst = (meta_data.get("DLSettings") or {}).get("rx2_tmst")
+    if rx2_tmst is None or meta_data.get("tmst") is None or "recv_clock" not in meta_data:
+        return 0.0
+    rx2_local = downlink_scheduler.tmst_to_local(rx2_tmst, meta_data["tmst"], meta_data["recv_clock"])
+    reply_airtime = txpk_airtime_us({"datr": downlink_scheduler.RX2_DATR, "size": reply_size}) / MICROSECONDS
+    return max(0.0, rx2_local + reply_airtime + FRAME_GAP_S - now)
@@ -0,0 +1,240 @@
+import heapq
+import itertools
+import threading
+import time
+from typing import Any, Callable, Dict
+from core.log import get_logger
+from core.metrics import inc, observe, register_gauge
+from NS_shim.time_stamp import MICROSECONDS, TMST_MAX
+from features.airtime import txpk_airtime_us
+from features.duty_cycle import reserve_airtime, next_allowed
+
+# Earliest-deadline-first downlink scheduler (both server modes).
+# The uplink pipeline hands over a finished txpk together with the RX windows of its
+# uplink (compute_rx_tmsts); jobs wait in a heap ordered by the deadline of their target
+# window and a single thread sends each PULL_RESP as late as safely possible:
+#
+#   window_local = recv_clock + (window_tmst - uplink_tmst) / 1e6   (concentrator -> perf_counter)
+#   send_at      = window_local - SEND_LEAD_S   (gateway gets the PULL_RESP SEND_LEAD_S early)
+#   deadline     = window_local - MIN_LEAD_S    (later than this the gateway cannot make it)
+#
+# A job whose RX1 deadline has passed is retargeted to RX2 (tmst = rx2_tmst, RX2 frequency
+# and data rate); a job that misses RX2 too is dropped and counted in
+# downlink_deadline_missed_total. Jobs without RX windows (e.g. "imme" txpk) go out at once;
+# schedule_immediate() queues such a job for Class C devices, optionally after a delay.
+#
+# Before a PULL_RESP leaves, its airtime is reserved against the gateway's sub-band
+# duty cycle (features/duty_cycle.py). A job over the limit moves from RX1 to RX2 (its own
+# 10 % sub-band), an "imme" job waits until the sub-band has room, anything else is
+# rejected (downlink_duty_cycle_rejected_total).
+# A job may carry an on_drop callback: it runs (on the scheduler thread) whenever the job is
+# dropped or its send fails, e.g. to requeue the frame's MAC commands and payload.
+#
+# CFG keys (all optional):
+#   DOWNLINK_SEND_LEAD_MS  100        how long before the window the PULL_RESP is sent
+#   DOWNLINK_MIN_LEAD_MS   20         minimum lead the gateway needs (JIT queue + network)
+#   RX2_FREQ               869.525    EU868 RX2 frequency (MHz)
+#   RX2_DATR               "SF12BW125"  EU868 RX2 data rate (DR0)
+
+log = get_logger(__name__)
+
+SEND_LEAD_S = 0.100
+MIN_LEAD_S = 0.020
+RX2_FREQ = 869.525
+RX2_DATR = "SF12BW125"
+
+_heap: list = []
+_cond = threading.Condition()
+_seq = itertools.count()
+_send_fn: Callable[[Dict[str, Any], tuple], None] | None = None
+_thread: threading.Thread | None = None
+
+
+class DownlinkJob:
+    __slots__ = ("down_json", "addr", "gateway", "window", "window_local", "rx2_tmst", "rx2_local", "on_drop")
+
+    def __init__(self, down_json: Dict[str, Any], addr: tuple, gateway: str, window: str,
+                 window_local: float, rx2_tmst: int | None = None, rx2_local: float | None = None,
+                 on_drop: Callable[[], None] | None = None):
+        self.down_json = down_json
+        self.addr = addr
+        self.gateway = gateway            # duty-cycle account (gateway MAC, else address)
+        self.window = window              # "RX1" | "RX2" | "IMME"
+        self.window_local = window_local  # perf_counter() time the target window opens
+        self.rx2_tmst = rx2_tmst
+        self.rx2_local = rx2_local
+        self.on_drop = on_drop
+
+    @property
+    def deadline(self) -> float:
+        return self.window_local - MIN_LEAD_S
+
+    @property
+    def send_at(self) -> float:
+        return self.window_local - SEND_LEAD_S
+
+
+def configure_downlink_scheduler(send_lead_ms: float = 100, min_lead_ms: float = 20,
+                                 rx2_freq: float = 869.525, rx2_datr: str = "SF12BW125") -> None:
+    global SEND_LEAD_S, MIN_LEAD_S, RX2_FREQ, RX2_DATR
+    if min_lead_ms > send_lead_ms:
+        raise ValueError("❌ DOWNLINK_MIN_LEAD_MS must not exceed DOWNLINK_SEND_LEAD_MS")
+    SEND_LEAD_S = send_lead_ms / 1000.0
+    MIN_LEAD_S = min_lead_ms / 1000.0
+    RX2_FREQ = float(rx2_freq)
+    RX2_DATR = rx2_datr
+
+
+def start_downlink_scheduler(send_fn: Callable[[Dict[str, Any], tuple], None]) -> None:
+    """
+    Starts the scheduler thread (once per process).
+
+    Args:
+        send_fn: send_fn(down_json, addr) sends one PULL_RESP; it is called from the
+                 scheduler thread
+    """
+    global _send_fn, _thread
+    _send_fn = send_fn
+    if _thread is None:
+        register_gauge("downlink_scheduler_pending", lambda: len(_heap))
+        _thread = threading.Thread(target=_scheduler_loop, name="downlink-scheduler", daemon=True)
+        _thread.start()
+
+
+def tmst_to_local(tmst: int, uplink_tmst: int, recv_clock: float) -> float:
+    """perf_counter() time of a concentrator timestamp, relative to the uplink it follows."""
+    return recv_clock + ((tmst - uplink_tmst) % TMST_MAX) / MICROSECONDS
+
+
+def schedule_downlink(down_json: Dict[str, Any], addr: tuple, rx_windows: Dict[str, Any] | None = None,
+                      gateway_mac: str | None = None, on_drop: Callable[[], None] | None = None) -> None:
+    """
+    Queues a PULL_RESP for the gateway at `addr`.
+
+    Args:
+        down_json: {"txpk": {...}} with tmst set to rx1_tmst or rx2_tmst
+        addr: PULL_RESP target (gateway PULL_DATA address)
+        rx_windows: {"recv_clock", "uplink_tmst", "rx1_tmst", "rx2_tmst"} of the uplink;
+                    None sends the job immediately
+        gateway_mac: gateway the downlink goes through (duty-cycle accounting)
+        on_drop: called if the downlink is dropped instead of sent
+    """
+    gateway = gateway_mac or f"{addr[0]}:{addr[1]}"
+    txpk = down_json.setdefault("txpk", {})
+    if rx_windows is None or txpk.get("imme") or rx_windows.get("uplink_tmst") is None:
+        job = DownlinkJob(down_json, addr, gateway, "IMME", time.perf_counter() + SEND_LEAD_S)
+    else:
+        recv_clock, uplink_tmst = rx_windows["recv_clock"], rx_windows["uplink_tmst"]
+        rx2_tmst = rx_windows["rx2_tmst"]
+        rx2_local = tmst_to_local(rx2_tmst, uplink_tmst, recv_clock)
+        if txpk.get("tmst") == rx2_tmst:  # decide_receive_window already gave up on RX1
+            job = DownlinkJob(down_json, addr, gateway, "RX2", rx2_local, rx2_tmst, rx2_local)
+            _retarget_rx2(job)
+        else:
+            rx1_local = tmst_to_local(rx_windows["rx1_tmst"], uplink_tmst, recv_clock)
+            txpk["tmst"] = rx_windows["rx1_tmst"]
+            job = DownlinkJob(down_json, addr, gateway, "RX1", rx1_local, rx2_tmst, rx2_local)
+    job.on_drop = on_drop
+    _push(job)
+
+
+def schedule_immediate(down_json: Dict[str, Any], addr: tuple, gateway_mac: str | None = None,
+                       delay_s: float = 0.0, on_drop: Callable[[], None] | None = None) -> None:
+    """
+    Queues an "imme" PULL_RESP (no receive window: Class C), sent `delay_s` from now.
+    Any tmst in the txpk is removed; the gateway transmits as soon as it gets the packet.
+    """
+    txpk = down_json.setdefault("txpk", {})
+    txpk.pop("tmst", None)
+    txpk["imme"] = True
+    gateway = gateway_mac or f"{addr[0]}:{addr[1]}"
+    _push(DownlinkJob(down_json, addr, gateway, "IMME", time.perf_counter() + max(0.0, delay_s) + SEND_LEAD_S,
+                      on_drop=on_drop))
+
+
+def _push(job: DownlinkJob) -> None:
+    with _cond:
+        heapq.heappush(_heap, (job.deadline, next(_seq), job))
+        _cond.notify()
+
+
+def _retarget_rx2(job: DownlinkJob) -> None:
+    """Moves a job to the RX2 window (fixed frequency and data rate)."""
+    txpk = job.down_json["txpk"]
+    txpk["tmst"] = job.rx2_tmst
+    txpk["freq"] = RX2_FREQ
+    txpk["datr"] = RX2_DATR
+    job.window = "RX2"
+    job.window_local = job.rx2_local
+
+
+def _scheduler_loop() -> None:
+    while True:
+        with _cond:
+            while not _heap:
+                _cond.wait()
+            job = _heap[0][2]
+            wait_s = job.send_at - time.perf_counter()
+            if wait_s > 0:
+                _cond.wait(wait_s)  # a job with an earlier deadline may arrive meanwhile
+                continue
+            heapq.heappop(_heap)
+        _dispatch(job, time.perf_counter())
+
+
+def _dispatch(job: DownlinkJob, now: float) -> None:
+    if job.window != "IMME" and now > job.deadline:
+        if job.window == "RX1" and job.rx2_tmst is not None:
+            _retarget_rx2(job)
+            if now <= job.deadline:
+                inc("downlink_retargeted_rx2_total")
+                _push(job)
+                return
+        inc("downlink_deadline_missed_total")
+        log.warning("[NS] Downlink to %s dropped: %s missed by %.1f ms",
+                    job.addr, job.window, (now - job.deadline) * 1000)
+        _drop(job)
+        return
+
+    txpk = job.down_json["txpk"]
+    if "datr" in txpk and "size" in txpk:
+        airtime_us = txpk_airtime_us(txpk)
+        if not reserve_airtime(job.gateway, txpk.get("freq", 0.0), airtime_us, now):
+            _defer_for_duty_cycle(job, airtime_us, now)
+            return
+
+    observe("downlink_send_lead_seconds", job.window_local - now)
+    try:
+        _send_fn(job.down_json, job.addr)
+    except Exception as e:
+        log.error("[NS] Downlink send error: %s", e)
+        _drop(job)
+
+
+def _drop(job: DownlinkJob) -> None:
+    if job.on_drop is None:
+        return
+    try:
+        job.on_drop()
+    except Exception as e:
+        log.error("[NS] Downlink drop handler error: %s", e)
+
+
+def _defer_for_duty_cycle(job: DownlinkJob, airtime_us: int, now: float) -> None:
+    txpk = job.down_json["txpk"]
+    if job.window == "RX1" and job.rx2_tmst is not None:
+        inc("downlink_duty_cycle_rx2_total")
+        _retarget_rx2(job)
+        _push(job)
+        return
+    if job.window == "IMME":
+        ready = next_allowed(job.gateway, txpk.get("freq", 0.0), airtime_us, now)
+        if ready != float("inf"):
+            inc("downlink_duty_cycle_deferred_total")
+            job.window_local = ready + SEND_LEAD_S  # send_at == ready
+            _push(job)
+            return
+    inc("downlink_duty_cycle_rejected_total")
+    log.warning("[NS] Downlink to %s rejected: duty cycle of gateway %s exhausted on %s MHz",
+                job.addr, job.gateway, txpk.get("freq"))
+    _drop(job)
@@ -0,0 +1,63 @@
+import time
+import threading
+from typing import Any, Dict
+
+# Downlink routing table keyed by gateway MAC (8-byte EUI from datagram bytes 4..12,
+# stored as uppercase hex). Every PULL_DATA refreshes the gateway's entry:
+#   {"pull_addr": (ip, port), "last_seen": <monotonic s>, "expires_at": <monotonic s>}
+# Uplink metadata records the MAC of the gateway that heard the frame, so the PULL_RESP
+# goes back through that gateway with one dict lookup.
+# Reads are lock-free (single dict get); writers replace whole entries under a lock.
+
+KEEPALIVE_TIMEOUT_S = 30.0  # PULL_DATA is sent every ~10 s by the packet forwarder
+
+_routes: Dict[str, Dict[str, Any]] = {}
+_lock = threading.Lock()
+
+
+def configure_keepalive_timeout(timeout_s: float) -> None:
+    """Sets how long a gateway route stays valid after its last PULL_DATA."""
+    global KEEPALIVE_TIMEOUT_S
+    KEEPALIVE_TIMEOUT_S = float(timeout_s)
+
+
+def update_gateway_route(gateway_mac: str, pull_addr: tuple[str, int], now: float | None = None) -> None:
+    """Records the PULL_DATA address of a gateway and pushes its keepalive expiry forward."""
+    now = time.monotonic() if now is None else now
+    entry = {"pull_addr": pull_addr, "last_seen": now, "expires_at": now + KEEPALIVE_TIMEOUT_S}
+    with _lock:
+        _routes[gateway_mac] = entry
+
+
+def get_gateway_pull_addr(gateway_mac: str | None, now: float | None = None) -> tuple[str, int] | None:
+    """Returns the PULL_DATA address of a gateway, or None if unknown or its keepalive expired."""
+    if gateway_mac is None:
+        return None
+    entry = _routes.get(gateway_mac)
+    if entry is None:
+        return None
+    now = time.monotonic() if now is None else now
+    if now > entry["expires_at"]:
+        return None
+    return entry["pull_addr"]
+
+
+def resolve_downlink_addr(gateway_mac: str | None, fallback_addr: tuple[str, int]) -> tuple[str, int]:
+    """PULL_RESP target for a downlink: the gateway's route if alive, otherwise `fallback_addr`."""
+    return get_gateway_pull_addr(gateway_mac) or fallback_addr
+
+
+def get_gateway_routes() -> Dict[str, Dict[str, Any]]:
+    """Snapshot of the routing table (for diagnostics)."""
+    with _lock:
+        return {mac: dict(entry) for mac, entry in _routes.items()}
+
+
+def prune_expired_routes(now: float | None = None) -> int:
+    """Removes routes whose keepalive expired; returns how many were removed."""
+    now = time.monotonic() if now is None else now
+    with _lock:
+        expired = [mac for mac, entry in _routes.items() if now > entry["expires_at"]]
+        for mac in expired:
+            del _routes[mac]
+    return len(expired)
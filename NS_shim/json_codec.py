@@ -0,0 +1,88 @@
+import re
+import json
+from core.metrics import inc
+
+# JSON codec for the Semtech UDP bodies (PUSH_DATA in, PULL_RESP out).
+# Uses the fastest library installed: orjson, then ujson, then the stdlib json module.
+# CFG["JSON_CODEC"] = "auto" (default) | "orjson" | "ujson" | "stdlib" forces one.
+#
+# loads() takes the datagram bytes (or a memoryview of them) directly, without building
+# an intermediate str. dumps() returns compact UTF-8 bytes ready to append to the header.
+# decode_push_data() skips parsing entirely for stat-only PUSH_DATA: base64 never contains
+# a quote, so a body without the '"rxpk"' key carries no uplink.
+
+JSON_CODECS = ("auto", "orjson", "ujson", "stdlib")
+JSON_CODEC = "stdlib"
+JSONDecodeError = json.JSONDecodeError
+
+_RXPK_KEY = re.compile(rb'"rxpk"')  # re searches bytes and memoryviews without copying
+
+
+def _stdlib_loads(data):
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    return json.loads(data)  # bytes are accepted as-is (UTF-8 detected by json)
+
+
+def _stdlib_dumps(obj) -> bytes:
+    return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+
+loads = _stdlib_loads
+dumps = _stdlib_dumps
+
+
+def configure_json_codec(name: str = "auto") -> str:
+    """Selects the JSON library; returns the name of the one in use."""
+    global loads, dumps, JSON_CODEC, JSONDecodeError
+    if name not in JSON_CODECS:
+        raise ValueError(f"❌ Unknown JSON codec: {name} (expected one of {JSON_CODECS})")
+
+    candidates = ("orjson", "ujson", "stdlib") if name == "auto" else (name,)
+    for candidate in candidates:
+        if candidate == "orjson":
+            try:
+                import orjson
+            except ImportError:
+                continue
+            loads, dumps = orjson.loads, orjson.dumps  # both work on bytes / memoryview
+            JSONDecodeError = orjson.JSONDecodeError
+        elif candidate == "ujson":
+            try:
+                import ujson
+            except ImportError:
+                continue
+
+            def loads(data, _loads=ujson.loads):
+                return _loads(data.tobytes() if isinstance(data, memoryview) else data)
+
+            def dumps(obj, _dumps=ujson.dumps) -> bytes:
+                return _dumps(obj, ensure_ascii=False, escape_forward_slashes=False).encode("utf-8")
+
+            JSONDecodeError = getattr(ujson, "JSONDecodeError", ValueError)
+        else:
+            loads, dumps = _stdlib_loads, _stdlib_dumps
+            JSONDecodeError = json.JSONDecodeError
+        JSON_CODEC = candidate
+        return candidate
+
+    raise ImportError(f"❌ JSON codec '{name}' is not installed")
+
+
+def is_stat_only(body) -> bool:
+    """True if a PUSH_DATA body carries no rxpk (gateway status report only)."""
+    return _RXPK_KEY.search(body) is None
+
+
+def decode_push_data(body):
+    """
+    Decodes a PUSH_DATA body (bytes / memoryview after the 12-byte header).
+    Returns None for stat-only reports without parsing them.
+    """
+    if is_stat_only(body):
+        inc("push_data_stat_total")
+        return None
+    return loads(body)
+
+
+configure_json_codec("auto")
@@ -1,9 +1,25 @@
 import os
 import json
 import base64
+import time
 import socket
 from typing import  Dict, Any
-from uplink_packet_handling.uplink_packet_entry_point import handle_uplink_packet
+from core.metrics import observe, get_histogram, time_stage, start_metrics_server
+from core.log import get_logger, configure_logging_from_config
+from NS_shim.uplink_work_queue import start_uplink_consumers, submit_push_data
+from NS_shim.gateway_routing import update_gateway_route, configure_keepalive_timeout
+from NS_shim import json_codec
+from NS_shim.downlink_scheduler import configure_downlink_scheduler
+from features.duty_cycle import configure_duty_cycle
+from features.adr import configure_adr
+from downlink_pkt_handler.downlink_queue import configure_downlink_queue
+from NS_shim.class_c_downlink import configure_class_c
+from features.join_guard import configure_join_guard
+from uplink_packet_handling.deduplication import configure_dedup_window
+from uplink_packet_handling.processing.session_store import configure_flush_interval
+from uplink_packet_handling.processing.registry_backends import configure_registry_backend
+from uplink_packet_handling.processing.devaddr_index import load_devaddr_index, configure_devaddr_miss_cache
+from uplink_packet_handling.protocol_layers.fast_decoder import configure_frame_decoder
 
 
 # ---------------- CONFIG LOADING ----------------
@@ -24,6 +40,55 @@ def load_cfg(path: str = "config/network_server_config.json") -> Dict[str, Any]:
 
 CFG = load_cfg()
 
+# ---------------- SEMTECH UDP IDENTIFIERS ----------------
+# Byte 3 of every Semtech UDP datagram
+PUSH_DATA = 0x00
+PUSH_ACK  = 0x01
+PULL_DATA = 0x02
+PULL_RESP = 0x03
+PULL_ACK  = 0x04
+TX_ACK    = 0x05
+
+
+log = get_logger(__name__)
+
+# Non-blocking recv flag used for draining (not available on Windows: no draining there)
+_MSG_DONTWAIT = getattr(socket, "MSG_DONTWAIT", None)
+
+# Batch sizes are counts, not latencies
+get_histogram("recv_batch_size", (1, 2, 4, 8, 16, 32, 64, 128, 256))
+
+
+def build_ack(ver: int, token: bytes, ack_type: int) -> bytes:
+    """Builds a 4-byte PUSH_ACK / PULL_ACK echoing the gateway's version and token."""
+    return bytes([ver, token[0], token[1], ack_type])
+
+def configure_pipeline() -> None:
+    """Applies the optional CFG tunables shared by every server mode."""
+    configure_logging_from_config(CFG)
+    configure_keepalive_timeout(CFG.get("GATEWAY_KEEPALIVE_TIMEOUT_S", 30))
+    configure_dedup_window(CFG.get("DEDUP_WINDOW_MS", 200), CFG.get("DEDUP_WORKERS", 4))
+    configure_flush_interval(CFG.get("SESSION_FLUSH_INTERVAL_S", 1.0))
+    configure_frame_decoder(CFG.get("FRAME_DECODER", "fast"))
+    configure_downlink_scheduler(CFG.get("DOWNLINK_SEND_LEAD_MS", 100), CFG.get("DOWNLINK_MIN_LEAD_MS", 20),
+                                 CFG.get("RX2_FREQ", 869.525), CFG.get("RX2_DATR", "SF12BW125"))
+    configure_duty_cycle(CFG.get("DUTY_CYCLE_ENABLED", True), CFG.get("DUTY_CYCLE_WINDOW_S", 3600),
+                         CFG.get("DUTY_CYCLE_BUCKETS", 60))
+    configure_adr(CFG.get("ADR_HISTORY_SIZE", 20), CFG.get("ADR_MARGIN_DB", 10))
+    configure_downlink_queue(CFG.get("DOWNLINK_QUEUE_MAX", 16))
+    configure_class_c(CFG.get("CLASS_C_DEVICES", []), CFG.get("CLASS_C_FRAME_GAP_MS", 100))
+    log.info("[NS] JSON codec: %s", json_codec.configure_json_codec(CFG.get("JSON_CODEC", "auto")))
+    configure_registry_backend(CFG.get("REGISTRY_BACKEND", "yaml"),
+                               CFG.get("REGISTRY_DB_PATH", "config/registry.sqlite3"))
+    join_keys = configure_join_guard(CFG.get("JOIN_REGISTRY_PATH", "config/network_server_device_config.yaml"),
+                                     CFG.get("JOIN_DEVEUI_RATE_PER_S", 0.1), CFG.get("JOIN_DEVEUI_BURST", 3),
+                                     CFG.get("JOIN_GATEWAY_RATE_PER_S", 5), CFG.get("JOIN_GATEWAY_BURST", 20))
+    log.info("[NS] Join key cache: %d AppKeys", join_keys)
+    configure_devaddr_miss_cache(CFG.get("DEVADDR_MISS_TTL_S", 30), CFG.get("DEVADDR_MISS_CACHE_SIZE", 4096))
+    log.info("[NS] DevAddr index loaded: %d entries", load_devaddr_index())
+    if start_metrics_server(CFG.get("METRICS_PORT", 0), CFG.get("METRICS_HOST", "127.0.0.1")):
+        log.info("[NS] Metrics on http://%s:%s/metrics", CFG.get("METRICS_HOST", "127.0.0.1"), CFG["METRICS_PORT"])
+
 # ---------------- CORE FUNCTIONS ----------------
 def start_server() -> None:
     """Bind to UDP and process Semtech UDP packets."""
@@ -31,81 +96,127 @@ def start_server() -> None:
     sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     sock.bind((CFG["SERVER_IP"], CFG["UDP_PORT"]))
 
-    print(f"[NS] Listening on {CFG['SERVER_IP']}:{CFG['UDP_PORT']} "
-          f"(→ default gw {CFG['GATEWAY_IP']}:{CFG['UDP_PORT']})")
+    configure_pipeline()
+
+    log.info("[NS] Listening on %s:%s (→ default gw %s:%s)",
+             CFG["SERVER_IP"], CFG["UDP_PORT"], CFG["GATEWAY_IP"], CFG["UDP_PORT"])
+
+    # PUSH_DATA bodies are handled off the receive path by the consumer threads
+    start_uplink_consumers(sock, CFG.get("UPLINK_WORKERS", 4), CFG.get("UPLINK_QUEUE_SIZE", 1024))
 
-    # Remember the most recent PULL_DATA sender to reply PULL_RESP there
+    # Downlinks follow the per-gateway routing table; the most recent PULL_DATA sender
+    # is only the fallback for gateways without a live route
     last_pull_addr = None
+    max_batch = CFG.get("RECV_BATCH_MAX", 64)
 
     while True:
-        last_pull_addr = receive_uplink(sock, last_pull_addr)
+        last_pull_addr = receive_uplink_batch(sock, last_pull_addr, max_batch)
 
 
 def receive_uplink(sock: socket.socket, last_pull_addr) -> tuple[str, int] | None:
+    """Receives and handles a single datagram (batch of one)."""
+    return receive_uplink_batch(sock, last_pull_addr, 1)
+
+
+def drain_datagrams(sock: socket.socket, max_batch: int) -> list[tuple[bytes, tuple[str, int]]]:
+    """
+    Blocks for the first datagram, then drains every datagram already pending on the
+    socket without blocking, up to `max_batch` datagrams in total.
+    """
+    bufsize = CFG['BUF_SIZE']
+    batch = [sock.recvfrom(bufsize)]
+    if _MSG_DONTWAIT is None:
+        return batch
     try:
-        data, addr = sock.recvfrom(CFG['BUF_SIZE'])
-        if len(data) < 4:
-            print("[NS] Packet too short!")
-            return last_pull_addr
-
-        ver = data[0]
-        token = data[1:3]
-        pkt_type = data[3]
-        mac = data[4:12] if len(data) >= 12 else b""
-
-        print(f"[NS] RX type=0x{pkt_type:02X} from {addr}, ver={ver}, token={token.hex()}, MAC={mac.hex()}")
-
-        if pkt_type == 0x00:  # PUSH_DATA
-            # Body starts at byte 12
-            try:
-                msg = json.loads(data[12:].decode("utf-8"))
-                print("[NS] PUSH_DATA JSON:", msg)
-
-                # Process uplink and maybe build a downlink JSON {"txpk": {...}}
-                try:
-                    downlink_json = handle_uplink_packet(msg)
-                    if downlink_json:
-                        # Prefer replying to the most recent PULL_DATA addr (if available)
-                        target_addr = last_pull_addr or (CFG["GATEWAY_IP"], CFG["UDP_PORT"])
-                        send_pull_resp(sock, downlink_json, target_addr)
-                except Exception as e:
-                    print("[NS] Uplink handler error:", e)
-
-                # Send PUSH_ACK
-                push_ack = bytearray([ver, token[0], token[1], 0x01])  # 0x01 = PUSH_ACK
-                sock.sendto(push_ack, addr)
-                print("[NS] PUSH_ACK sent")
-
-            except Exception as e:
-                print("[NS] PUSH_DATA invalid JSON:", e)
-
-        elif pkt_type == 0x02:  # PULL_DATA (gateway keepalive / TX channel)
-            # Reply PULL_ACK and remember addr for PULL_RESP
-            pull_ack = bytearray([ver, token[0], token[1], 0x04])  # 0x04 = PULL_ACK
-            sock.sendto(pull_ack, addr)
-            print("[NS] PULL_ACK sent")
-            last_pull_addr = addr
+        while len(batch) < max_batch:
+            batch.append(sock.recvfrom(bufsize, _MSG_DONTWAIT))
+    except (BlockingIOError, InterruptedError):
+        pass  # socket is empty
+    return batch
 
-        elif pkt_type == 0x05:  # TX_ACK
-            # May include optional JSON after 12 bytes
-            payload = data[12:].decode("utf-8", errors="ignore")
-            print("[NS] TX_ACK:", payload if payload else "<no body>")
 
+def triage_by_pkt_type(batch: list[tuple[bytes, tuple[str, int]]]) -> Dict[int, list]:
+    """
+    Groups datagrams by the pkt_type byte (offset 3) in one pass.
+    Datagrams shorter than the 12-byte header go under key -1.
+    """
+    groups: Dict[int, list] = {PUSH_DATA: [], PULL_DATA: [], TX_ACK: [], -1: []}
+    for data, addr in batch:
+        if len(data) < 12:
+            groups[-1].append((data, addr))
         else:
-            print(f"[NS] Unknown packet type: 0x{pkt_type:02X}")
+            groups.setdefault(data[3], []).append((data, addr))
+    return groups
 
-        return last_pull_addr
 
+def receive_uplink_batch(sock: socket.socket, last_pull_addr, max_batch: int) -> tuple[str, int] | None:
+    """
+    Drains up to `max_batch` datagrams and handles them grouped by packet type:
+      1) PULL_DATA: all PULL_ACKs are sent first (keepalives never wait)
+      2) PUSH_DATA: all PUSH_ACKs are sent, then every body goes to the uplink queue
+      3) TX_ACK / unknown / short datagrams are logged
+    Returns the most recent PULL_DATA address.
+    """
+    try:
+        batch = drain_datagrams(sock, max_batch)
     except Exception as e:
-        print("[NS] Receive error:", e)
+        log.error("[NS] Receive error: %s", e)
         return last_pull_addr
 
+    rx_clock = time.perf_counter()
+    groups = triage_by_pkt_type(batch)
+    pull_batch = groups.pop(PULL_DATA)
+    push_batch = groups.pop(PUSH_DATA)
+    tx_ack_batch = groups.pop(TX_ACK)
+    short_batch = groups.pop(-1)
+
+    try:
+        # 1) PULL_DATA (gateway keepalive / TX channel): reply PULL_ACK, route PULL_RESP to addr
+        for data, addr in pull_batch:
+            sock.sendto(build_ack(data[0], data[1:3], PULL_ACK), addr)
+            update_gateway_route(data[4:12].hex().upper(), addr)
+            last_pull_addr = addr
+        if pull_batch:
+            observe("pull_ack_latency_seconds", time.perf_counter() - rx_clock)
+
+        # 2) PUSH_DATA: ack everything, then hand the bodies (from byte 12) to the consumers
+        for data, addr in push_batch:
+            sock.sendto(build_ack(data[0], data[1:3], PUSH_ACK), addr)
+        if push_batch:
+            observe("push_ack_latency_seconds", time.perf_counter() - rx_clock)
+            fallback_addr = last_pull_addr or (CFG["GATEWAY_IP"], CFG["UDP_PORT"])
+            for data, addr in push_batch:
+                submit_push_data(data[12:], addr, data[4:12].hex().upper(), fallback_addr)
+
+        # 3) TX_ACK may include optional JSON after 12 bytes
+        for data, addr in tx_ack_batch:
+            payload = data[12:].decode("utf-8", errors="ignore")
+            log.debug("[NS] TX_ACK from %s: %s", addr, payload if payload else "<no body>")
+
+        for data, addr in short_batch:
+            log.warning("[NS] Packet too short (%d B) from %s", len(data), addr)
+
+        for pkt_type, unknown in groups.items():
+            log.warning("[NS] Unknown packet type: 0x%02X (%d datagrams)", pkt_type, len(unknown))
+
+    except Exception as e:
+        log.error("[NS] Receive error: %s", e)
+
+    elapsed = time.perf_counter() - rx_clock
+    observe("recv_batch_size", len(batch))
+    observe("recv_batch_seconds", elapsed)
+    log.debug("[NS] Batch: %d datagrams (push=%d, pull=%d, tx_ack=%d) handled in %.2f ms",
+              len(batch), len(push_batch), len(pull_batch), len(tx_ack_batch), elapsed * 1000)
 
-def send_pull_resp(sock: socket.socket, down_json: Dict[str, Any], addr: tuple[str, int]) -> None:
+    return last_pull_addr
+
+
+def send_pull_resp(sock, down_json: Dict[str, Any], addr: tuple[str, int]) -> None:
     """
     Send a Semtech PULL_RESP:
       [ver][tokenH][tokenL][0x03] + JSON
     The token is arbitrary per frame.
+    `sock` can be a socket or an asyncio DatagramTransport (both expose sendto).
     """
     try:
         # Minimal txpk hygiene (avoid None values)
@@ -117,19 +228,35 @@ def send_pull_resp(sock: socket.socket, down_json: Dict[str, Any], addr: tuple[s
         txpk.setdefault("ipol", True)
         down_json["txpk"] = txpk
 
-        payload = json.dumps(down_json, separators=(",", ":")).encode("utf-8")
+        payload = json_codec.dumps(down_json)
 
         # Random token for this PULL_RESP
         rtok = os.urandom(2)
-        frame = bytearray([0x01, rtok[0], rtok[1], 0x03])  # 0x03 = PULL_RESP
+        frame = bytearray([0x01, rtok[0], rtok[1], PULL_RESP])
         frame += payload
 
-        sock.sendto(frame, addr)
-        print(f"[NS] PULL_RESP sent → {addr}")
+        with time_stage("send"):
+            sock.sendto(frame, addr)
+        log.debug("[NS] PULL_RESP sent → %s", addr)
 
     except Exception as e:
-        print("[NS] Downlink send error:", e)
+        log.error("[NS] Downlink send error: %s", e)
 
 # ---------------- MAIN ----------------
+def serve() -> None:
+    """Starts the server in the mode selected by CFG["SERVER_MODE"] (default: blocking)."""
+    mode = CFG.get("SERVER_MODE", "blocking")
+    if mode == "blocking":
+        start_server()
+    elif mode == "asyncio":
+        from NS_shim.async_server import start_async_server
+        start_async_server()
+    elif mode == "reuseport":
+        from NS_shim.worker_pool import start_worker_pool
+        start_worker_pool()
+    else:
+        raise ValueError(f"❌ Unknown SERVER_MODE: {mode}")
+
+
 if __name__ == "__main__":
-    start_server()
+    serve()
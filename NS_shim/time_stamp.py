@@ -1,6 +1,11 @@
 import json
 import base64
 import time
+from core.metrics import inc, observe, get_histogram
+
+# Seconds left between the window decision and the chosen RX window opening
+# (missed windows are counted by the downlink scheduler when the job is due)
+get_histogram("downlink_slack_seconds", (-1.0, -0.5, -0.1, 0.0, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0))
 
 MICROSECONDS = 1_000_000
 TMST_MAX = 2**32
@@ -38,7 +43,8 @@ def decide_receive_window(NS_tmst: float, rx1_tmst: int, rx2_tmst: int, tx_time_
         NS_tmst (float): time.perf_counter() at uplink arrival
         rx1_tmst (int): Scheduled RX1 timestamp (µs)
         rx2_tmst (int): Scheduled RX2 timestamp (µs)
-        tx_time_us (int): Estimated airtime of downlink packet in µs (default: 100_000)
+        tx_time_us (int): Airtime of the downlink packet in µs (features.airtime.airtime_us);
+                          100_000 when the payload is not known yet
 
     Returns:
         int: Chosen TMST (rx1_tmst or rx2_tmst)
@@ -57,9 +63,15 @@ def decide_receive_window(NS_tmst: float, rx1_tmst: int, rx2_tmst: int, tx_time_
 
     # Ensure there's enough room to finish TX before RX2 starts
     if current_tmst + tx_time_us < rx2_tmst:
-        return rx1_tmst
+        inc("downlink_rx1_total")
+        chosen = rx1_tmst
     else:
-        return rx2_tmst
+        inc("downlink_rx2_total")
+        chosen = rx2_tmst
+
+    slack_us = chosen - current_tmst
+    observe("downlink_slack_seconds", slack_us / TMST_TICKS_PER_SEC)
+    return chosen
 
 
 
@@ -1,9 +1,48 @@
 import json
 import base64
 
+def extract_rxpk_list(push_data_json: dict) -> list:
+    """
+    Returns every rxpk entry of a Semtech PUSH_DATA JSON (empty list for stat-only reports).
+    A multi-channel gateway can bundle several received frames in one PUSH_DATA.
+    """
+    if not isinstance(push_data_json, dict):
+        raise TypeError("push_data_json must be a dict")
+    if "rxpk" in push_data_json:
+        return push_data_json.get("rxpk") or []
+    if "stat" in push_data_json:
+        return []
+    raise ValueError("Unsupported uplink JSON shape (expected 'rxpk' or {'type':'uplink','phy':...})")
+
+def rxpk_to_phy_payload(rxpk: dict) -> bytes:
+    """Decodes the base64 PHYPayload of one rxpk entry."""
+    data_b64 = rxpk.get("data")
+    if not data_b64:
+        raise ValueError("rxpk.data is missing")
+    return base64.b64decode(data_b64)
+
+def rxpk_to_metadata(rxpk: dict) -> dict:
+    """Extracts the radio metadata of one rxpk entry."""
+    return {
+        "time": rxpk.get("time"),     # UTC time of RX in ISO format
+        "tmst": rxpk.get("tmst"),
+        "chan": rxpk.get("chan"),
+        "rfch": rxpk.get("rfch"),
+        "freq": rxpk.get("freq"),
+        "stat": rxpk.get("stat"),
+        "modu": rxpk.get("modu"),
+        "datr": rxpk.get("datr"),
+        "codr": rxpk.get("codr"),
+        "rssi": rxpk.get("rssi"),
+        "lsnr": rxpk.get("lsnr"),
+        "size": rxpk.get("size"),
+        "data": rxpk.get("data")      # Base64 payload (PHYPayload)
+    }
+
 def lora_packet_extractor(push_data_json: dict) -> bytes:
     """
-    Accepts the JSON object you received over UDP and returns raw PHYPayload bytes.
+    Accepts the JSON object you received over UDP and returns raw PHYPayload bytes
+    of the first rxpk entry (use extract_rxpk_list to get all of them).
     Supports both:
       - Semtech UDP format: {"rxpk":[{"data":"<base64>"}]}
       - Your own shim:      {"type":"uplink","phy":"<base64>"}
@@ -16,40 +55,19 @@ def lora_packet_extractor(push_data_json: dict) -> bytes:
         rxpk_list = push_data_json.get("rxpk") or []
         if not rxpk_list:
             raise ValueError("No rxpk entries found")
-        data_b64 = rxpk_list[0].get("data")
-        if not data_b64:
-            raise ValueError("rxpk[0].data is missing")
-        return base64.b64decode(data_b64)
+        return rxpk_to_phy_payload(rxpk_list[0])
     
     raise ValueError("Unsupported uplink JSON shape (expected 'rxpk' or {'type':'uplink','phy':...})")
 
 def extract_metadata_from_uplink(push_data_json: dict) -> dict:
     """
-    Extracts radio metadata from Semtech UDP JSON.
+    Extracts radio metadata from Semtech UDP JSON (first rxpk entry).
     Returns dict of useful fields like tmst, freq, datr, rssi, etc.
     """
     if "rxpk" in push_data_json:
-        rxpk = push_data_json["rxpk"][0]
-        metadata = {
-        "time": rxpk.get("time"),     # UTC time of RX in ISO format
-        "tmst": rxpk.get("tmst"),
-        "chan": rxpk.get("chan"),
-        "rfch": rxpk.get("rfch"),
-        "freq": rxpk.get("freq"),
-        "stat": rxpk.get("stat"),
-        "modu": rxpk.get("modu"),
-        "datr": rxpk.get("datr"),
-        "codr": rxpk.get("codr"),
-        "rssi": rxpk.get("rssi"),
-        "lsnr": rxpk.get("lsnr"),
-        "size": rxpk.get("size"),
-        "data": rxpk.get("data")      # Base64 payload (PHYPayload)
-        }
-
-        return metadata
+        return rxpk_to_metadata(push_data_json["rxpk"][0])
     elif push_data_json.get("type") == "uplink":
         # if you extend your shim format later, adapt here
         return push_data_json.get("metadata", {})
     else:
         raise ValueError("Unsupported uplink JSON shape for metadata extraction")
-
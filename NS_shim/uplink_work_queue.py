@@ -0,0 +1,97 @@
+import queue
+import threading
+from typing import Any, Dict
+from core.metrics import inc, register_gauge, time_stage
+from core.log import get_logger
+from NS_shim.gateway_routing import resolve_downlink_addr
+from NS_shim import json_codec
+from NS_shim.downlink_scheduler import start_downlink_scheduler, schedule_downlink
+from uplink_packet_handling.uplink_packet_entry_point import handle_uplink_packet
+
+# Bounded hand-off between the receive loop and the uplink pipeline (blocking mode).
+# The receive loop acks PUSH_DATA as soon as the header is valid and only enqueues the
+# JSON body; consumer threads decode it and register its frames with handle_uplink_packet.
+# Each result (from a dedup dispatch thread, see deduplication.py) hands its downlink to
+# the downlink scheduler (downlink_scheduler.py), which sends the PULL_RESP.
+# When the queue is full the body is dropped (the gateway already got its ack) and
+# counted in "uplink_queue_dropped_total".
+
+log = get_logger(__name__)
+
+_uplink_queue: queue.Queue | None = None
+
+
+def start_uplink_consumers(sock, n_consumers: int, maxsize: int) -> None:
+    """
+    Creates the bounded work queue and starts `n_consumers` daemon consumer threads.
+
+    Args:
+        sock: bound UDP socket used to send PULL_RESP
+        n_consumers: number of consumer threads
+        maxsize: queue capacity (PUSH_DATA bodies)
+    """
+    global _uplink_queue
+    _uplink_queue = queue.Queue(maxsize=maxsize)
+    register_gauge("uplink_queue_depth", _uplink_queue.qsize)
+    register_gauge("uplink_queue_capacity", lambda: maxsize)
+
+    # Imported here: server.py imports this module
+    from NS_shim.server import send_pull_resp
+    start_downlink_scheduler(lambda down_json, addr: send_pull_resp(sock, down_json, addr))
+
+    for i in range(n_consumers):
+        threading.Thread(target=_consumer_loop, args=(_uplink_queue,),
+                         name=f"uplink-consumer-{i}", daemon=True).start()
+
+
+def submit_push_data(body: bytes, addr: tuple[str, int], gateway_mac: str, fallback_addr: tuple[str, int]) -> bool:
+    """
+    Enqueues a PUSH_DATA JSON body without blocking the receive loop.
+
+    Args:
+        body: JSON body (datagram bytes 12..)
+        addr: sender address (for logging)
+        gateway_mac: uppercase hex MAC of the gateway that sent the PUSH_DATA
+        fallback_addr: PULL_RESP target when the gateway has no live route
+
+    Returns False if the queue is full and the body was dropped.
+    """
+    try:
+        _uplink_queue.put_nowait((body, addr, gateway_mac, fallback_addr))
+        return True
+    except queue.Full:
+        inc("uplink_queue_dropped_total")
+        log.warning("[NS] Uplink queue full, PUSH_DATA from %s dropped", addr)
+        return False
+
+
+def schedule_result(result: Dict[str, Any], fallback_addr: tuple[str, int]) -> None:
+    """Hands the downlink of one uplink result (if any) to the downlink scheduler."""
+    if result["Downlink"]:
+        target_addr = resolve_downlink_addr(result["GatewayMAC"], fallback_addr)
+        schedule_downlink(result["Downlink"], target_addr, result["RxWindows"], result["GatewayMAC"],
+                          result.get("OnDrop"))
+
+
+def _consumer_loop(work_queue: queue.Queue) -> None:
+    while True:
+        body, addr, gateway_mac, fallback_addr = work_queue.get()
+        try:
+            with time_stage("json_decode"):
+                msg: Dict[str, Any] | None = json_codec.decode_push_data(body)
+            if msg is None or "rxpk" not in msg:
+                continue  # stat-only report, nothing to process
+            log.debug("[NS] PUSH_DATA JSON: %s", msg)
+
+            # Process every bundled uplink; each may produce a downlink JSON {"txpk": {...}}.
+            # Results arrive from the dedup dispatch threads once their windows close.
+            handle_uplink_packet(msg, gateway_mac,
+                                 lambda result, fallback_addr=fallback_addr: schedule_result(result, fallback_addr))
+        except json_codec.JSONDecodeError as e:
+            inc("uplink_invalid_json_total")
+            log.warning("[NS] PUSH_DATA invalid JSON: %s", e)
+        except Exception as e:
+            inc("uplink_handler_errors_total")
+            log.error("[NS] Uplink handler error (%s): %s", addr, e)
+        finally:
+            work_queue.task_done()
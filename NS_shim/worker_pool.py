@@ -0,0 +1,162 @@
+import os
+import time
+import ctypes
+import signal
+import socket
+import struct
+import multiprocessing
+from core.log import get_logger, configure_logging_from_config
+from NS_shim.server import CFG
+
+# Multi-process server mode (CFG["SERVER_MODE"] = "reuseport")
+# The supervisor binds N UDP sockets on the same port with SO_REUSEPORT and forks one
+# worker per socket. Every worker runs the asyncio server on its own socket, so it keeps
+# its own gateway state (last_pull_addr / downlink routing) and device-session cache.
+#
+# Sharding by gateway:
+#   A classic BPF program is attached to the reuseport group. It reads 4 bytes of the
+#   gateway MAC (datagram bytes 8..11) and returns MAC % N as the socket index, so every
+#   datagram of a gateway lands on the same worker regardless of its source port.
+#   If the kernel refuses the program (non-Linux / old kernel) the default 4-tuple hash
+#   still keeps one gateway (fixed ip:port) on one socket.
+#   The supervisor keeps every socket open for the whole run, so a crashed worker is
+#   restarted on the *same* socket: the group never changes and the shard map stays put.
+#
+# Per-process state:
+#   Sharding is by gateway, not by device (one PUSH_DATA carries frames of many devices),
+#   but deduplication, the session store (FCntUp/FCntDown, ADR, MAC state), the write-behind
+#   flusher and the downlink queues live in each worker. So in this mode:
+#     - the device registry must be one shared backend: REGISTRY_BACKEND = "sqlite" (a YAML
+#       registry is rewritten by every worker without coordination). The supervisor logs
+#       a warning at startup otherwise.
+#     - a frame heard by gateways that map to different workers is NOT deduplicated: every
+#       such worker processes it, counts FCntUp and may answer it.
+#     - each worker caches the records it has loaded and counts FCntDown in memory, so a
+#       device must only be heard through gateways of one worker for its counters to stay
+#       consistent.
+#   Use SERVER_MODE "blocking" or "asyncio" when gateways overlap in coverage.
+#
+# CFG keys (all optional):
+#   WORKER_PROCESSES  0         worker processes (0 = one per CPU)
+#   REGISTRY_BACKEND  "sqlite"  required for this mode, see above
+
+log = get_logger(__name__)
+
+SO_ATTACH_REUSEPORT_CBPF = 51  # linux/asm-generic/socket.h (not exported by the socket module)
+
+# Classic BPF opcodes
+BPF_LD_W_ABS = 0x20   # BPF_LD | BPF_W | BPF_ABS  -> A = ntohl(pkt[k:k+4])
+BPF_ALU_MOD_K = 0x94  # BPF_ALU | BPF_MOD | BPF_K -> A = A % k
+BPF_RET_A = 0x16      # BPF_RET | BPF_A           -> return A
+
+GATEWAY_MAC_SHARD_OFFSET = 8  # last 4 bytes of the 8-byte gateway MAC at data[4:12]
+
+RESTART_BACKOFF_S = 1.0
+
+
+class _SockFilter(ctypes.Structure):
+    _fields_ = [("code", ctypes.c_uint16), ("jt", ctypes.c_uint8),
+                ("jf", ctypes.c_uint8), ("k", ctypes.c_uint32)]
+
+
+class _SockFprog(ctypes.Structure):
+    _fields_ = [("len", ctypes.c_uint16), ("filter", ctypes.POINTER(_SockFilter))]
+
+
+def gateway_shard(data: bytes, n_workers: int) -> int:
+    """Python mirror of the BPF program: worker index that owns this gateway's datagrams."""
+    if len(data) < GATEWAY_MAC_SHARD_OFFSET + 4:
+        return 0
+    return struct.unpack_from("!I", data, GATEWAY_MAC_SHARD_OFFSET)[0] % n_workers
+
+
+def attach_gateway_shard_filter(sock: socket.socket, n_workers: int) -> bool:
+    """
+    Attaches the gateway-MAC sharding program to the reuseport group of `sock`.
+    Returns False if the kernel does not support it (kernel hashing is used instead).
+    """
+    program = (_SockFilter * 3)(
+        _SockFilter(BPF_LD_W_ABS, 0, 0, GATEWAY_MAC_SHARD_OFFSET),
+        _SockFilter(BPF_ALU_MOD_K, 0, 0, n_workers),
+        _SockFilter(BPF_RET_A, 0, 0, 0),
+    )
+    fprog = _SockFprog(len(program), program)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_REUSEPORT_CBPF, bytes(fprog))
+        return True
+    except OSError as e:
+        log.warning("[NS] Gateway sharding filter not available (%s); using kernel 4-tuple hash", e)
+        return False
+
+
+def create_reuseport_sockets(n_workers: int) -> list[socket.socket]:
+    """Binds n_workers UDP sockets on CFG["SERVER_IP"]:CFG["UDP_PORT"] in one reuseport group."""
+    if not hasattr(socket, "SO_REUSEPORT"):
+        raise OSError("❌ SO_REUSEPORT is not supported on this platform")
+
+    socks = []
+    for _ in range(n_workers):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind((CFG["SERVER_IP"], CFG["UDP_PORT"]))
+        socks.append(sock)
+
+    # Socket index in the group == bind order == worker index
+    attach_gateway_shard_filter(socks[0], n_workers)
+    return socks
+
+
+def _worker_main(index: int, sock: socket.socket) -> None:
+    """Worker process: runs the asyncio server on its inherited socket."""
+    from NS_shim.async_server import start_async_server
+
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    configure_logging_from_config(CFG)  # the supervisor's log listener thread is not forked
+    if CFG.get("METRICS_PORT"):
+        CFG["METRICS_PORT"] += index  # one /metrics endpoint per worker process
+    log.info("[NS] Worker %d started (pid=%d)", index, os.getpid())
+    start_async_server(sock)
+
+
+def _spawn_worker(ctx, index: int, sock: socket.socket):
+    proc = ctx.Process(target=_worker_main, args=(index, sock), name=f"ns-worker-{index}", daemon=True)
+    proc.start()
+    return proc
+
+
+def start_worker_pool(n_workers: int | None = None) -> None:
+    """
+    Supervisor entry point: binds the reuseport sockets, forks one worker per socket
+    and restarts any worker that exits until interrupted.
+    """
+    configure_logging_from_config(CFG)
+    n_workers = n_workers or CFG.get("WORKER_PROCESSES") or os.cpu_count() or 1
+    if CFG.get("REGISTRY_BACKEND", "yaml") != "sqlite":
+        log.warning("[NS] SERVER_MODE reuseport with REGISTRY_BACKEND %r: workers do not share "
+                    "device sessions, use the sqlite backend", CFG.get("REGISTRY_BACKEND", "yaml"))
+    socks = create_reuseport_sockets(n_workers)
+    # fork keeps the bound socket objects (and their group index) in the children
+    ctx = multiprocessing.get_context("fork")
+
+    log.info("[NS] Supervisor listening on %s:%s with %d worker processes",
+             CFG["SERVER_IP"], CFG["UDP_PORT"], n_workers)
+
+    procs = [_spawn_worker(ctx, i, socks[i]) for i in range(n_workers)]
+
+    try:
+        while True:
+            time.sleep(RESTART_BACKOFF_S)
+            for i, proc in enumerate(procs):
+                if not proc.is_alive():
+                    log.warning("[NS] Worker %d exited (code=%s), restarting", i, proc.exitcode)
+                    procs[i] = _spawn_worker(ctx, i, socks[i])
+    except KeyboardInterrupt:
+        log.info("[NS] Supervisor stopping workers")
+    finally:
+        for proc in procs:
+            if proc.is_alive():
+                proc.terminate()
+        for proc in procs:
+            proc.join(timeout=5)
+        for sock in socks:
+            sock.close()
@@ -0,0 +1,53 @@
+# Uplink frame decoder throughput: construct parsers vs. protocol_layers/fast_decoder.py,
+# on the sample frames of main.py (OTAA Join Request, data uplink) plus a data uplink
+# with FOpts and a full-size payload.
+#
+#   python -m benchmarks.bench_frame_decoder [n_iterations]
+import io
+import sys
+import timeit
+import contextlib
+from uplink_packet_handling.protocol_layers.mac_layer import parse_mac_layer
+from uplink_packet_handling.protocol_layers.application_layer import parse_app_layer
+from uplink_packet_handling.join_request_parser import parse_join_request
+from uplink_packet_handling.protocol_layers.fast_decoder import (
+    fast_decode_mac_layer, fast_decode_app_layer, fast_decode_join_request)
+
+SAMPLE_FRAMES = {
+    "join_request": bytes.fromhex("00887766554433221108070605040302011234F20B8567"),
+    "data_up": bytes.fromhex("400403020100010148656C6C6FAABBCCDD"),
+    "data_up_fopts": bytes.fromhex("80E7440324830A00020305010A48656C6C6F11223344"),
+    "data_up_242B": bytes.fromhex("40E74403248005000A") + bytes(range(242)) + bytes.fromhex("01020304"),
+}
+
+
+def construct_decode(phy: bytes) -> dict:
+    mac = parse_mac_layer(phy)
+    if mac["MHDR"]["MType"] == 0:
+        return parse_join_request(phy)
+    return parse_app_layer(mac["MACPayload"])
+
+
+def fast_decode(phy: bytes) -> dict:
+    mac = fast_decode_mac_layer(phy)
+    if mac["MHDR"]["MType"] == 0:
+        return fast_decode_join_request(phy)
+    return fast_decode_app_layer(mac["MACPayload"])
+
+
+def run(n: int = 20000) -> None:
+    print(f"{'frame':>14} {'construct µs':>13} {'fast µs':>9} {'speedup':>8} {'fast frames/s':>14}")
+    # parse_mac_layer prints debug lines; keep them out of the timing output
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = []
+        for name, phy in SAMPLE_FRAMES.items():
+            assert construct_decode(phy) == fast_decode(phy), name
+            slow = timeit.timeit(lambda: construct_decode(phy), number=n)
+            fast = timeit.timeit(lambda: fast_decode(phy), number=n)
+            results.append((name, slow, fast))
+    for name, slow, fast in results:
+        print(f"{name:>14} {slow / n * 1e6:>13.2f} {fast / n * 1e6:>9.2f} {slow / fast:>7.1f}x {n / fast:>14,.0f}")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,66 @@
+# FRMPayload AES-CTR benchmark: previous per-block implementation vs. the single ECB call
+# version in features/security.py (single frame and batch of frames sharing a key).
+#
+#   python -m benchmarks.bench_frm_payload [n_iterations]
+import os
+import sys
+import timeit
+import numpy as np
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from features.security import decrypt_frm_payload, crypt_frm_payload_batch
+
+
+def decrypt_frm_payload_per_block(app_skey, nwkskey, dev_addr, fcnt, direction, frm_payload, Fport):
+    """Reference: the previous loop (one A block, one ECB call and two NumPy arrays per 16 bytes)."""
+    key = nwkskey if Fport == 0 else app_skey
+    devaddr_bytes = dev_addr.to_bytes(4, 'little') if isinstance(dev_addr, int) else dev_addr
+    encryptor = Cipher(algorithms.AES(key), modes.ECB()).encryptor()
+
+    payload_len = len(frm_payload)
+    num_blocks = (payload_len + 15) // 16
+    decrypted = bytearray()
+    for i in range(num_blocks):
+        a_block = bytearray(16)
+        a_block[0] = 0x01
+        a_block[5] = direction & 0x01
+        a_block[6:10] = devaddr_bytes
+        a_block[10:14] = fcnt.to_bytes(2, 'little') + b'\x00\x00'
+        a_block[15] = (i + 1) & 0xFF
+        s_block = encryptor.update(bytes(a_block))
+        start = i * 16
+        end = min(start + 16, payload_len)
+        frm_chunk = frm_payload[start:end]
+        frm_arr = np.frombuffer(frm_chunk, dtype=np.uint8)
+        s_arr = np.frombuffer(s_block, dtype=np.uint8)[:len(frm_chunk)]
+        decrypted.extend(np.bitwise_xor(frm_arr, s_arr).tobytes())
+    return bytes(decrypted)
+
+
+def run(n: int = 20000) -> None:
+    app_skey, nwk_skey = os.urandom(16), os.urandom(16)
+    dev_addr, fcnt = 0x26011BDA, 4242
+
+    print(f"{'size':>6} {'per-block µs':>14} {'single-call µs':>15} {'speedup':>8}")
+    for size in (11, 51, 115, 242):
+        payload = os.urandom(size)
+        assert decrypt_frm_payload(app_skey, nwk_skey, dev_addr, fcnt, 0, payload, 1) == \
+            decrypt_frm_payload_per_block(app_skey, nwk_skey, dev_addr, fcnt, 0, payload, 1)
+        old = timeit.timeit(lambda: decrypt_frm_payload_per_block(app_skey, nwk_skey, dev_addr, fcnt, 0, payload, 1), number=n)
+        new = timeit.timeit(lambda: decrypt_frm_payload(app_skey, nwk_skey, dev_addr, fcnt, 0, payload, 1), number=n)
+        print(f"{size:>6} {old / n * 1e6:>14.2f} {new / n * 1e6:>15.2f} {old / new:>7.1f}x")
+
+    # Batch: many frames under one key (e.g. one device's backlog, or a multicast group)
+    batch_n = max(1, n // 100)
+    print(f"\n{'frames':>6} {'loop µs/frame':>14} {'batch µs/frame':>15} {'speedup':>8}")
+    for n_frames in (16, 128, 1024):
+        frames = [(dev_addr, fcnt + i, os.urandom(51)) for i in range(n_frames)]
+        expected = [decrypt_frm_payload_per_block(app_skey, nwk_skey, a, c, 0, p, 1) for a, c, p in frames]
+        assert crypt_frm_payload_batch(app_skey, frames, 0) == expected
+        old = timeit.timeit(lambda: [decrypt_frm_payload_per_block(app_skey, nwk_skey, a, c, 0, p, 1) for a, c, p in frames], number=batch_n)
+        new = timeit.timeit(lambda: crypt_frm_payload_batch(app_skey, frames, 0), number=batch_n)
+        per = batch_n * n_frames
+        print(f"{n_frames:>6} {old / per * 1e6:>14.2f} {new / per * 1e6:>15.2f} {old / new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
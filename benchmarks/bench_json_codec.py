@@ -0,0 +1,75 @@
+# PUSH_DATA / PULL_RESP JSON benchmark: the previous stdlib path
+# (json.loads(body.decode("utf-8")) / json.dumps(...).encode()) vs. NS_shim/json_codec.py
+# with every installed library, on packet-forwarder style bodies.
+#
+#   python -m benchmarks.bench_json_codec [n_iterations]
+import sys
+import json
+import base64
+import timeit
+from NS_shim import json_codec
+
+
+def rxpk(i: int, size: int = 23) -> dict:
+    return {
+        "time": "2025-08-14T10:20:30.123456Z", "tmst": 123456789 + i, "chan": i % 8, "rfch": 0,
+        "freq": 868.1 + 0.2 * (i % 3), "stat": 1, "modu": "LORA", "datr": "SF7BW125", "codr": "4/5",
+        "lsnr": 7.5, "rssi": -45 - i, "size": size, "data": base64.b64encode(bytes(range(size))).decode(),
+    }
+
+
+STAT = {"stat": {"time": "2025-08-14 10:20:30 GMT", "lati": 46.24, "long": 3.25, "alti": 145,
+                 "rxnb": 2, "rxok": 2, "rxfw": 2, "ackr": 100.0, "dwnb": 2, "txnb": 2}}
+
+BODIES = {
+    "stat-only": json.dumps(STAT).encode(),
+    "1 rxpk": json.dumps({"rxpk": [rxpk(0)]}).encode(),
+    "8 rxpk": json.dumps({"rxpk": [rxpk(i, 51) for i in range(8)]}).encode(),
+    "8 rxpk 242B": json.dumps({"rxpk": [rxpk(i, 242) for i in range(8)]}).encode(),
+}
+
+TXPK = {"txpk": {"imme": False, "tmst": 124456789, "freq": 868.3, "rfch": 0, "powe": 14, "modu": "LORA",
+                 "datr": "SF7BW125", "codr": "4/5", "ipol": True, "size": 33,
+                 "data": "IGG7E15i6HHXA9P4ATE8L+4ruyR+oSAs1mH2n9T7XOLM"}}
+
+
+def previous_decode(body: bytes):
+    msg = json.loads(body.decode("utf-8"))
+    return msg if "rxpk" in msg else None
+
+
+def previous_encode(obj) -> bytes:
+    return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+
+def run(n: int = 50000) -> None:
+    codecs = []
+    for name in ("stdlib", "ujson", "orjson"):
+        try:
+            json_codec.configure_json_codec(name)
+            codecs.append(name)
+        except ImportError:
+            print(f"({name} not installed)")
+
+    print(f"{'body':>12} {'bytes':>6} {'previous µs':>12} " + " ".join(f"{c + ' µs':>10}" for c in codecs))
+    for label, body in BODIES.items():
+        old = timeit.timeit(lambda: previous_decode(body), number=n) / n * 1e6
+        row = []
+        for name in codecs:
+            json_codec.configure_json_codec(name)
+            assert json_codec.decode_push_data(body) == previous_decode(body)
+            row.append(timeit.timeit(lambda: json_codec.decode_push_data(memoryview(body)), number=n) / n * 1e6)
+        print(f"{label:>12} {len(body):>6} {old:>12.2f} " + " ".join(f"{t:>10.2f}" for t in row))
+
+    old = timeit.timeit(lambda: previous_encode(TXPK), number=n) / n * 1e6
+    row = []
+    for name in codecs:
+        json_codec.configure_json_codec(name)
+        assert json.loads(json_codec.dumps(TXPK)) == TXPK
+        row.append(timeit.timeit(lambda: json_codec.dumps(TXPK), number=n) / n * 1e6)
+    print(f"{'txpk encode':>12} {len(previous_encode(TXPK)):>6} {old:>12.2f} " + " ".join(f"{t:>10.2f}" for t in row))
+    json_codec.configure_json_codec("auto")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
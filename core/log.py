@@ -0,0 +1,175 @@
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+import logging.handlers
+from typing import Dict
+
+# Logging for the server and the uplink pipeline.
+# Every module logs through get_logger(__name__) (children of the "ns" logger), with
+# %-style arguments, so a disabled level costs one isEnabledFor() check and no formatting.
+# Enabled records are put on a bounded queue as-is; a QueueListener thread formats them
+# and does the console / file I/O. A full queue drops the record (log_records_dropped_total)
+# instead of blocking the packet path.
+# RateLimitFilter bounds how often one call site (file:line) may emit per second; the
+# number of suppressed records is appended to the next one that passes.
+# A forked child (reuseport workers) has no listener thread: it forgets the parent's
+# listener and must call configure_logging() again before it logs.
+#
+# CFG keys (all optional):
+#   LOG_LEVEL            "INFO"                   level of the "ns" logger
+#   LOG_LEVELS           {}                       per-module levels, e.g. {"NS_shim.server": "DEBUG"}
+#   LOG_CONSOLE          true                     human-readable lines on stdout
+#   LOG_FILE             "logs/gateway.log"       "" disables the file
+#   LOG_FILE_FORMAT      "jsonl"                  "jsonl" (one JSON object per line) or "text"
+#   LOG_RATE_LIMIT_PER_S 20                       records per second per call site (0 = unlimited)
+#   LOG_RATE_BURST       50                       bucket size of the rate limit
+#   LOG_QUEUE_SIZE       10000                    records waiting for the listener
+
+ROOT_LOGGER = "ns"
+TEXT_FORMAT = "%(asctime)s %(levelname)-7s %(name)s: %(message)s"
+
+_listener: logging.handlers.QueueListener | None = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Per-module logger (pass __name__)."""
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """One JSON object per record: ts, level, logger, msg (+ exc)."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """Token bucket per call site (pathname:lineno)."""
+
+    def __init__(self, rate_per_s: float, burst: int):
+        super().__init__()
+        self.rate = float(rate_per_s)
+        self.burst = float(max(1, burst))
+        self._buckets: Dict[tuple, list] = {}  # site -> [tokens, last_refill, suppressed]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate <= 0:
+            return True
+        site = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(site)
+            if bucket is None:
+                bucket = self._buckets[site] = [self.burst, now, 0]
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] < 1.0:
+                bucket[2] += 1
+                return False
+            bucket[0] -= 1.0
+            suppressed, bucket[2] = bucket[2], 0
+        if suppressed:
+            record.msg = f"{record.msg} (+{suppressed} suppressed)"
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Enqueues records unformatted; drops them when the queue is full."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record  # formatting happens on the listener thread
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            from core.metrics import inc
+            inc("log_records_dropped_total")
+
+
+def configure_logging(level: str = "INFO", module_levels: Dict[str, str] | None = None,
+                      console: bool = True, log_file: str = "logs/gateway.log",
+                      file_format: str = "jsonl", rate_limit_per_s: float = 20,
+                      rate_burst: int = 50, queue_size: int = 10000) -> None:
+    """(Re)configures the "ns" logger tree and starts the background listener."""
+    global _listener
+    stop_logging()
+
+    handlers = []
+    if console:
+        stream = logging.StreamHandler(sys.stdout)
+        stream.setFormatter(logging.Formatter(TEXT_FORMAT))
+        handlers.append(stream)
+    if log_file:
+        os.makedirs(os.path.dirname(log_file) or ".", exist_ok=True)
+        file_handler = logging.FileHandler(log_file, encoding="utf-8")
+        if file_format == "jsonl":
+            file_handler.setFormatter(JsonLinesFormatter())
+        elif file_format == "text":
+            file_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+        else:
+            raise ValueError(f"❌ Unknown log file format: {file_format}")
+        handlers.append(file_handler)
+
+    log_queue: queue.Queue = queue.Queue(maxsize=max(1, int(queue_size)))
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(RateLimitFilter(rate_limit_per_s, rate_burst))
+
+    root = logging.getLogger(ROOT_LOGGER)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level.upper())
+    root.propagate = False
+    for name, module_level in (module_levels or {}).items():
+        get_logger(name).setLevel(module_level.upper())
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def stop_logging() -> None:
+    """Flushes the queue and stops the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+def configure_logging_from_config(cfg: dict) -> None:
+    configure_logging(
+        level=cfg.get("LOG_LEVEL", "INFO"),
+        module_levels=cfg.get("LOG_LEVELS", {}),
+        console=cfg.get("LOG_CONSOLE", True),
+        log_file=cfg.get("LOG_FILE", "logs/gateway.log"),
+        file_format=cfg.get("LOG_FILE_FORMAT", "jsonl"),
+        rate_limit_per_s=cfg.get("LOG_RATE_LIMIT_PER_S", 20),
+        rate_burst=cfg.get("LOG_RATE_BURST", 50),
+        queue_size=cfg.get("LOG_QUEUE_SIZE", 10000),
+    )
+
+
+def _forget_listener() -> None:
+    global _listener
+    _listener = None  # its thread only exists in the parent process
+
+
+atexit.register(stop_logging)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_listener)
@@ -0,0 +1,214 @@
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator
+
+# In-process metrics registry shared by the server and the uplink pipeline.
+#   - counters:   monotonically increasing totals (drops, errors, ...)
+#   - gauges:     callables sampled when a snapshot is taken (queue depth, ...)
+#   - histograms: fixed-bucket latency distributions in seconds
+# A metric name may carry Prometheus labels: labeled("uplink_stage_seconds", stage="mic")
+# gives 'uplink_stage_seconds{stage="mic"}', stored as its own series.
+# render_prometheus() formats a snapshot in the Prometheus text format (0.0.4) and
+# start_metrics_server() serves it on http://<host>:<port>/metrics (CFG["METRICS_PORT"]).
+
+# Upper bounds (seconds) of the latency buckets; the last bucket is +Inf
+LATENCY_BUCKETS_S = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                     0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+class Histogram:
+    """Fixed-bucket histogram; observe() is one bisect and three additions under a lock."""
+    __slots__ = ("bounds", "counts", "sum", "count", "_lock")
+
+    def __init__(self, bounds: tuple = LATENCY_BUCKETS_S):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        i = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"buckets": list(zip(self.bounds + (float("inf"),), self.counts)),
+                    "sum": self.sum, "count": self.count}
+
+
+_lock = threading.Lock()
+_counters: Dict[str, float] = {}
+_gauges: Dict[str, Callable[[], float]] = {}
+_histograms: Dict[str, Histogram] = {}
+
+
+def inc(name: str, value: float = 1) -> None:
+    """Adds `value` to the counter `name` (created on first use)."""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def register_gauge(name: str, fn: Callable[[], float]) -> None:
+    """Registers a callable sampled on every snapshot (e.g. queue.qsize)."""
+    _gauges[name] = fn
+
+
+def get_histogram(name: str, bounds: tuple = LATENCY_BUCKETS_S) -> Histogram:
+    """Returns the histogram `name`, creating it on first use."""
+    hist = _histograms.get(name)
+    if hist is None:
+        with _lock:
+            hist = _histograms.setdefault(name, Histogram(bounds))
+    return hist
+
+
+def observe(name: str, value: float) -> None:
+    """Records one sample into the histogram `name`."""
+    get_histogram(name).observe(value)
+
+
+def get_metrics_snapshot() -> Dict[str, Any]:
+    """Returns a point-in-time copy of every counter, gauge and histogram."""
+    with _lock:
+        counters = dict(_counters)
+    gauges = {}
+    for name, fn in list(_gauges.items()):
+        try:
+            gauges[name] = fn()
+        except Exception:
+            gauges[name] = None
+    return {
+        "counters": counters,
+        "gauges": gauges,
+        "histograms": {name: h.snapshot() for name, h in list(_histograms.items())},
+    }
+
+
+def labeled(name: str, **labels: str) -> str:
+    """Series name with Prometheus labels, e.g. uplink_stage_seconds{stage="mic"}."""
+    if not labels:
+        return name
+    return name + "{" + ",".join(f'{k}="{v}"' for k, v in labels.items()) + "}"
+
+
+# ---------------- uplink stage timing ----------------
+STAGE_HISTOGRAM = "uplink_stage_seconds"
+_stage_names: Dict[str, str] = {}
+
+
+def stage_metric(stage: str) -> str:
+    """Histogram series of one uplink pipeline stage."""
+    name = _stage_names.get(stage)
+    if name is None:
+        name = _stage_names.setdefault(stage, labeled(STAGE_HISTOGRAM, stage=stage))
+    return name
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    get_histogram(stage_metric(stage)).observe(seconds)
+
+
+@contextmanager
+def time_stage(stage: str) -> Iterator[None]:
+    """Times the enclosed block into uplink_stage_seconds{stage=...} (also when it raises)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        get_histogram(stage_metric(stage)).observe(time.perf_counter() - start)
+
+
+# ---------------- Prometheus exposition ----------------
+def _split_series(name: str) -> tuple[str, str]:
+    """'base{a="b"}' -> ('base', 'a="b"'); 'base' -> ('base', '')."""
+    if name.endswith("}") and "{" in name:
+        base, labels = name[:-1].split("{", 1)
+        return base, labels
+    return name, ""
+
+
+def _series(base: str, labels: str, value: float) -> str:
+    return f"{base}{{{labels}}} {value}" if labels else f"{base} {value}"
+
+
+def _fmt(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus(snapshot: Dict[str, Any] | None = None) -> str:
+    """Formats a metrics snapshot in the Prometheus text exposition format."""
+    snapshot = snapshot or get_metrics_snapshot()
+    lines = []
+    typed = set()
+
+    def type_line(base: str, kind: str) -> None:
+        if base not in typed:
+            typed.add(base)
+            lines.append(f"# TYPE {base} {kind}")
+
+    for kind, key in (("counter", "counters"), ("gauge", "gauges")):
+        for name in sorted(snapshot[key]):
+            value = snapshot[key][name]
+            if value is None:
+                continue
+            base, labels = _split_series(name)
+            type_line(base, kind)
+            lines.append(_series(base, labels, _fmt(value)))
+
+    for name in sorted(snapshot["histograms"]):
+        hist = snapshot["histograms"][name]
+        base, labels = _split_series(name)
+        type_line(base, "histogram")
+        prefix = labels + "," if labels else ""
+        cumulative = 0
+        for bound, count in hist["buckets"]:
+            cumulative += count
+            lines.append(f'{base}_bucket{{{prefix}le="{_fmt(bound)}"}} {cumulative}')
+        lines.append(_series(base + "_sum", labels, _fmt(hist["sum"])))
+        lines.append(_series(base + "_count", labels, hist["count"]))
+
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        pass  # scrapes are not worth a log line
+
+
+_metrics_server: ThreadingHTTPServer | None = None
+
+
+def start_metrics_server(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer | None:
+    """
+    Serves /metrics on host:port from a daemon thread (port 0 = disabled).
+    Returns the server; a second call returns the one already running.
+    """
+    global _metrics_server
+    if not port:
+        return None
+    if _metrics_server is None:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        _metrics_server = server
+    return _metrics_server
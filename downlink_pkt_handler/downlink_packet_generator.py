@@ -1,7 +1,6 @@
 import struct
 from construct import BitStruct, BitsInteger
-from features.security import generate_mic, encrypt_frm_payload
-from uplink_packet_handling.processing.device_registry import get_and_increment_fcnt_downlink, get_device_session_keys
+from uplink_packet_handling.processing.device_registry import get_and_increment_fcnt_downlink, get_device_crypto_context
 #Just to be able to add teh commit meassage for the downilink packet generation part 
 #the fctrl_dict is a dictionary with the keys ADR, RFU, ACK, FPending
 def fhdr_builder(dev_addr, fctrl_dict, fcnt, fopts_bytes):
@@ -63,11 +62,10 @@ def mhdr_builder(mtype, rfu=0, major=0):
     return MHDR.build({"MType": mtype, "RFU": rfu, "Major": major})
 
 #It should be in the appropriate format (list of bytes)
-def downlink_pkt_build(mtype, mac_cmd_downlink, dev_eui, dev_addr, application_data: bytes = b"", application_fport: int = 1):
-    # Retrieve session keys 
-    nwk_skey_hex, app_skey_hex = get_device_session_keys(dev_eui)
-    nwk_skey = bytes.fromhex(nwk_skey_hex)
-    app_skey = bytes.fromhex(app_skey_hex)
+def downlink_pkt_build(mtype, mac_cmd_downlink, dev_eui, dev_addr, application_data: bytes = b"", application_fport: int = 1,
+                       fctrl_dict: dict | None = None):
+    # Session crypto context (keys already parsed, CMAC/AES prepared)
+    crypto_ctx = get_device_crypto_context(dev_eui)
 
     # Get and increment the downlink frame counter
     fcnt_down = get_and_increment_fcnt_downlink(dev_eui)
@@ -88,8 +86,8 @@ def downlink_pkt_build(mtype, mac_cmd_downlink, dev_eui, dev_addr, application_d
         mac_cmds_in_frm = mac_bytes
         chosen_fport = 0  # FRMPayload will carry MAC commands (encrypted with NwkSKey)
 
-    # TODO:Build the FCtrl dictionary (ACK/ADR/FPending) from MAC command logic
-    fctrl_dict = create_fctrl_dict_based_on_mac_cmds(mac_cmd_downlink)
+    # FCtrl (ADR / ACK / FPending) is decided by the caller (see downlink_queue.py)
+    fctrl_dict = dict(fctrl_dict or {})
     fctrl_dict.setdefault("RFU", 0)
 
     # Normalize DevAddr once and reuse
@@ -102,12 +100,12 @@ def downlink_pkt_build(mtype, mac_cmd_downlink, dev_eui, dev_addr, application_d
 
     # Build MACPayload
     if mac_cmds_in_frm:  # case: MAC commands >15B, no app data
-        enc_frm = encrypt_frm_payload(app_skey, nwk_skey, dev_addr_int, fcnt_down, 1, mac_cmds_in_frm, Fport=0)
+        enc_frm = crypto_ctx.crypt_frm_payload(fcnt_down, 1, mac_cmds_in_frm, fport=0)
         mac_payload = mac_payload_builder(dev_addr_int, fctrl_dict, fcnt_down, fopts_bytes, fport=0, frmpayload=enc_frm)
     elif has_app_data:  # case: application data present
         if application_fport == 0:
             raise ValueError("application_fport=0 is reserved for MAC commands.")
-        enc_app = encrypt_frm_payload(app_skey, nwk_skey, dev_addr_int, fcnt_down, 1, application_data, Fport=application_fport)
+        enc_app = crypto_ctx.crypt_frm_payload(fcnt_down, 1, application_data, fport=application_fport)
         mac_payload = mac_payload_builder(dev_addr_int, fctrl_dict, fcnt_down, fopts_bytes, fport=application_fport, frmpayload=enc_app)
     else:  # case: only FOpts or empty downlink
         mac_payload = mac_payload_builder(dev_addr_int, fctrl_dict, fcnt_down, fopts_bytes, fport=None, frmpayload=b"")
@@ -116,7 +114,7 @@ def downlink_pkt_build(mtype, mac_cmd_downlink, dev_eui, dev_addr, application_d
     mhdr = mhdr_builder(mtype, rfu=0, major=0)
 
     # Calculate MIC over B0 | MHDR | MACPayload (direction=1 for downlink)
-    mic = generate_mic(nwk_skey, dev_addr_int, fcnt_down, 1, mhdr, mac_payload)
+    mic = crypto_ctx.mic(fcnt_down, 1, mhdr + mac_payload)
 
     # Final PHYPayload = MHDR | MACPayload | MIC
     return mhdr + mac_payload + mic
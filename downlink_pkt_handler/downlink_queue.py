@@ -0,0 +1,192 @@
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, List
+from core.log import get_logger
+from core.metrics import inc
+from features.airtime import parse_datr
+from downlink_pkt_handler.downlink_packet_generator import downlink_pkt_build
+
+# Per-device Class A downlink queue.
+# Between uplinks a device's pending MAC commands and application payloads wait here;
+# when an uplink opens RX1/RX2, build_next_downlink() packs as much as fits into one frame:
+#   - MAC commands (CID + payload) go into FOpts, whole commands only, up to 15 bytes
+#   - the oldest application payload goes into FRMPayload if it fits the window's size limit
+#   - with no application payload to send, MAC commands that do not fit FOpts travel in
+#     FRMPayload on FPort 0 instead
+#   - FPending is set when anything is left, ACK when the uplink was confirmed
+# What a frame carries leaves the queue when the frame is built; build_next_downlink() also
+# returns a requeue() callback that the downlink scheduler calls if it drops the frame
+# (window missed, duty cycle exhausted, send error), so nothing is lost. requeue() puts
+# the items back at the head of the queue, except MAC commands replaced meanwhile and
+# anything queued for a session that a new join has cleared.
+# A queued MAC command is replaced by a newer one with the same CID (only the latest
+# LinkADRReq / answer is worth sending). Confirmed application payloads are sent as
+# ConfirmedDataDown; they are not retransmitted.
+#
+# CFG keys (all optional):
+#   DOWNLINK_QUEUE_MAX   16   application payloads kept per device (oldest dropped first)
+
+UNCONFIRMED_DATA_DOWN = 3
+CONFIRMED_DATA_DOWN = 5
+MAX_FOPTS = 15
+
+# EU868 maximum FRMPayload size N (no FOpts) per (SF, BW) - LoRaWAN Regional Parameters
+_MAX_FRM_PAYLOAD = {(12, 125): 51, (11, 125): 51, (10, 125): 51, (9, 125): 115,
+                    (8, 125): 222, (7, 125): 222, (7, 250): 222}
+
+QUEUE_MAX = 16
+
+log = get_logger(__name__)
+
+_queues: Dict[str, "DeviceDownlinkQueue"] = {}
+_lock = threading.Lock()
+
+
+class DeviceDownlinkQueue:
+    __slots__ = ("mac_commands", "app_payloads", "lock")
+
+    def __init__(self):
+        self.mac_commands: Dict[int, bytes] = {}   # CID -> CID byte + payload, in queue order
+        self.app_payloads: deque = deque()          # (fport, payload, confirmed)
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.mac_commands) + len(self.app_payloads)
+
+
+def configure_downlink_queue(queue_max: int = 16) -> None:
+    global QUEUE_MAX
+    QUEUE_MAX = max(1, int(queue_max))
+
+
+def _queue(dev_eui: str) -> DeviceDownlinkQueue:
+    queue = _queues.get(dev_eui)
+    if queue is None:
+        with _lock:
+            queue = _queues.setdefault(dev_eui, DeviceDownlinkQueue())
+    return queue
+
+
+def max_frm_payload(datr: str) -> int:
+    """Largest FRMPayload (without FOpts) a downlink at `datr` may carry in EU868."""
+    return _MAX_FRM_PAYLOAD.get(parse_datr(datr), 51)
+
+
+def enqueue_mac_commands(dev_eui: str, plan: Dict[str, List[Dict[str, Any]]]) -> int:
+    """
+    Queues the jobs of a downlink plan (build_downlink_plan_from_uplink() shape).
+    Jobs whose Payload (hex, without the CID) is not built yet are skipped.
+    Returns the number of commands queued.
+    """
+    queue = _queue(dev_eui)
+    queued = 0
+    with queue.lock:
+        for name, jobs in plan.items():
+            for job in jobs:
+                if job.get("Payload") is None:
+                    log.debug("MAC command %s for %s has no payload yet, not queued", name, dev_eui)
+                    continue
+                cid = int(job["CID"], 16)
+                queue.mac_commands[cid] = bytes([cid]) + bytes.fromhex(job["Payload"])
+                queued += 1
+    return queued
+
+
+def enqueue_app_payload(dev_eui: str, payload: bytes, fport: int = 1, confirmed: bool = False) -> None:
+    """Queues an application payload for the device's next receive windows."""
+    if not 1 <= fport <= 223:
+        raise ValueError(f"❌ Application FPort must be 1..223, got {fport}")
+    queue = _queue(dev_eui)
+    with queue.lock:
+        if len(queue.app_payloads) >= QUEUE_MAX:
+            queue.app_payloads.popleft()
+            inc("downlink_queue_dropped_total")
+            log.warning("Downlink queue of %s full, oldest payload dropped", dev_eui)
+        queue.app_payloads.append((fport, bytes(payload), confirmed))
+
+
+def pending_downlinks(dev_eui: str) -> int:
+    queue = _queues.get(dev_eui)
+    return len(queue) if queue is not None else 0
+
+
+def clear_downlink_queue(dev_eui: str) -> None:
+    """Forgets everything pending for a device (e.g. after a new join)."""
+    with _lock:
+        _queues.pop(dev_eui, None)
+
+
+def build_next_downlink(dev_eui: str, dev_addr, max_payload: int, ack: bool = False,
+                        adr: bool = False) -> tuple[bytes, Callable[[], None]] | None:
+    """
+    Packs the device's pending MAC commands and application payload into one downlink.
+
+    Args:
+        dev_eui / dev_addr: target device
+        max_payload: FRMPayload size limit of the receive window (max_frm_payload())
+        ack: set ACK (the uplink was a ConfirmedDataUp)
+        adr: echo the network's ADR bit
+
+    Returns (PHYPayload, requeue), or None if there is nothing to send and nothing to ACK.
+    Call requeue() if the frame is not transmitted after all.
+    """
+    queue = _queue(dev_eui)
+    with queue.lock:
+        app = queue.app_payloads[0] if queue.app_payloads else None
+
+        # FOpts: whole MAC commands, in queue order, up to 15 bytes
+        fopts_cids, fopts_len = [], 0
+        for cid, cmd in queue.mac_commands.items():
+            if fopts_len + len(cmd) > MAX_FOPTS:
+                break
+            fopts_cids.append(cid)
+            fopts_len += len(cmd)
+
+        if app is not None and len(app[1]) > max_payload - fopts_len:
+            app = None  # does not fit this window next to FOpts: stays queued
+
+        mac_cids = fopts_cids
+        if app is None and len(fopts_cids) < len(queue.mac_commands):
+            # No application data: MAC commands go in FRMPayload (FPort 0) up to the window limit
+            mac_cids, size = [], 0
+            for cid, cmd in queue.mac_commands.items():
+                if size + len(cmd) > max_payload:
+                    break
+                mac_cids.append(cid)
+                size += len(cmd)
+            if size <= MAX_FOPTS:
+                mac_cids = fopts_cids
+
+        if not mac_cids and app is None and not ack:
+            return None
+
+        mac_cmds = [queue.mac_commands.pop(cid) for cid in mac_cids]
+        taken_app = app
+        if app is not None:
+            queue.app_payloads.popleft()
+        fpending = len(queue) > 0
+
+    fport, payload, confirmed = app if app is not None else (1, b"", False)
+    fctrl_dict = {"ADR": int(adr), "ACK": int(ack), "FPending": int(fpending)}
+    mtype = CONFIRMED_DATA_DOWN if confirmed else UNCONFIRMED_DATA_DOWN
+    if fpending:
+        inc("downlink_fpending_total")
+    downlink_pkt = downlink_pkt_build(mtype, mac_cmds, dev_eui, dev_addr, payload, fport, fctrl_dict)
+    return downlink_pkt, lambda: _requeue(dev_eui, queue, mac_cmds, taken_app)
+
+
+def _requeue(dev_eui: str, queue: DeviceDownlinkQueue, mac_cmds: List[bytes], app: tuple | None) -> None:
+    """Puts the contents of a dropped downlink back at the head of the device's queue."""
+    if _queues.get(dev_eui) is not queue:
+        return  # the device joined again: the old session's downlinks are void
+    with queue.lock:
+        if mac_cmds:
+            # A command queued since then with the same CID is newer and wins
+            restored = {cmd[0]: cmd for cmd in mac_cmds if cmd[0] not in queue.mac_commands}
+            restored.update(queue.mac_commands)
+            queue.mac_commands = restored
+        if app is not None:
+            queue.app_payloads.appendleft(app)
+    if mac_cmds or app is not None:
+        inc("downlink_requeued_total")
+        log.debug("Dropped downlink for %s requeued", dev_eui)
@@ -2,6 +2,9 @@ from construct import Byte, Int32ub, Struct, Int24ub, Bytes,BitStruct, BitsInteg
 from features.security import encrypt_join_accept_payload, generate_join_accept_mic
 from uplink_packet_handling.processing.device_registry import get_app_key, update_device_yaml_with_join_parameters, get_network_ids, store_devaddr_to_deveui_mapping
 from downlink_pkt_handler.join_accept_handling.Intialize_join_request_param import *
+from core.log import get_logger
+
+log = get_logger(__name__)
 
 #Join accept structure
 #PHYPayload = MHDR | Encrypted(MACPayload) | MIC
@@ -81,7 +84,7 @@ def generate_join_accept_payload(dev_eui):
         "CFList": list(payload_param["CFList"])
     })
 
-    print(join_accept_payload)
+    log.debug("JoinAccept payload: %s", join_accept_payload)
 
     return join_accept_payload
 
@@ -96,7 +99,7 @@ def generate_join_accept_fullframe(dev_eui):
     # Step 2: Build MHDR (MType = 0x01 for Join-Accept)
     mhdr = generate_join_accept_mhdr()
 
-    print("JoinAccept Payload Length:", len(join_accept_payload))
+    log.debug("JoinAccept Payload Length: %d", len(join_accept_payload))
 
     # Step 3: Encrypt MACPayload (with reversal, AES-ECB, and reverse again)
     encrypted_payload = encrypt_join_accept_payload(join_accept_payload, app_key)
@@ -1,5 +1,8 @@
 from Crypto.Cipher import AES
 from uplink_packet_handling.processing.device_registry import get_app_key, get_appnonce_netid_devnonce
+from core.log import get_logger
+
+log = get_logger(__name__)
 
 #need to genrate NEWSKEY AND APPSKEY
 #Need to sotre them in teh device yaml file so they can be extracted accordign to teh deviec ADdress
@@ -32,6 +35,6 @@ def generate_session_keys(dev_eui: str, config_path="config/network_server_devic
     nwk_skey = derive_key(0x01)
     app_skey = derive_key(0x02)
 
-    print(f"✅ Derived keys for DevEUI {dev_eui}")
+    log.info("✅ Derived keys for DevEUI %s", dev_eui)
     return nwk_skey, app_skey
 
@@ -1,3 +1,5 @@
+from core.log import get_logger
+
 # When receiving a confirmed data message, the receiver SHALL respond with a data frame
 # that has the acknowledgment bit (ACK) set. If the sender is an end-device, the network will
 # send the acknowledgement using one of the receive windows opened by the end-device after
@@ -13,6 +15,8 @@
 # defer the transmission of an acknowledgement to piggyback it with its
 # next data message.
 
+log = get_logger(__name__)
+
 #Prototype for the acknowledgment function
 def send_acknowledgment(parsed_frame):
     """
@@ -25,4 +29,4 @@ def send_acknowledgment(parsed_frame):
     
     # Here you would implement the logic to send the acknowledgment
     # For example, you might use a LoRaWAN library to send a frame with ACK bit set
-    print(f"✅ Acknowledgment sent for DevEUI: {dev_eui}, AppEUI: {app_eui}")
\ No newline at end of file
+    log.info("✅ Acknowledgment sent for DevEUI: %s, AppEUI: %s", dev_eui, app_eui)
\ No newline at end of file
@@ -1,3 +1,9 @@
+import threading
+import numpy as np
+from typing import Any, Dict, List
+from core.log import get_logger
+from features.airtime import parse_datr
+
 # LoRa network allows the end-devices to individually use any of the possible data rates. This
 # feature is used by the LoRaWAN to adapt and optimize the data rate of static end-devices.
 # This is referred to as Adaptive Data Rate (ADR) and when this is enabled the network will be
@@ -15,11 +21,222 @@
 # ADR scheme should be enabled to increase the battery life of the end-device and maximize
 # the network capacity.
 
-#Prototype to check if ADR is enabled and take action accordingly
-def is_adr_enabled(parsed_frame):
-    adr = parsed_frame["FCtrl"]["ADR"]
-    if (adr==1):
-        print("Network / gateway willl control the data rate of the end-device through the appropriate MAC commands.")
-    else:
-        print("Network / gateway will not attempt to control the data rate of the end-device regardless of the received signal quality.")
-    
+# ADR engine (network side, in the spirit of Semtech's recommended algorithm):
+#   - every data uplink of a device with the ADR bit set is recorded in a fixed-size ring
+#     buffer row (lsnr / rssi of the best gateway after deduplication); all devices share
+#     one NumPy matrix, one row per device
+#   - margin  = max(SNR history) - required SNR of the current DR - INSTALLATION_MARGIN_DB
+#     nstep   = floor(margin / 3): each step raises the DR (up to DR5), then lowers the
+#     TX power (TXPower index +1 = -2 dB); negative steps raise the TX power back
+#   - evaluate_adr() computes this for any number of devices with array operations and
+#     returns LinkADRReq jobs in the build_downlink_plan_from_uplink() shape:
+#       {dev_eui: {"LinkADRReq": [job]}}
+#   - after a LinkADRReq the device's history is cleared, so it is only re-evaluated on
+#     links measured at the new settings
+#   - the requested TXPower stays pending until the device's LinkADRAns: it becomes the
+#     device's TXPower only if all three ACK bits are set (otherwise the device kept its
+#     settings). The DR needs no such tracking, it is read from every uplink's datr.
+#   - devices with no SNR sample in their history (all NaN) keep their settings
+#
+# CFG keys (all optional):
+#   ADR_HISTORY_SIZE        20    uplinks kept per device (and needed before a decision)
+#   ADR_MARGIN_DB           10    installation margin
+
+log = get_logger(__name__)
+
+HISTORY_SIZE = 20
+INSTALLATION_MARGIN_DB = 10.0
+MAX_DR = 5            # EU868 DR5 = SF7BW125 (DR6 SF7BW250 is not used by ADR)
+MAX_TX_POWER = 7      # EU868 TXPower 7 = max EIRP - 14 dB
+CH_MASK = 0x00FF      # the 3 default channels + the 5 CFList channels of the Join Accept
+NB_TRANS = 1
+
+# Demodulation floor per DR (DR0..DR6), dB
+REQUIRED_SNR_DB = np.array([-20.0, -17.5, -15.0, -12.5, -10.0, -7.5, -7.5], dtype=np.float32)
+_SF_TO_DR = {12: 0, 11: 1, 10: 2, 9: 3, 8: 4, 7: 5}
+
+_lock = threading.Lock()
+_index: Dict[str, int] = {}   # dev_eui -> row
+_dev_euis: List[str] = []     # row -> dev_eui
+_snr = np.empty((0, HISTORY_SIZE), dtype=np.float32)
+_rssi = np.empty((0, HISTORY_SIZE), dtype=np.float32)
+_count = np.empty(0, dtype=np.int32)   # samples written since the last reset
+_dr = np.empty(0, dtype=np.int8)
+_tx_power = np.empty(0, dtype=np.int8)
+_pending_tx = np.empty(0, dtype=np.int8)   # TXPower of an unanswered LinkADRReq, -1 = none
+_adr_on = np.empty(0, dtype=bool)
+
+
+def configure_adr(history_size: int = 20, margin_db: float = 10.0) -> None:
+    """Sets the ADR parameters and clears every device history."""
+    global HISTORY_SIZE, INSTALLATION_MARGIN_DB
+    if history_size < 1:
+        raise ValueError("❌ ADR_HISTORY_SIZE must be at least 1")
+    with _lock:
+        HISTORY_SIZE = int(history_size)
+        INSTALLATION_MARGIN_DB = float(margin_db)
+        _resize(0)
+        _index.clear()
+        _dev_euis.clear()
+
+
+def _resize(capacity: int) -> None:
+    """Grows (or, with 0, empties) the per-device arrays, keeping existing rows."""
+    global _snr, _rssi, _count, _dr, _tx_power, _pending_tx, _adr_on
+    n = len(_dev_euis) if capacity else 0
+
+    def grow(arr, shape, fill):
+        new = np.full(shape, fill, dtype=arr.dtype)
+        if n:
+            new[:n] = arr[:n]
+        return new
+
+    _snr = grow(_snr, (capacity, HISTORY_SIZE), np.nan)
+    _rssi = grow(_rssi, (capacity, HISTORY_SIZE), np.nan)
+    _count = grow(_count, capacity, 0)
+    _dr = grow(_dr, capacity, 0)
+    _tx_power = grow(_tx_power, capacity, 0)
+    _pending_tx = grow(_pending_tx, capacity, -1)
+    _adr_on = grow(_adr_on, capacity, False)
+
+
+def _row(dev_eui: str) -> int:
+    row = _index.get(dev_eui)
+    if row is None:
+        row = len(_dev_euis)
+        if row == len(_count):
+            _resize(max(64, 2 * row))
+        _index[dev_eui] = row
+        _dev_euis.append(dev_eui)
+    return row
+
+
+def datr_to_dr(datr: str) -> int | None:
+    """EU868 data rate index of a LoRa datr string ('SF7BW250' -> 6)."""
+    sf, bw = parse_datr(datr)
+    if bw == 250 and sf == 7:
+        return 6
+    return _SF_TO_DR.get(sf) if bw == 125 else None
+
+
+def record_uplink(dev_eui: str, lsnr: float | None, rssi: float | None, datr: str | None, adr: bool) -> None:
+    """Appends one uplink's link quality to the device's ring buffer."""
+    dr = None
+    if datr:
+        try:
+            dr = datr_to_dr(datr)
+        except ValueError:
+            pass
+    with _lock:
+        row = _row(dev_eui)
+        _adr_on[row] = bool(adr)
+        if dr is not None:
+            _dr[row] = dr
+        slot = _count[row] % HISTORY_SIZE
+        _snr[row, slot] = np.nan if lsnr is None else lsnr
+        _rssi[row, slot] = np.nan if rssi is None else rssi
+        _count[row] += 1
+
+
+def device_adr_enabled(dev_eui: str) -> bool:
+    """ADR bit of the device's latest uplink (False if none was recorded)."""
+    row = _index.get(dev_eui)
+    return row is not None and bool(_adr_on[row])
+
+
+def compute_adr_targets(snr_history: np.ndarray, dr: np.ndarray, tx_power: np.ndarray,
+                        margin_db: float = INSTALLATION_MARGIN_DB) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Vectorised ADR step for N devices.
+
+    Args:
+        snr_history: (N, H) lsnr samples (NaN = empty slot)
+        dr / tx_power: (N,) current DataRate and TXPower indexes
+
+    Returns (target_dr, target_tx_power), both (N,) int arrays. Devices without any SNR
+    sample keep their current settings.
+    """
+    dr = dr.astype(np.int32)
+    tx_power = tx_power.astype(np.int32)
+    empty = np.isnan(snr_history).all(axis=1)
+    # fmax skips NaN (and yields NaN for an all-NaN row, masked below before the cast)
+    margin = np.fmax.reduce(snr_history, axis=1) - REQUIRED_SNR_DB[dr] - margin_db
+    nstep = np.floor(np.where(empty, 0.0, margin) / 3.0).astype(np.int32)
+
+    dr_steps = np.clip(nstep, 0, np.maximum(MAX_DR - dr, 0))
+    rest = nstep - dr_steps
+    power_steps = np.where(rest > 0, np.minimum(rest, MAX_TX_POWER - tx_power), np.maximum(rest, -tx_power))
+    return dr + dr_steps, tx_power + power_steps
+
+
+def build_link_adr_req_job(data_rate: int, tx_power: int, ch_mask: int = CH_MASK,
+                           ch_mask_cntl: int = 0, nb_trans: int = NB_TRANS) -> Dict[str, Any]:
+    """LinkADRReq job; Payload is the command payload (without CID) as uppercase hex."""
+    payload = bytes([(data_rate << 4) | tx_power]) + ch_mask.to_bytes(2, "little") \
+        + bytes([(ch_mask_cntl << 4) | nb_trans])
+    return {
+        "Index": None,
+        "CID": "0x03",
+        "Name": "LinkADRReq",
+        "Fields": {"DataRate": data_rate, "TXPower": tx_power, "ChMask": ch_mask,
+                   "ChMaskCntl": ch_mask_cntl, "NbTrans": nb_trans},
+        "Payload": payload.hex().upper(),
+    }
+
+
+def evaluate_adr(dev_euis: List[str] | None = None) -> Dict[str, Dict[str, List[Dict[str, Any]]]]:
+    """
+    Runs ADR for the given devices (all known devices if None) in one batch.
+    Only devices with the ADR bit set and a full history whose target differs from their
+    current settings get a job; their history is then cleared and the requested TXPower
+    kept pending until handle_link_adr_ans().
+    """
+    with _lock:
+        if dev_euis is None:
+            rows = np.arange(len(_dev_euis))
+        else:
+            rows = np.fromiter((_index[d] for d in dev_euis if d in _index), dtype=np.int64)
+        if rows.size == 0:
+            return {}
+        rows = rows[_adr_on[rows] & (_count[rows] >= HISTORY_SIZE)]
+        if rows.size == 0:
+            return {}
+
+        target_dr, target_tx = compute_adr_targets(_snr[rows], _dr[rows], _tx_power[rows], INSTALLATION_MARGIN_DB)
+        changed = (target_dr != _dr[rows]) | (target_tx != _tx_power[rows])
+        rows, target_dr, target_tx = rows[changed], target_dr[changed], target_tx[changed]
+
+        _pending_tx[rows] = target_tx
+        _count[rows] = 0
+        _snr[rows] = np.nan
+        _rssi[rows] = np.nan
+
+        plans = {}
+        for row, dr, tx in zip(rows.tolist(), target_dr.tolist(), target_tx.tolist()):
+            plans[_dev_euis[row]] = {"LinkADRReq": [build_link_adr_req_job(dr, tx)]}
+    if plans:
+        log.debug("ADR: LinkADRReq for %d device(s)", len(plans))
+    return plans
+
+
+def handle_link_adr_ans(dev_eui: str, status: int) -> bool:
+    """
+    Applies a LinkADRAns (status byte: ChMaskACK | DataRateACK << 1 | TxPowerACK << 2).
+    Returns True if the device accepted the pending LinkADRReq.
+    """
+    accepted = (status & 0x07) == 0x07
+    with _lock:
+        row = _index.get(dev_eui)
+        if row is None or _pending_tx[row] < 0:
+            return accepted
+        if accepted:
+            _tx_power[row] = _pending_tx[row]
+        _pending_tx[row] = -1
+    if not accepted:
+        log.warning("ADR: LinkADRReq rejected by %s (status 0x%02X)", dev_eui, status)
+    return accepted
+
+
+def is_adr_enabled(parsed_frame) -> bool:
+    """True if the uplink's ADR bit is set (the network then controls the device's data rate)."""
+    return parsed_frame["FCtrl"]["ADR"] == 1
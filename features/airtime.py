@@ -0,0 +1,88 @@
+import math
+from functools import lru_cache
+from typing import Dict
+
+# LoRa time-on-air (Semtech AN1200.13, "LoRa Modem Designer's Guide"):
+#
+#   Tsym      = 2^SF / BW
+#   Tpreamble = (n_preamble + 4.25) * Tsym
+#   n_payload = 8 + max(ceil((8*PL - 4*SF + 28 + 16*CRC - 20*IH) / (4*(SF - 2*DE))) * (CR + 4), 0)
+#   ToA       = Tpreamble + n_payload * Tsym
+#
+#   PL = PHYPayload bytes, CR = 1..4 for coding rate 4/5..4/8, IH = 1 for implicit header
+#   (LoRaWAN always uses the explicit header: IH = 0), DE = low data rate optimisation
+#   (on when Tsym >= 16 ms: SF11/SF12 at 125 kHz), CRC = 1 when the payload CRC is sent.
+#
+# airtime_us() is one dict lookup keyed by (datr, codr, size) (one table per CRC setting):
+# the EU868 data rates (DR0..DR6) at coding rate 4/5 are precomputed for every size, other
+# combinations are computed once and added to the table.
+
+PREAMBLE_SYMBOLS = 8  # LoRaWAN preamble length
+EU868_DATRS = ("SF12BW125", "SF11BW125", "SF10BW125", "SF9BW125", "SF8BW125", "SF7BW125", "SF7BW250")
+MAX_PHY_PAYLOAD = 255
+
+
+@lru_cache(maxsize=64)
+def parse_datr(datr: str) -> tuple[int, int]:
+    """'SF7BW125' -> (7, 125). Raises ValueError for anything else."""
+    s = datr.upper()
+    if not s.startswith("SF") or "BW" not in s:
+        raise ValueError(f"❌ Not a LoRa data rate: {datr!r}")
+    sf_part, bw_part = s[2:].split("BW", 1)
+    sf, bw = int(sf_part), int(bw_part)
+    if not 5 <= sf <= 12 or bw not in (125, 250, 500):
+        raise ValueError(f"❌ Unsupported LoRa data rate: {datr!r}")
+    return sf, bw
+
+
+@lru_cache(maxsize=16)
+def parse_codr(codr: str) -> int:
+    """'4/5' -> 1 ... '4/8' -> 4 (the CR term of the formula)."""
+    num, den = codr.split("/")
+    cr = int(den) - 4
+    if int(num) != 4 or not 1 <= cr <= 4:
+        raise ValueError(f"❌ Unsupported coding rate: {codr!r}")
+    return cr
+
+
+def lora_time_on_air_s(sf: int, bw_khz: int, size: int, cr: int = 1, crc: bool = True,
+                       implicit_header: bool = False, preamble: int = PREAMBLE_SYMBOLS,
+                       low_dr_opt: bool | None = None) -> float:
+    """Time on air in seconds of a LoRa frame of `size` PHYPayload bytes."""
+    t_sym = (1 << sf) / (bw_khz * 1000.0)
+    de = (t_sym >= 0.016) if low_dr_opt is None else low_dr_opt
+    numerator = 8 * size - 4 * sf + 28 + 16 * int(crc) - 20 * int(implicit_header)
+    n_payload = 8 + max(math.ceil(numerator / (4 * (sf - 2 * int(de)))) * (cr + 4), 0)
+    return (preamble + 4.25) * t_sym + n_payload * t_sym
+
+
+def time_on_air_us(datr: str, codr: str, size: int, crc: bool = True) -> int:
+    """Time on air in µs for Semtech-style datr / codr strings (rounded up)."""
+    sf, bw = parse_datr(datr)
+    return math.ceil(lora_time_on_air_s(sf, bw, size, parse_codr(codr), crc) * 1_000_000)
+
+
+def _build_table(crc: bool) -> Dict[tuple, int]:
+    return {(datr, "4/5", size): time_on_air_us(datr, "4/5", size, crc)
+            for datr in EU868_DATRS for size in range(MAX_PHY_PAYLOAD + 1)}
+
+
+_TOA_US = {True: _build_table(crc=True), False: _build_table(crc=False)}
+
+
+def airtime_us(datr: str, codr: str, size: int, crc: bool = True) -> int:
+    """
+    Time on air in µs of a LoRa frame (one dict lookup once the key has been seen).
+    LoRaWAN uplinks carry a payload CRC; downlinks only lack it when the txpk sets "ncrc".
+    """
+    table = _TOA_US[crc]
+    key = (datr, codr, size)
+    toa = table.get(key)
+    if toa is None:
+        toa = table[key] = time_on_air_us(datr, codr, size, crc)
+    return toa
+
+
+def txpk_airtime_us(txpk: dict) -> int:
+    """Time on air of a Semtech txpk (the packet forwarder adds a CRC unless "ncrc" is true)."""
+    return airtime_us(txpk["datr"], txpk.get("codr", "4/5"), txpk["size"], not txpk.get("ncrc", False))
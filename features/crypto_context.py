@@ -0,0 +1,122 @@
+import hmac
+import threading
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.cmac import CMAC
+from features.security import crypt_frm_payload_with, crypt_frm_payload_batch_with
+
+# Per-session crypto contexts (LoRaWAN 1.0.x data frames).
+# A context is built once per session (at join, or on first use after a restart) and holds
+# everything that only depends on the session:
+#   - NwkSKey / AppSKey as bytes (no hex parsing per frame)
+#   - a keyed CMAC template for NwkSKey; each MIC works on template.copy(), so the AES key
+#     schedule is not redone per frame
+#   - ECB encryptors for NwkSKey (FPort 0) and AppSKey (FPort > 0)
+#   - the constant 10-byte heads of the B0 (MIC) and A (FRMPayload) blocks per direction:
+#       B0 = 0x49 | 4x00 | Dir | DevAddr | FCnt(4) | 0x00 | len(msg)
+#       Ai = 0x01 | 4x00 | Dir | DevAddr | FCnt(4) | 0x00 | i
+# Contexts are cached by DevEUI and evicted together with the device session.
+
+UPLINK = 0
+DOWNLINK = 1
+
+
+def _key_bytes(key) -> bytes:
+    """Accepts a 16-byte key as bytes or as the hex string stored in the device record."""
+    if isinstance(key, str):
+        key = bytes.fromhex(key)
+    key = bytes(key)
+    if len(key) != 16:
+        raise ValueError("Session keys must be 16 bytes")
+    return key
+
+
+def _dev_addr_bytes(dev_addr) -> bytes:
+    """DevAddr in on-air (little-endian) order from an int, 4 bytes, or the stored hex string."""
+    if isinstance(dev_addr, int):
+        return dev_addr.to_bytes(4, "little")
+    if isinstance(dev_addr, str):
+        dev_addr = bytes.fromhex(dev_addr)
+    if len(dev_addr) != 4:
+        raise ValueError("dev_addr must be 4 bytes (little-endian) or an int")
+    return bytes(dev_addr)
+
+
+class SessionCryptoContext:
+    __slots__ = ("dev_eui", "dev_addr", "nwk_skey", "app_skey",
+                 "_cmac_nwk", "_ecb_nwk", "_ecb_app", "_b0_head", "_a_head", "_lock")
+
+    def __init__(self, dev_eui: str, dev_addr, nwk_skey, app_skey):
+        self.dev_eui = dev_eui
+        self.dev_addr = _dev_addr_bytes(dev_addr)
+        self.nwk_skey = _key_bytes(nwk_skey)
+        self.app_skey = _key_bytes(app_skey)
+
+        self._cmac_nwk = CMAC(algorithms.AES(self.nwk_skey))
+        self._ecb_nwk = Cipher(algorithms.AES(self.nwk_skey), modes.ECB()).encryptor()
+        self._ecb_app = Cipher(algorithms.AES(self.app_skey), modes.ECB()).encryptor()
+
+        self._b0_head = tuple(bytes([0x49, 0, 0, 0, 0, d]) + self.dev_addr for d in (UPLINK, DOWNLINK))
+        self._a_head = tuple(bytes([0x01, 0, 0, 0, 0, d]) + self.dev_addr for d in (UPLINK, DOWNLINK))
+        # The prepared cipher objects are shared by the uplink worker threads
+        self._lock = threading.Lock()
+
+    def mic(self, fcnt: int, direction: int, msg: bytes) -> bytes:
+        """4-byte MIC of msg = MHDR | MACPayload."""
+        b0 = self._b0_head[direction & 0x01] + (fcnt & 0xFFFFFFFF).to_bytes(4, "little") + bytes([0, len(msg) & 0xFF])
+        with self._lock:
+            cmac = self._cmac_nwk.copy()
+        cmac.update(b0)
+        cmac.update(msg)
+        return cmac.finalize()[:4]
+
+    def mic_many(self, items: list[tuple]) -> list[bytes]:
+        """MICs of many frames of this session: [(fcnt, direction, msg), ...]."""
+        with self._lock:
+            cmacs = [self._cmac_nwk.copy() for _ in items]
+        macs = []
+        for cmac, (fcnt, direction, msg) in zip(cmacs, items):
+            cmac.update(self._b0_head[direction & 0x01] + (fcnt & 0xFFFFFFFF).to_bytes(4, "little") + bytes([0, len(msg) & 0xFF]))
+            cmac.update(msg)
+            macs.append(cmac.finalize()[:4])
+        return macs
+
+    def verify_mic(self, fcnt: int, direction: int, msg: bytes, mic) -> bool:
+        if isinstance(mic, int):
+            mic = mic.to_bytes(4, "little")
+        return hmac.compare_digest(self.mic(fcnt, direction, msg), bytes(mic))
+
+    def crypt_frm_payload(self, fcnt: int, direction: int, frm_payload: bytes, fport: int) -> bytes:
+        """AES-CTR en/decryption of FRMPayload (the same operation both ways)."""
+        a_head = self._a_head[direction & 0x01] + (fcnt & 0xFFFFFFFF).to_bytes(4, "little") + b"\x00"
+        encryptor = self._ecb_nwk if fport == 0 else self._ecb_app
+        with self._lock:
+            return crypt_frm_payload_with(encryptor, a_head, frm_payload)
+
+    def crypt_frm_payload_batch(self, frames: list[tuple], direction: int, fport: int) -> list[bytes]:
+        """Same as crypt_frm_payload for many frames of this session: [(fcnt, frm_payload), ...]."""
+        head = self._a_head[direction & 0x01]
+        a_heads = [head + (fcnt & 0xFFFFFFFF).to_bytes(4, "little") + b"\x00" for fcnt, _ in frames]
+        encryptor = self._ecb_nwk if fport == 0 else self._ecb_app
+        with self._lock:
+            return crypt_frm_payload_batch_with(encryptor, a_heads, [payload for _, payload in frames])
+
+
+_contexts: dict[str, SessionCryptoContext] = {}
+_contexts_lock = threading.Lock()
+
+
+def create_crypto_context(dev_eui: str, dev_addr, nwk_skey, app_skey) -> SessionCryptoContext:
+    """Builds (or replaces, on re-join) the context of a session."""
+    ctx = SessionCryptoContext(dev_eui, dev_addr, nwk_skey, app_skey)
+    with _contexts_lock:
+        _contexts[dev_eui] = ctx
+    return ctx
+
+
+def get_crypto_context(dev_eui: str) -> SessionCryptoContext | None:
+    return _contexts.get(dev_eui)
+
+
+def evict_crypto_context(dev_eui: str) -> None:
+    with _contexts_lock:
+        _contexts.pop(dev_eui, None)
@@ -0,0 +1,148 @@
+import threading
+import time
+from typing import Dict
+
+# Per-gateway, per-sub-band duty-cycle accounting (ETSI EN 300 220 / LoRaWAN EU868).
+# Every (gateway, sub-band) pair owns an AirtimeRing: the sliding window (1 h by default)
+# is split into fixed buckets holding the airtime sent in each slice, plus a running sum.
+# Advancing the ring only clears the buckets that expired since the last call, so
+# can_transmit() is O(1) amortised and next_allowed() walks at most N_BUCKETS buckets.
+# The window is bucket-granular: airtime leaves the window with its whole bucket.
+#
+# CFG keys (all optional):
+#   DUTY_CYCLE_ENABLED   true
+#   DUTY_CYCLE_WINDOW_S  3600   sliding window length
+#   DUTY_CYCLE_BUCKETS   60     buckets per window (60 -> one per minute)
+
+# (name, low MHz, high MHz, max duty cycle)
+EU868_SUB_BANDS = (
+    ("h1.3", 863.0, 865.0, 0.001),
+    ("h1.4", 865.0, 868.0, 0.01),
+    ("g1", 868.0, 868.6, 0.01),
+    ("g2", 868.7, 869.2, 0.001),
+    ("g3", 869.4, 869.65, 0.10),   # RX2 (869.525 MHz)
+    ("g4", 869.7, 870.0, 0.01),
+)
+
+ENABLED = True
+WINDOW_S = 3600.0
+N_BUCKETS = 60
+
+_rings: Dict[tuple, "AirtimeRing"] = {}
+_lock = threading.Lock()
+
+
+class AirtimeRing:
+    """Airtime (µs) sent in the last WINDOW_S seconds, in N_BUCKETS fixed slices."""
+    __slots__ = ("limit_us", "bucket_s", "buckets", "total_us", "head", "head_start", "_lock")
+
+    def __init__(self, duty_cycle: float, window_s: float, n_buckets: int, now: float):
+        self.limit_us = duty_cycle * window_s * 1_000_000
+        self.bucket_s = window_s / n_buckets
+        self.buckets = [0] * n_buckets
+        self.total_us = 0
+        self.head = 0               # bucket receiving airtime now
+        self.head_start = now - now % self.bucket_s
+        self._lock = threading.Lock()
+
+    def _advance(self, now: float) -> None:
+        steps = int((now - self.head_start) // self.bucket_s)
+        if steps <= 0:
+            return
+        n = len(self.buckets)
+        for _ in range(min(steps, n)):
+            self.head = (self.head + 1) % n
+            self.total_us -= self.buckets[self.head]
+            self.buckets[self.head] = 0
+        self.head_start += steps * self.bucket_s
+
+    def can_transmit(self, airtime_us: int, now: float) -> bool:
+        with self._lock:
+            self._advance(now)
+            return self.total_us + airtime_us <= self.limit_us
+
+    def reserve(self, airtime_us: int, now: float) -> bool:
+        """Records the transmission if it fits; returns whether it did."""
+        with self._lock:
+            self._advance(now)
+            if self.total_us + airtime_us > self.limit_us:
+                return False
+            self.buckets[self.head] += airtime_us
+            self.total_us += airtime_us
+            return True
+
+    def next_allowed(self, airtime_us: int, now: float) -> float:
+        """Earliest time a transmission of `airtime_us` fits (now if it already does)."""
+        with self._lock:
+            self._advance(now)
+            excess = self.total_us + airtime_us - self.limit_us
+            if excess <= 0:
+                return now
+            if airtime_us > self.limit_us:
+                return float("inf")
+            n = len(self.buckets)
+            # Oldest bucket first: it leaves the window at the end of the current head bucket
+            for age in range(1, n + 1):
+                excess -= self.buckets[(self.head + age) % n]
+                if excess <= 0:
+                    return self.head_start + age * self.bucket_s
+            return float("inf")
+
+
+def configure_duty_cycle(enabled: bool = True, window_s: float = 3600, n_buckets: int = 60) -> None:
+    """Applies the limits to every ring created from now on (existing rings are dropped)."""
+    global ENABLED, WINDOW_S, N_BUCKETS
+    if n_buckets < 1 or window_s <= 0:
+        raise ValueError("❌ Duty-cycle window and bucket count must be positive")
+    ENABLED = bool(enabled)
+    WINDOW_S = float(window_s)
+    N_BUCKETS = int(n_buckets)
+    with _lock:
+        _rings.clear()
+
+
+def sub_band_of(freq_mhz: float) -> tuple | None:
+    """EU868 sub-band (name, low, high, duty_cycle) containing `freq_mhz`, or None."""
+    for band in EU868_SUB_BANDS:
+        if band[1] <= freq_mhz < band[2]:
+            return band
+    return None
+
+
+def _ring(gateway: str, freq_mhz: float, now: float) -> AirtimeRing | None:
+    band = sub_band_of(freq_mhz)
+    if band is None:
+        return None  # outside the EU868 table: not regulated here
+    key = (gateway, band[0])
+    ring = _rings.get(key)
+    if ring is None:
+        with _lock:
+            ring = _rings.setdefault(key, AirtimeRing(band[3], WINDOW_S, N_BUCKETS, now))
+    return ring
+
+
+def can_transmit(gateway: str, freq_mhz: float, airtime_us: int, now: float | None = None) -> bool:
+    """True if `gateway` may send `airtime_us` on `freq_mhz` now."""
+    if not ENABLED:
+        return True
+    now = time.perf_counter() if now is None else now
+    ring = _ring(gateway, freq_mhz, now)
+    return ring is None or ring.can_transmit(airtime_us, now)
+
+
+def reserve_airtime(gateway: str, freq_mhz: float, airtime_us: int, now: float | None = None) -> bool:
+    """Checks and records a transmission in one step; False if it would exceed the limit."""
+    if not ENABLED:
+        return True
+    now = time.perf_counter() if now is None else now
+    ring = _ring(gateway, freq_mhz, now)
+    return ring is None or ring.reserve(airtime_us, now)
+
+
+def next_allowed(gateway: str, freq_mhz: float, airtime_us: int, now: float | None = None) -> float:
+    """perf_counter() time from which the transmission fits (inf if it never can)."""
+    now = time.perf_counter() if now is None else now
+    if not ENABLED:
+        return now
+    ring = _ring(gateway, freq_mhz, now)
+    return now if ring is None else ring.next_allowed(airtime_us, now)
@@ -0,0 +1,152 @@
+import hmac
+import time
+import threading
+from typing import Dict
+from cryptography.hazmat.primitives.ciphers import algorithms
+from cryptography.hazmat.primitives.cmac import CMAC
+from core.log import get_logger
+from core.metrics import inc, labeled
+from uplink_packet_handling.processing.registry_backends import get_registry_backend
+
+# Join-Request admission, done before the join path touches the device registry.
+#   1) verify_join_request(): length check, AppKey lookup and MIC
+#      (MIC = aes128_cmac(AppKey, MHDR | AppEUI | DevEUI | DevNonce)[0:4], as in
+#      security.compute_join_request_mic). The AppKeys come from an in-memory cache
+#      filled once from the registry (network_server_device_config.yaml or SQLite).
+#      Each entry keeps a keyed CMAC template, so checking a MIC is one template.copy()
+#      plus one CMAC block: no file access and no AES key schedule per join. DevEUIs that
+#      are not in the cache are rejected without reading the registry; call
+#      reload_join_keys() after adding devices. (Loaded on the first join if
+#      configure_join_guard() was never called.)
+#   2) admit_join(): token buckets per DevEUI and per gateway. Only joins with a valid MIC
+#      reach them, so forged joins cannot use up a real device's budget and the
+#      per-DevEUI table never grows beyond the registry.
+# Every rejection increments join_rejected_total{reason=...}
+# (malformed, unknown_device, mic, device_rate, gateway_rate).
+#
+# CFG keys (all optional):
+#   JOIN_REGISTRY_PATH       "config/network_server_device_config.yaml"
+#   JOIN_DEVEUI_RATE_PER_S   0.1   joins per second per DevEUI (0 = unlimited)
+#   JOIN_DEVEUI_BURST        3
+#   JOIN_GATEWAY_RATE_PER_S  5     joins per second per gateway (0 = unlimited)
+#   JOIN_GATEWAY_BURST       20
+
+JOIN_REQUEST_LEN = 23  # MHDR(1) | AppEUI(8) | DevEUI(8) | DevNonce(2) | MIC(4)
+
+REGISTRY_PATH = "config/network_server_device_config.yaml"
+DEVEUI_RATE_PER_S = 0.1
+DEVEUI_BURST = 3
+GATEWAY_RATE_PER_S = 5.0
+GATEWAY_BURST = 20
+
+log = get_logger(__name__)
+
+_join_cmacs: Dict[str, CMAC] = {}      # DevEUI -> CMAC keyed with its AppKey
+_loaded = False
+_device_buckets: Dict[str, "TokenBucket"] = {}
+_gateway_buckets: Dict[str, "TokenBucket"] = {}
+_lock = threading.Lock()
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "last")
+
+    def __init__(self, rate_per_s: float, burst: int, now: float):
+        self.rate = float(rate_per_s)
+        self.burst = float(max(1, burst))
+        self.tokens = self.burst
+        self.last = now
+
+    def take(self, now: float) -> bool:
+        """Takes one token if available (call with the module lock held)."""
+        if self.rate <= 0:
+            return True
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        if self.tokens < 1.0:
+            return False
+        self.tokens -= 1.0
+        return True
+
+
+def configure_join_guard(registry_path: str = "config/network_server_device_config.yaml",
+                         deveui_rate_per_s: float = 0.1, deveui_burst: int = 3,
+                         gateway_rate_per_s: float = 5, gateway_burst: int = 20) -> int:
+    """Sets the rate limits and (re)loads the AppKey cache; returns the number of keys loaded."""
+    global REGISTRY_PATH, DEVEUI_RATE_PER_S, DEVEUI_BURST, GATEWAY_RATE_PER_S, GATEWAY_BURST
+    REGISTRY_PATH = registry_path
+    DEVEUI_RATE_PER_S, DEVEUI_BURST = float(deveui_rate_per_s), int(deveui_burst)
+    GATEWAY_RATE_PER_S, GATEWAY_BURST = float(gateway_rate_per_s), int(gateway_burst)
+    with _lock:
+        _device_buckets.clear()
+        _gateway_buckets.clear()
+    return reload_join_keys()
+
+
+def reload_join_keys() -> int:
+    """Rebuilds the AppKey cache from the registry; returns the number of keys loaded."""
+    global _loaded
+    try:
+        entries = get_registry_backend().load_registry_entries(REGISTRY_PATH)
+    except FileNotFoundError as e:
+        log.warning("[NS] Join key cache empty: %s", e)
+        entries = {}
+
+    cmacs = {}
+    for dev_eui, entry in entries.items():
+        try:
+            cmacs[dev_eui.upper()] = CMAC(algorithms.AES(bytes.fromhex(entry["AppKey"])))
+        except (KeyError, TypeError, ValueError):
+            log.warning("[NS] DevEUI %s has no valid AppKey, its joins will be rejected", dev_eui)
+    with _lock:
+        _join_cmacs.clear()
+        _join_cmacs.update(cmacs)
+        _loaded = True
+    return len(cmacs)
+
+
+def _reject(reason: str) -> str:
+    inc(labeled("join_rejected_total", reason=reason))
+    return reason
+
+
+def verify_join_request(frame) -> str | None:
+    """
+    Checks a Join-Request (LoRaWANFrame) against the AppKey cache and sets frame.mic_valid.
+    Returns None if it is authentic, else the rejection reason.
+    """
+    if not _loaded:
+        reload_join_keys()  # first join without configure_join_guard()
+    if len(frame.raw) != JOIN_REQUEST_LEN:
+        return _reject("malformed")
+    template = _join_cmacs.get(frame.dev_eui)
+    if template is None:
+        return _reject("unknown_device")
+    with _lock:
+        cmac = template.copy()
+    cmac.update(frame.signed_part)
+    frame.mic_valid = hmac.compare_digest(cmac.finalize()[:4], frame.mic)
+    if not frame.mic_valid:
+        return _reject("mic")
+    return None
+
+
+def admit_join(dev_eui: str, gateway_mac: str | None, now: float | None = None) -> str | None:
+    """
+    Applies the per-DevEUI and per-gateway join rate limits to an authentic Join-Request.
+    Returns None if the join may proceed, else the rejection reason.
+    """
+    now = time.monotonic() if now is None else now
+    with _lock:
+        bucket = _device_buckets.get(dev_eui)
+        if bucket is None:
+            bucket = _device_buckets[dev_eui] = TokenBucket(DEVEUI_RATE_PER_S, DEVEUI_BURST, now)
+        if not bucket.take(now):
+            return _reject("device_rate")
+        if gateway_mac is not None:
+            bucket = _gateway_buckets.get(gateway_mac)
+            if bucket is None:
+                bucket = _gateway_buckets[gateway_mac] = TokenBucket(GATEWAY_RATE_PER_S, GATEWAY_BURST, now)
+            if not bucket.take(now):
+                return _reject("gateway_rate")
+    return None
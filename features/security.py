@@ -1,5 +1,7 @@
+import hmac
 from functools import reduce
 from operator import xor
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from cryptography.hazmat.primitives.cmac import CMAC
@@ -31,11 +33,67 @@ def generate_mic(nwkskey: bytes, devaddr: bytes, fcnt: int, direction: int, MHDR
 
 def compute_verify_mic(nwkskey: bytes, devaddr: bytes, fcnt: int, direction: int, MHDR: bytes, MacPayload: bytes, MIC) -> bool:
     mic_generated = generate_mic(nwkskey, devaddr, fcnt, direction, MHDR, MacPayload)
-    MIC_HEX = MIC.hex().upper() if isinstance(MIC, bytes) else MIC
-    print("MIC from packet:", MIC_HEX)
-    calculated_mic = mic_generated.hex().upper()
-    print("Calculated MIC:", calculated_mic)
-    return calculated_mic == MIC_HEX
+    mic_bytes = bytes.fromhex(MIC) if isinstance(MIC, str) else bytes(MIC)
+    # Constant-time comparison of the raw digests
+    return hmac.compare_digest(mic_generated, mic_bytes)
+
+
+#Batch MIC verification
+#frames = [(session, fcnt, direction, msg, mic), ...] where session is a SessionCryptoContext
+#(features/crypto_context.py) and msg = MHDR | MACPayload.
+#Frames are grouped by (NwkSKey, DevAddr): every group reuses one keyed CMAC template and the
+#B0 head of its session (B0 carries the DevAddr, so sessions that share a NwkSKey but not the
+#DevAddr must not share a group). The result is a NumPy bool vector aligned with `frames`.
+def _verify_mic_group(frames: list[tuple], indexes: list[int], result: np.ndarray) -> None:
+    session = frames[indexes[0]][0]
+    macs = session.mic_many([(frames[i][1], frames[i][2], frames[i][3]) for i in indexes])
+    for i, mac in zip(indexes, macs):
+        mic = frames[i][4]
+        if isinstance(mic, int):
+            mic = mic.to_bytes(4, 'little')
+        result[i] = hmac.compare_digest(mac, bytes(mic))
+
+
+def _group_by_key(frames: list[tuple]) -> dict:
+    groups = {}
+    for i, frame in enumerate(frames):
+        groups.setdefault((frame[0].nwk_skey, frame[0].dev_addr), []).append(i)
+    return groups
+
+
+def verify_mic_batch(frames: list[tuple]) -> np.ndarray:
+    """Verifies the MIC of many frames; returns a bool vector (True = valid)."""
+    result = np.zeros(len(frames), dtype=bool)
+    for indexes in _group_by_key(frames).values():
+        _verify_mic_group(frames, indexes, result)
+    return result
+
+
+def verify_mic_batch_threaded(frames: list[tuple], executor: ThreadPoolExecutor | None = None,
+                              max_workers: int = 4, chunk_size: int = 64) -> np.ndarray:
+    """
+    Same as verify_mic_batch with the key groups (split into chunks of `chunk_size`) spread
+    over a thread pool, so large bursts overlap in the C crypto backend. Pass a long-lived
+    `executor` on the hot path; otherwise a temporary pool of `max_workers` is used.
+    """
+    result = np.zeros(len(frames), dtype=bool)
+    chunks = [indexes[i:i + chunk_size]
+              for indexes in _group_by_key(frames).values()
+              for i in range(0, len(indexes), chunk_size)]
+    if len(chunks) <= 1:
+        for chunk in chunks:
+            _verify_mic_group(frames, chunk, result)
+        return result
+
+    pool = executor or ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        # Each chunk writes disjoint positions of `result`
+        for future in [pool.submit(_verify_mic_group, frames, chunk, result) for chunk in chunks]:
+            future.result()
+    finally:
+        if executor is None:
+            pool.shutdown()
+    return result
 
 
 #MIC for Join Request is calculated using a different method
@@ -70,13 +128,76 @@ def fcnt_to_little_endian_bytes(fcnt: int, Bytes: int) -> bytes:
 
 #NO CBC *Cipher Block CHnainig is done 
 #We formulate the J block in teh CTR encryption mode as per LoRaWAN specification (section 4.3.3)
-#First we encrypt the A block (which is the J block) using ECB mode (each block on its own )
-#Then the result is XORed with the FRMPayload (Padded if needed) to get the decrypted payload
+#All A blocks of a payload are built into one contiguous buffer and encrypted with a single
+#ECB call (each block is still encrypted on its own), then the whole keystream is XORed with the FRMPayload
 #Decrypted[i] = FRMPayload[i] XOR S_block[i]
+#A_i = 0x01 | 4 x 0x00 | Dir | DevAddr | FCnt (4B) | 0x00 | i   (i starts at 1)
+def frm_payload_a_block_head(dev_addr, fcnt: int, direction: int) -> bytes:
+    """First 15 bytes of every A block of one frame (everything except the block counter)."""
+    # Accept int or 4-byte DevAddr
+    if isinstance(dev_addr, int):
+        devaddr_bytes = dev_addr.to_bytes(4, 'little')
+    else:
+        if len(dev_addr) != 4:
+            raise ValueError("dev_addr must be 4 bytes (little-endian) or an int")
+        devaddr_bytes = bytes(dev_addr)
+    return bytes([0x01, 0x00, 0x00, 0x00, 0x00, direction & 0x01]) + devaddr_bytes + \
+        (fcnt & 0xFFFFFFFF).to_bytes(4, 'little') + b'\x00'
+
+
+def crypt_frm_payload_with(encryptor, a_head: bytes, frm_payload: bytes) -> bytes:
+    """AES-CTR over one FRMPayload with a prepared ECB encryptor (encrypt == decrypt)."""
+    payload_len = len(frm_payload)
+    if payload_len == 0:
+        return b""
+    num_blocks = (payload_len + 15) // 16
+    a_blocks = b"".join([a_head + bytes((i & 0xFF,)) for i in range(1, num_blocks + 1)])
+
+    s_blocks = encryptor.update(a_blocks)
+
+    # One XOR over the whole payload (big ints are faster than NumPy at LoRaWAN sizes)
+    return (int.from_bytes(frm_payload, 'big') ^ int.from_bytes(s_blocks[:payload_len], 'big')).to_bytes(payload_len, 'big')
+
+
+def crypt_frm_payload_batch_with(encryptor, a_heads: list[bytes], frm_payloads: list[bytes]) -> list[bytes]:
+    """
+    AES-CTR over many FRMPayloads that use the same key: the A blocks of every frame go
+    through one ECB call and the keystream is XORed with all payloads in one NumPy op.
+    """
+    if not frm_payloads:
+        return []
+    lens = np.fromiter((len(p) for p in frm_payloads), dtype=np.int64, count=len(frm_payloads))
+    blocks_per_frame = (lens + 15) // 16
+    total_blocks = int(blocks_per_frame.sum())
+    if total_blocks == 0:
+        return [b"" for _ in frm_payloads]
+
+    # A blocks: the frame's 15-byte head repeated once per block, then the block counter
+    frame_of_block = np.repeat(np.arange(len(frm_payloads)), blocks_per_frame)
+    first_block = np.cumsum(blocks_per_frame) - blocks_per_frame
+    block_in_frame = np.arange(total_blocks) - first_block[frame_of_block]
+    heads = np.frombuffer(b"".join(a_heads), dtype=np.uint8).reshape(len(a_heads), 15)
+    a_blocks = np.empty((total_blocks, 16), dtype=np.uint8)
+    a_blocks[:, :15] = heads[frame_of_block]
+    a_blocks[:, 15] = (block_in_frame + 1) & 0xFF
+
+    s_blocks = np.frombuffer(encryptor.update(a_blocks.tobytes()), dtype=np.uint8).reshape(total_blocks, 16)
+
+    # Keep only the keystream bytes that cover a payload byte (drops each frame's padding)
+    used = (np.arange(16) + 16 * block_in_frame[:, None]) < lens[frame_of_block][:, None]
+    keystream = s_blocks[used]
+    payloads = np.frombuffer(b"".join(frm_payloads), dtype=np.uint8)
+    out = np.bitwise_xor(payloads, keystream).tobytes()
+
+    ends = np.cumsum(lens).tolist()
+    starts = [0] + ends[:-1]
+    return [out[a:b] for a, b in zip(starts, ends)]
+
+
 def decrypt_frm_payload(app_skey: bytes, nwkskey: bytes, dev_addr: bytes, fcnt: int, direction: int, frm_payload: bytes, Fport: int) -> bytes:
     """
     Decrypts the FRMPayload using AES-CTR mode as per LoRaWAN specification (section 4.3.3),
-    with vectorized XOR via NumPy for better performance.
+    with all A blocks encrypted in one ECB call and a single XOR over the payload.
 
     Args:
         app_skey (bytes): 16-byte session key (AppSKey or NwkSKey).
@@ -96,46 +217,28 @@ def decrypt_frm_payload(app_skey: bytes, nwkskey: bytes, dev_addr: bytes, fcnt:
     else:
         key = app_skey
 
-    # Accept int or 4-byte DevAddr
-    if isinstance(dev_addr, int):
-        devaddr_bytes = dev_addr.to_bytes(4, 'little')
-    else:
-        if len(dev_addr) != 4:
-            raise ValueError("dev_addr must be 4 bytes (little-endian) or an int")
-        devaddr_bytes = dev_addr
-
-    cipher = Cipher(algorithms.AES(key), modes.ECB())
-    encryptor = cipher.encryptor()
-
-    payload_len = len(frm_payload)
-    num_blocks = (payload_len + 15) // 16
-    decrypted = bytearray()
-
-    for i in range(num_blocks):
-        # --- Construct A block (encryption block for AES CTR) ---
-        a_block = bytearray(16)
-        a_block[0] = 0x01
-        a_block[5] = direction & 0x01
-        a_block[6:10] = devaddr_bytes
-        a_block[10:14] = fcnt.to_bytes(2, 'little') + b'\x00\x00'
-        a_block[15] = (i + 1) & 0xFF  # Counter starts at 1
-
-        # --- Encrypt A block to get S block ---
-        s_block = encryptor.update(bytes(a_block))
+    a_head = frm_payload_a_block_head(dev_addr, fcnt, direction)
+    encryptor = Cipher(algorithms.AES(key), modes.ECB()).encryptor()
+    return crypt_frm_payload_with(encryptor, a_head, frm_payload)
 
-        # --- Slice current 16-byte chunk from payload ---
-        start = i * 16
-        end = min(start + 16, payload_len)
-        frm_chunk = frm_payload[start:end]
 
-        # --- XOR using NumPy (vectorized) ---
-        frm_arr = np.frombuffer(frm_chunk, dtype=np.uint8)
-        s_arr = np.frombuffer(s_block, dtype=np.uint8)[:len(frm_chunk)]
+def crypt_frm_payload_batch(key: bytes, frames: list[tuple], direction: int) -> list[bytes]:
+    """
+    Encrypts/decrypts the FRMPayloads of many frames that share one key.
 
-        decrypted_chunk = np.bitwise_xor(frm_arr, s_arr).tobytes()
-        decrypted.extend(decrypted_chunk)
+    Args:
+        key: 16-byte AppSKey (FPort > 0) or NwkSKey (FPort 0).
+        frames: [(dev_addr, fcnt, frm_payload), ...]
+        direction: 0 = uplink, 1 = downlink.
 
-    return bytes(decrypted)
+    Returns:
+        list of payloads in the order of `frames`.
+    """
+    if len(key) != 16:
+        raise ValueError("Key must be 16 bytes")
+    a_heads = [frm_payload_a_block_head(dev_addr, fcnt, direction) for dev_addr, fcnt, _ in frames]
+    encryptor = Cipher(algorithms.AES(key), modes.ECB()).encryptor()
+    return crypt_frm_payload_batch_with(encryptor, a_heads, [payload for _, _, payload in frames])
 
 # This function is used to encrypt FRMPayload messages
 def encrypt_frm_payload(app_skey: bytes, nwkskey: bytes, dev_addr: bytes, fcnt: int, direction: int, frm_payload: bytes, Fport: int) -> bytes:
@@ -1,6 +1,7 @@
 import json
 import sys
 import os
+from core.log import configure_logging
 from uplink_packet_handling.uplink_packet_entry_point import handle_uplink_packet
 #sample_packets:
 #- description: OTAA Join Request (valid MIC, LSB format)
@@ -27,12 +28,14 @@ sample_json = {
             "lsnr": 7.5,
             "rssi": -45,
             "size": 23,
-            "data": "AIh3ZlVEMyIRCAcGBQQDAgESNPILhWc="
+            "data": "AIh3ZlVEMyIRCAcGBQQDAgESNIyDxy8="  # MIC signed with the AppKey of 0807060504030201
         }
     ]
 }
 
 if __name__ == "__main__":
-    handle_uplink_packet(sample_json)
+    configure_logging(level="DEBUG", log_file="")
+    for result in handle_uplink_packet(sample_json):
+        print(result)
 
 
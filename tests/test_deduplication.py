@@ -0,0 +1,104 @@
+import os
+import threading
+import time
+import pytest
+from uplink_packet_handling import deduplication as dedup
+
+WINDOW_S = 0.05
+
+
+@pytest.fixture(autouse=True)
+def short_window(monkeypatch):
+    monkeypatch.setattr(dedup, "DEDUP_WINDOW_S", WINDOW_S)
+    monkeypatch.setattr(dedup, "MIN_KEY_TTL_S", 2 * WINDOW_S)
+    monkeypatch.setattr(dedup, "_pending", {})
+    monkeypatch.setattr(dedup, "_expiry_order", dedup.deque())
+
+
+class Closed:
+    """on_close callback that records every call."""
+
+    def __init__(self):
+        self.calls = []
+        self.event = threading.Event()
+
+    def __call__(self, copies):
+        self.calls.append(copies)
+        self.event.set()
+
+    def wait(self):
+        assert self.event.wait(1.0), "window never closed"
+
+
+def copy_from(gateway, lsnr, rssi, tmst=1000):
+    return {"gateway_mac": gateway, "lsnr": lsnr, "rssi": rssi, "tmst": tmst, "freq": 868.1}
+
+
+def test_copies_within_the_window_close_once():
+    payload, closed = os.urandom(16), Closed()
+    first = copy_from("GW1", 2.0, -90)
+    assert dedup.collect_uplink_copy(payload, first, closed) is not None
+    assert dedup.collect_uplink_copy(payload, copy_from("GW2", 7.5, -80), closed) is None
+    assert dedup.collect_uplink_copy(payload, copy_from("GW3", 7.5, -70), closed) is None
+    closed.wait()
+    time.sleep(WINDOW_S)
+    assert len(closed.calls) == 1
+    assert [copy["gateway_mac"] for copy in closed.calls[0]] == ["GW1", "GW2", "GW3"]
+
+
+def test_merged_metadata_uses_the_best_gateway():
+    payload, closed = os.urandom(16), Closed()
+    first = copy_from("GW1", 2.0, -90, tmst=1)
+    dedup.collect_uplink_copy(payload, first, closed)
+    dedup.collect_uplink_copy(payload, copy_from("GW2", 7.5, -80, tmst=2), closed)
+    dedup.collect_uplink_copy(payload, copy_from("GW3", 7.5, -70, tmst=3), closed)  # same lsnr, better rssi
+    dedup.collect_uplink_copy(payload, copy_from("GW4", None, -30, tmst=4), closed)  # no lsnr ranks last
+    closed.wait()
+    merged = dedup.merge_gateway_metadata(first, closed.calls[0])
+    assert merged is first
+    assert (merged["gateway_mac"], merged["tmst"], merged["rssi"]) == ("GW3", 3, -70)
+    assert [gw["gateway_mac"] for gw in merged["Gateways"]] == ["GW1", "GW2", "GW3", "GW4"]
+
+
+def test_late_copy_is_dropped_until_the_key_is_evicted():
+    payload, closed = os.urandom(16), Closed()
+    dedup.collect_uplink_copy(payload, copy_from("GW1", 2.0, -90), closed)
+    closed.wait()
+    assert dedup.collect_uplink_copy(payload, copy_from("GW2", 9.0, -60), closed) is None
+    assert len(closed.calls[0]) == 1  # the late copy is not added to a closed window
+
+    time.sleep(2 * WINDOW_S + 0.01)
+    again = Closed()
+    assert dedup.collect_uplink_copy(payload, copy_from("GW1", 2.0, -90), again) is not None
+    again.wait()
+    assert len(closed.calls) == 1
+
+
+def test_windows_of_different_frames_wait_concurrently():
+    callbacks = [Closed() for _ in range(8)]
+    started = time.monotonic()
+    for closed in callbacks:
+        dedup.collect_uplink_copy(os.urandom(16), copy_from("GW1", 2.0, -90), closed)
+    for closed in callbacks:
+        closed.wait()
+    assert time.monotonic() - started < 4 * WINDOW_S
+
+
+def test_failing_callback_does_not_stop_the_timer():
+    def broken(copies):
+        raise RuntimeError("boom")
+
+    dedup.collect_uplink_copy(os.urandom(16), copy_from("GW1", 2.0, -90), broken)
+    closed = Closed()
+    dedup.collect_uplink_copy(os.urandom(16), copy_from("GW1", 2.0, -90), closed)
+    closed.wait()
+
+
+def test_zero_window_closes_inline(monkeypatch):
+    monkeypatch.setattr(dedup, "DEDUP_WINDOW_S", 0.0)
+    payload, closed = os.urandom(16), Closed()
+    dedup.collect_uplink_copy(payload, copy_from("GW1", 2.0, -90), closed)
+    assert len(closed.calls) == 1  # before collect_uplink_copy returned
+    time.sleep(WINDOW_S)  # copies still count as duplicates for MIN_KEY_TTL_S
+    assert dedup.collect_uplink_copy(payload, copy_from("GW2", 2.0, -90), closed) is None
+    assert len(closed.calls) == 1
@@ -0,0 +1,129 @@
+import pytest
+from downlink_pkt_handler import downlink_queue as dq
+
+DEV_EUI = "0807060504030201"
+DEV_ADDR = bytes.fromhex("01020304")
+
+
+@pytest.fixture
+def built(monkeypatch):
+    """Empty queues; downlink_pkt_build() replaced by a recorder (no session keys needed)."""
+    frames = []
+
+    def fake_build(mtype, mac_cmds, dev_eui, dev_addr, payload, fport, fctrl_dict):
+        frames.append({"mtype": mtype, "mac_cmds": list(mac_cmds), "payload": payload,
+                       "fport": fport, "fctrl": fctrl_dict})
+        return b"frame-%d" % len(frames)
+
+    monkeypatch.setattr(dq, "_queues", {})
+    monkeypatch.setattr(dq, "downlink_pkt_build", fake_build)
+    return frames
+
+
+def queue_mac(*commands):
+    """Queues (CID, payload hex) pairs as one downlink plan."""
+    dq.enqueue_mac_commands(DEV_EUI, {"Plan": [{"CID": f"0x{cid:02X}", "Payload": payload}
+                                               for cid, payload in commands]})
+
+
+def build(max_payload=51, ack=False):
+    result = dq.build_next_downlink(DEV_EUI, DEV_ADDR, max_payload, ack=ack)
+    return (None, None) if result is None else result
+
+
+def test_nothing_queued_builds_nothing_unless_ack(built):
+    assert build() == (None, None)
+    phy, _ = build(ack=True)
+    assert phy is not None
+    assert built[-1]["mac_cmds"] == [] and built[-1]["payload"] == b""
+    assert built[-1]["fctrl"] == {"ADR": 0, "ACK": 1, "FPending": 0}
+
+
+def test_fopts_take_whole_commands_up_to_15_bytes(built):
+    queue_mac((0x05, "00D2AD84"), (0x07, "0318AD8450"), (0x0A, "0318AD84"))  # 5 + 6 + 5 bytes
+    dq.enqueue_app_payload(DEV_EUI, b"hello", fport=2)
+    build()
+    frame = built[-1]
+    assert [cmd[0] for cmd in frame["mac_cmds"]] == [0x05, 0x07]
+    assert sum(map(len, frame["mac_cmds"])) <= dq.MAX_FOPTS
+    assert (frame["payload"], frame["fport"]) == (b"hello", 2)
+    assert frame["fctrl"]["FPending"] == 1
+    assert dq.pending_downlinks(DEV_EUI) == 1
+
+
+def test_latest_command_per_cid_wins(built):
+    queue_mac((0x03, "50FF0001"))
+    queue_mac((0x03, "53FF0001"))
+    build()
+    assert built[-1]["mac_cmds"] == [bytes.fromhex("0353FF0001")]
+
+
+def test_commands_beyond_fopts_move_to_fport_0_without_app_data(built):
+    queue_mac((0x05, "00D2AD84"), (0x07, "0318AD8450"), (0x0A, "0318AD84"))
+    build()
+    frame = built[-1]
+    # more than 15 bytes and no application payload: downlink_pkt_build puts them in FRMPayload, FPort 0
+    assert [cmd[0] for cmd in frame["mac_cmds"]] == [0x05, 0x07, 0x0A]
+    assert sum(map(len, frame["mac_cmds"])) > dq.MAX_FOPTS
+    assert frame["payload"] == b""
+    assert frame["fctrl"]["FPending"] == 0
+    assert dq.pending_downlinks(DEV_EUI) == 0
+
+
+def test_fport_0_is_bounded_by_the_window(built):
+    queue_mac((0x05, "00D2AD84"), (0x07, "0318AD8450"), (0x0A, "0318AD84"))
+    build(max_payload=11)
+    assert [cmd[0] for cmd in built[-1]["mac_cmds"]] == [0x05, 0x07]
+    assert built[-1]["fctrl"]["FPending"] == 1
+
+
+def test_payload_too_large_for_the_window_stays_queued(built):
+    queue_mac((0x05, "00D2AD84"))
+    dq.enqueue_app_payload(DEV_EUI, b"x" * 51)
+    build(max_payload=51)
+    frame = built[-1]
+    assert frame["payload"] == b"" and len(frame["mac_cmds"]) == 1
+    assert frame["fctrl"]["FPending"] == 1
+    build(max_payload=51)
+    assert built[-1]["payload"] == b"x" * 51
+
+
+def test_confirmed_payload_is_confirmed_data_down(built):
+    dq.enqueue_app_payload(DEV_EUI, b"a", confirmed=True)
+    dq.enqueue_app_payload(DEV_EUI, b"b")
+    build()
+    build()
+    assert [frame["mtype"] for frame in built] == [dq.CONFIRMED_DATA_DOWN, dq.UNCONFIRMED_DATA_DOWN]
+    assert [frame["fctrl"]["FPending"] for frame in built] == [1, 0]
+
+
+def test_requeue_puts_a_dropped_frame_back_in_order(built):
+    queue_mac((0x05, "00D2AD84"), (0x0A, "0318AD84"))
+    dq.enqueue_app_payload(DEV_EUI, b"first")
+    dq.enqueue_app_payload(DEV_EUI, b"second")
+    _, requeue = build()
+    queue_mac((0x07, "0318AD8450"))
+    requeue()
+    build()
+    frame = built[-1]
+    assert [cmd[0] for cmd in frame["mac_cmds"]] == [0x05, 0x0A]
+    assert frame["payload"] == b"first"
+    assert dq.pending_downlinks(DEV_EUI) == 2  # NewChannelReq + "second"
+
+
+def test_requeue_keeps_a_newer_command_with_the_same_cid(built):
+    queue_mac((0x03, "50FF0001"))
+    _, requeue = build()
+    queue_mac((0x03, "53FF0001"))
+    requeue()
+    build()
+    assert built[-1]["mac_cmds"] == [bytes.fromhex("0353FF0001")]
+    assert dq.pending_downlinks(DEV_EUI) == 0
+
+
+def test_requeue_after_rejoin_is_discarded(built):
+    dq.enqueue_app_payload(DEV_EUI, b"old session")
+    _, requeue = build()
+    dq.clear_downlink_queue(DEV_EUI)
+    requeue()
+    assert dq.pending_downlinks(DEV_EUI) == 0
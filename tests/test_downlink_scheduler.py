@@ -0,0 +1,137 @@
+import pytest
+from NS_shim import downlink_scheduler as ds
+
+NOW = 1000.0
+RX1_TMST = 5_000_000
+RX2_TMST = 6_000_000
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    """Captures what the scheduler sends; the duty cycle allows everything unless a test says otherwise."""
+    sent = []
+    monkeypatch.setattr(ds, "_send_fn", lambda down_json, addr: sent.append((down_json, addr)))
+    monkeypatch.setattr(ds, "_heap", [])
+    monkeypatch.setattr(ds, "reserve_airtime", lambda gateway, freq, airtime_us, now: True)
+    return sent
+
+
+def make_job(window="RX1", rx1_in=0.5, rx2_in=1.5, on_drop=None):
+    down_json = {"txpk": {"tmst": RX1_TMST, "freq": 868.1, "datr": "SF7BW125", "size": 20}}
+    return ds.DownlinkJob(down_json, ("10.0.0.1", 1700), "GW1", window, NOW + rx1_in,
+                          RX2_TMST, NOW + rx2_in, on_drop)
+
+
+def queued_jobs():
+    return [job for _, _, job in ds._heap]
+
+
+def test_job_within_its_deadline_is_sent(sent):
+    drops = []
+    job = make_job(on_drop=lambda: drops.append(1))
+    ds._dispatch(job, NOW)
+    assert [down_json for down_json, _ in sent] == [job.down_json]
+    assert job.down_json["txpk"]["tmst"] == RX1_TMST
+    assert drops == []
+
+
+def test_missed_rx1_is_retargeted_to_rx2(sent):
+    job = make_job(rx1_in=-0.01)
+    ds._dispatch(job, NOW)
+    assert sent == []
+    assert queued_jobs() == [job]
+    txpk = job.down_json["txpk"]
+    assert job.window == "RX2"
+    assert (txpk["tmst"], txpk["freq"], txpk["datr"]) == (RX2_TMST, ds.RX2_FREQ, ds.RX2_DATR)
+    assert job.window_local == NOW + 1.5
+
+
+def test_missed_rx2_is_dropped_and_requeued(sent):
+    drops = []
+    job = make_job(rx1_in=-1.0, rx2_in=-0.01, on_drop=lambda: drops.append(1))
+    ds._dispatch(job, NOW)
+    assert sent == []
+    assert queued_jobs() == []
+    assert drops == [1]
+
+
+def test_missed_rx1_without_rx2_is_dropped(sent):
+    drops = []
+    job = ds.DownlinkJob({"txpk": {"tmst": RX1_TMST}}, ("10.0.0.1", 1700), "GW1", "RX1", NOW - 0.01,
+                         on_drop=lambda: drops.append(1))
+    ds._dispatch(job, NOW)
+    assert sent == [] and queued_jobs() == []
+    assert drops == [1]
+
+
+def test_duty_cycle_moves_rx1_job_to_rx2(sent, monkeypatch):
+    monkeypatch.setattr(ds, "reserve_airtime", lambda gateway, freq, airtime_us, now: freq == ds.RX2_FREQ)
+    job = make_job()
+    ds._dispatch(job, NOW)
+    assert sent == []
+    assert queued_jobs() == [job] and job.window == "RX2"
+    ds._dispatch(ds._heap.pop()[2], NOW)
+    assert [down_json for down_json, _ in sent] == [job.down_json]
+
+
+def test_duty_cycle_defers_imme_job_until_allowed(sent, monkeypatch):
+    drops = []
+    monkeypatch.setattr(ds, "reserve_airtime", lambda gateway, freq, airtime_us, now: False)
+    monkeypatch.setattr(ds, "next_allowed", lambda gateway, freq, airtime_us, now: now + 30.0)
+    job = ds.DownlinkJob({"txpk": {"imme": True, "freq": 869.525, "datr": "SF12BW125", "size": 20}},
+                         ("10.0.0.1", 1700), "GW1", "IMME", NOW, on_drop=lambda: drops.append(1))
+    ds._dispatch(job, NOW)
+    assert sent == [] and drops == []
+    assert queued_jobs() == [job]
+    assert job.send_at == pytest.approx(NOW + 30.0)
+
+
+def test_duty_cycle_rejects_imme_job_that_can_never_go_out(sent, monkeypatch):
+    drops = []
+    monkeypatch.setattr(ds, "reserve_airtime", lambda gateway, freq, airtime_us, now: False)
+    monkeypatch.setattr(ds, "next_allowed", lambda gateway, freq, airtime_us, now: float("inf"))
+    job = ds.DownlinkJob({"txpk": {"imme": True, "freq": 869.525, "datr": "SF12BW125", "size": 20}},
+                         ("10.0.0.1", 1700), "GW1", "IMME", NOW, on_drop=lambda: drops.append(1))
+    ds._dispatch(job, NOW)
+    assert sent == [] and queued_jobs() == []
+    assert drops == [1]
+
+
+def test_duty_cycle_rejects_rx2_job(sent, monkeypatch):
+    drops = []
+    monkeypatch.setattr(ds, "reserve_airtime", lambda gateway, freq, airtime_us, now: False)
+    job = make_job(on_drop=lambda: drops.append(1))
+    ds._retarget_rx2(job)
+    ds._dispatch(job, NOW)
+    assert sent == [] and queued_jobs() == []
+    assert drops == [1]
+
+
+def test_send_error_drops_the_job(sent, monkeypatch):
+    drops = []
+
+    def failing_send(down_json, addr):
+        raise OSError("network unreachable")
+
+    monkeypatch.setattr(ds, "_send_fn", failing_send)
+    ds._dispatch(make_job(on_drop=lambda: drops.append(1)), NOW)
+    assert drops == [1]
+
+
+def test_failing_drop_handler_does_not_escape(sent):
+    def broken_requeue():
+        raise RuntimeError("boom")
+
+    ds._dispatch(make_job(rx1_in=-1.0, rx2_in=-0.01, on_drop=broken_requeue), NOW)
+    assert sent == []
+
+
+def test_schedule_downlink_targets_the_window_in_the_txpk(sent):
+    rx_windows = {"recv_clock": NOW, "uplink_tmst": 4_000_000, "rx1_tmst": RX1_TMST, "rx2_tmst": RX2_TMST}
+    ds.schedule_downlink({"txpk": {"tmst": RX1_TMST}}, ("10.0.0.1", 1700), rx_windows, "GW1")
+    ds.schedule_downlink({"txpk": {"tmst": RX2_TMST}}, ("10.0.0.1", 1700), rx_windows, "GW1")
+    jobs = sorted(queued_jobs(), key=lambda job: job.window_local)
+    assert [job.window for job in jobs] == ["RX1", "RX2"]
+    assert jobs[0].window_local == pytest.approx(NOW + 1.0)
+    assert jobs[1].window_local == pytest.approx(NOW + 2.0)
+    assert jobs[1].down_json["txpk"]["freq"] == ds.RX2_FREQ
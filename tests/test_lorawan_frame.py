@@ -0,0 +1,14 @@
+import pytest
+from uplink_packet_handling.protocol_layers.lorawan_frame import LoRaWANFrame
+
+DATA_FRAME_BODY = bytes.fromhex("04030201" "80" "0100" "01" "6869" "00000000")
+
+
+@pytest.mark.parametrize("mtype, name", [
+    (0, "JoinRequest"), (1, "JoinAccept"), (2, "UnconfirmedDataUp"), (3, "UnconfirmedDataDown"),
+    (4, "ConfirmedDataUp"), (5, "ConfirmedDataDown"), (6, "RFU"), (7, "Proprietary"),
+])
+def test_legacy_type_names_every_mtype(mtype, name):
+    frame = LoRaWANFrame(bytes([mtype << 5]) + DATA_FRAME_BODY)
+    assert frame.type_name == name
+    assert frame["Type"] == name
@@ -1,41 +1,53 @@
-from uplink_packet_handling.protocol_layers.application_layer import parse_app_layer
-from features.security import compute_verify_mic
-from uplink_packet_handling.processing.device_registry import get_device_session_keys,get_dev_eui_from_dev_addr
+from uplink_packet_handling.protocol_layers.lorawan_frame import LoRaWANFrame
+from uplink_packet_handling.processing.device_registry import get_device_crypto_context,get_dev_eui_from_dev_addr
+from features.security import verify_mic_batch
+from core.metrics import time_stage
 
-def handle_data_uplink(mtype: int, mhdr: dict, mhdr_byte: bytes, mic: bytes, mac_payload: bytes):
+
+def verify_data_uplink_mics(frames: list[LoRaWANFrame]) -> None:
+    """
+    Verifies the MIC of every data uplink of a batch with one verify_mic_batch() call and
+    stores the verdict in frame.mic_valid (and the resolved frame.dev_eui).
+    Only DevAddr and FCnt are decoded. Joins, short frames, unknown DevAddrs and devices
+    whose session record is unusable keep mic_valid = None, so the per-frame path handles
+    (and reports) them one by one; a bad frame never fails the rest of the batch.
+    """
+    batch, checked = [], []
+    for frame in frames:
+        if not frame.is_data_up or len(frame) < 12:
+            continue
+        try:
+            with time_stage("registry_lookup"):
+                frame.dev_eui = get_dev_eui_from_dev_addr(frame.dev_addr)
+                crypto_ctx = get_device_crypto_context(frame.dev_eui)
+        except Exception:
+            continue  # e.g. no session yet (DevAddr None) or malformed key hex
+        batch.append((crypto_ctx, frame.fcnt, 0, frame.signed_part, frame.mic))
+        checked.append(frame)
+
+    if batch:
+        with time_stage("mic"):
+            verdicts = verify_mic_batch(batch).tolist()
+        for frame, valid in zip(checked, verdicts):
+            frame.mic_valid = valid
+
+
+def handle_data_uplink(frame: LoRaWANFrame) -> LoRaWANFrame:
     """
-    Parses and validates Unconfirmed or Confirmed Data Up packets.
-    Returns a flat dictionary structure.
+    Validates an Unconfirmed or Confirmed Data Up frame (resolves its DevEUI and checks
+    the MIC unless verify_data_uplink_mics() already did) and returns the same frame.
     """
-    
-    app_result = parse_app_layer(mac_payload)
-    devaddr = app_result["FHDR"]["DevAddr"]
-    counter = app_result["FHDR"]["FCnt"]
-    dev_eui=get_dev_eui_from_dev_addr(devaddr)
-    nwk_skey,app_skey= get_device_session_keys(dev_eui)
-    valid = compute_verify_mic(nwk_skey,devaddr,counter,0,mhdr_byte,mac_payload,mic)
-
-    if not valid:
+    if frame.dev_eui is None:
+        with time_stage("registry_lookup"):
+            frame.dev_eui = get_dev_eui_from_dev_addr(frame.dev_addr)
+
+    if frame.mic_valid is None:
+        with time_stage("registry_lookup"):
+            crypto_ctx = get_device_crypto_context(frame.dev_eui)
+        with time_stage("mic"):
+            frame.mic_valid = crypto_ctx.verify_mic(frame.fcnt, 0, frame.signed_part, frame.mic)
+
+    if not frame.mic_valid:
         raise ValueError("❌ Invalid MIC in DataUp")
 
-    mic_value = int.from_bytes(mic, "little") if isinstance(mic, (bytes, bytearray)) else mic
-
-    return {
-        "Type": "UnconfirmedDataUp" if mtype == 2 else "ConfirmedDataUp",
-        "MHDR": mhdr,
-        "MType": mhdr["MType"],
-        "RFU": mhdr["RFU"],
-        "Major": mhdr["Major"],
-        "MIC": mic_value,
-        "DevAddr": app_result["FHDR"]["DevAddr"],
-        "FCtrl": app_result["FHDR"]["FCtrl"],
-        "FCnt": int.from_bytes(app_result["FHDR"]["FCnt"], "little") if isinstance(app_result["FHDR"]["FCnt"], (bytes, bytearray)) else app_result["FHDR"]["FCnt"],
-        "FOpts": app_result["FHDR"]["FOpts"],
-        "FPort": app_result["FPort"],
-        "FRMPayload": app_result["FRMPayload"],
-        "ADR": app_result["FHDR"]["FCtrl"]["ADR"],
-        "ADRACKReq": app_result["FHDR"]["FCtrl"]["ADRACKReq"],
-        "ACK": app_result["FHDR"]["FCtrl"]["ACK"],
-        "ClassB": app_result["FHDR"]["FCtrl"]["ClassB"],
-        "FOptsLen": app_result["FHDR"]["FCtrl"]["FOptsLen"]
-    }
+    return frame
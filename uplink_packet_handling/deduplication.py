@@ -0,0 +1,169 @@
+import time
+import heapq
+import hashlib
+import itertools
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+from core.log import get_logger
+from core.metrics import inc, register_gauge
+
+# Cross-gateway uplink deduplication.
+# When several gateways hear the same frame, every copy has the same PHYPayload.
+# The first copy opens a collection window (DEDUP_WINDOW_S); copies arriving inside it
+# only add their gateway metadata. After the window the first copy is processed once,
+# with the metadata of every gateway attached, and routed through the best gateway.
+# Keys stay known for one more window (at least MIN_KEY_TTL_S, so a window of 0 still drops
+# duplicates) so late copies are dropped as well; since every entry lives the same time
+# they expire in insertion order (deque → O(1) eviction).
+#
+# Nothing sleeps on the uplink workers: the first copy registers an on_close callback and
+# returns. A timer thread keeps the open windows in a heap ordered by closing time (like
+# the downlink scheduler) and, when a window closes, hands on_close(copies) to a small
+# pool of dispatch threads. The frames of one PUSH_DATA therefore wait on their windows
+# concurrently, and a worker is free again as soon as its frames are registered.
+#
+# CFG keys (all optional):
+#   DEDUP_WINDOW_MS   200   collection window (0: no waiting, copies are still dropped)
+#   DEDUP_WORKERS     4     threads running the uplinks whose window closed
+
+DEDUP_WINDOW_S = 0.2
+DEDUP_WORKERS = 4
+MIN_KEY_TTL_S = 1.0
+
+log = get_logger(__name__)
+
+_pending: dict[bytes, dict] = {}
+_expiry_order: deque = deque()  # (evict_at, key) in insertion order
+_lock = threading.Lock()
+
+# Open windows: (closes_at, seq, entry), served by the timer thread
+_heap: list = []
+_cond = threading.Condition()
+_seq = itertools.count()
+_timer: threading.Thread | None = None
+_executor: ThreadPoolExecutor | None = None
+
+# Per-gateway fields kept for every copy
+GATEWAY_FIELDS = ("gateway_mac", "rssi", "lsnr", "tmst", "time", "freq", "chan", "rfch")
+
+
+def configure_dedup_window(window_ms: float, workers: int = 4) -> None:
+    """
+    Sets the collection window in milliseconds (0 disables waiting, copies are still dropped)
+    and the number of dispatch threads (applies before the first window opens).
+    """
+    global DEDUP_WINDOW_S, DEDUP_WORKERS
+    DEDUP_WINDOW_S = max(0.0, float(window_ms) / 1000.0)
+    DEDUP_WORKERS = max(1, int(workers))
+
+
+def _ensure_timer() -> None:
+    global _timer, _executor
+    if _timer is not None:
+        return
+    with _cond:
+        if _timer is None:
+            _executor = ThreadPoolExecutor(max_workers=DEDUP_WORKERS, thread_name_prefix="uplink-dedup")
+            register_gauge("uplink_dedup_open_windows", lambda: len(_heap))
+            _timer = threading.Thread(target=_timer_loop, name="uplink-dedup-timer", daemon=True)
+            _timer.start()
+
+
+def _evict_expired(now: float) -> None:
+    while _expiry_order and _expiry_order[0][0] <= now:
+        _, key = _expiry_order.popleft()
+        _pending.pop(key, None)
+
+
+def collect_uplink_copy(phy_payload: bytes, meta_data: dict,
+                        on_close: Callable[[list[dict]], None]) -> dict | None:
+    """
+    Registers one received copy of a frame.
+
+    Args:
+        on_close: called once with the metadata of every copy when the window of the
+                  first copy closes (from a dispatch thread; inline if the window is 0)
+
+    Returns:
+        The dedup entry if this is the first copy (the caller owns processing),
+        None if it is a duplicate (its metadata was attached to the first copy).
+    """
+    now = time.monotonic()
+    key = hashlib.blake2b(phy_payload, digest_size=16).digest()
+
+    with _lock:
+        _evict_expired(now)
+        entry = _pending.get(key)
+        if entry is None:
+            entry = {"closes_at": now + DEDUP_WINDOW_S, "copies": [meta_data], "closed": False,
+                     "on_close": on_close}
+            _pending[key] = entry
+            _expiry_order.append((now + max(2 * DEDUP_WINDOW_S, MIN_KEY_TTL_S), key))
+        elif not entry["closed"]:
+            entry["copies"].append(meta_data)
+            entry = None
+        else:
+            entry = None
+
+    if entry is None:
+        inc("uplink_duplicates_total")
+        return None
+
+    if DEDUP_WINDOW_S <= 0:
+        on_close(_close(entry))
+    else:
+        _ensure_timer()
+        with _cond:
+            heapq.heappush(_heap, (entry["closes_at"], next(_seq), entry))
+            _cond.notify()
+    return entry
+
+
+def _close(entry: dict) -> list[dict]:
+    """Closes the entry's window; returns the metadata of every copy."""
+    with _lock:
+        entry["closed"] = True
+        return list(entry["copies"])
+
+
+def _timer_loop() -> None:
+    while True:
+        with _cond:
+            while not _heap:
+                _cond.wait()
+            closes_at, _, entry = _heap[0]
+            wait_s = closes_at - time.monotonic()
+            if wait_s > 0:
+                _cond.wait(wait_s)  # a window closing earlier may be pushed meanwhile
+                continue
+            heapq.heappop(_heap)
+        _executor.submit(_run_on_close, entry["on_close"], _close(entry))
+
+
+def _run_on_close(on_close: Callable[[list[dict]], None], copies: list[dict]) -> None:
+    try:
+        on_close(copies)
+    except Exception as e:
+        log.error("[NS] Uplink dispatch after dedup failed: %s", e)
+
+
+def merge_gateway_metadata(meta_data: dict, copies: list[dict]) -> dict:
+    """
+    Updates `meta_data` (the first copy) in place with the radio metadata of the best
+    gateway (highest lsnr, then rssi) and attaches every gateway under "Gateways".
+    The downlink then uses the best gateway's tmst / DLSettings and route.
+    """
+    def link_quality(meta: dict):
+        lsnr = meta.get("lsnr")
+        rssi = meta.get("rssi")
+        return (lsnr if lsnr is not None else float("-inf"),
+                rssi if rssi is not None else float("-inf"))
+
+    best = max(copies, key=link_quality)
+    gateways = [{field: copy.get(field) for field in GATEWAY_FIELDS} for copy in copies]
+    if best is not meta_data:
+        meta_data.update(best)
+    meta_data["Gateways"] = gateways
+    return meta_data
@@ -1,51 +1,87 @@
-from uplink_packet_handling.join_request_parser import parse_join_request
+import time
+from uplink_packet_handling.protocol_layers.lorawan_frame import LoRaWANFrame
 from uplink_packet_handling.data_uplink_handler import handle_data_uplink
 from uplink_packet_handling.uplink_mac_cmd_handler.mac_cmd_processing import process_mac_commands
 from downlink_pkt_handler.join_accept_handling.join_accept_generator import generate_join_accept_fullframe
 from features.NewSKey_AppSKey_generation import generate_session_keys
-from uplink_packet_handling.processing.device_registry import initialize_device_yaml,update_device_yaml_with_session_keys, update_device_yaml_settings_from_mac_cmds, get_dev_eui_from_dev_addr,update_network_server_yaml_file,add_metadata_to_device_yaml, get_meta_data_from_device_yaml
+from uplink_packet_handling.processing.device_registry import initialize_device_yaml,update_device_yaml_with_session_keys, update_device_yaml_settings_from_mac_cmds, update_network_server_yaml_file,add_metadata_to_device_yaml, get_meta_data_from_device_yaml
 from downlink_pkt_handler.downlink_mac_cmd_builder.mac_cmd_responses import build_downlink_plan_from_uplink
-from features.acknowedgment import send_acknowledgment
+from downlink_pkt_handler.downlink_queue import enqueue_mac_commands, build_next_downlink, max_frm_payload, clear_downlink_queue, pending_downlinks
+from features.adr import record_uplink, evaluate_adr
+from features.join_guard import verify_join_request, admit_join
 from NS_shim.time_stamp     import decide_receive_window
+from features.airtime import airtime_us
 from NS_shim.downlink_json_obj_generator import downlink_wrap_pkt_into_json
-def parse_lorawan_packet_by_type(mtype: int, Packet_data: bytes,mhdr, mhdr_byte: dict, mac_payload: bytes, mic: bytes, meta_data: dict):
+from NS_shim import downlink_scheduler
+from NS_shim.class_c_downlink import is_class_c, send_class_c_downlinks, delay_after_class_a_reply
+from core.log import get_logger
+from core.metrics import time_stage
+
+log = get_logger(__name__)
+def parse_lorawan_packet_by_type(frame: LoRaWANFrame, meta_data: dict):
+    mtype = frame.mtype
     
     if mtype == 0:
-        parsed_frame=parse_join_request(Packet_data)
-        dev_eui = parsed_frame["DevEUI"]
-        app_eui = parsed_frame["AppEUI"]
-        dev_nonce = parsed_frame["DevNonce"]
+        dev_eui = frame.dev_eui
+        app_eui = frame.app_eui
+        dev_nonce = frame.dev_nonce
+        # Authentic (MIC checked by the entry point, or here) and within the join rate limits
+        reason = verify_join_request(frame) if frame.mic_valid is None else None
+        if reason is None:
+            reason = admit_join(dev_eui, meta_data.get("gateway_mac"))
+        if reason is not None:
+            raise ValueError(f"❌ Join-Request rejected: {reason}")
         initialize_device_yaml(dev_eui, app_eui, dev_nonce)
         add_metadata_to_device_yaml(dev_eui,meta_data)
-        join_accept_packet=generate_join_accept_fullframe(dev_eui)
-        nwk_skey,app_skey=generate_session_keys(dev_eui)
+        with time_stage("downlink_build"):
+            join_accept_packet=generate_join_accept_fullframe(dev_eui)
+        with time_stage("session_keys"):
+            nwk_skey,app_skey=generate_session_keys(dev_eui)
         update_device_yaml_with_session_keys(dev_eui, nwk_skey, app_skey)
+        clear_downlink_queue(dev_eui)  # commands queued for the old session are void
         freq, rfch, powe,modu, datr, codr, ipol, NS_tmst, rx1_tmst, rx2_tmst = get_meta_data_from_device_yaml(meta_data)
         NS_tmst=meta_data["recv_clock"]
-        dl_tmst=decide_receive_window(NS_tmst, rx1_tmst, rx2_tmst,)
-        downlink_json = downlink_wrap_pkt_into_json(join_accept_packet,freq,rfch,powe,modu,datr,codr,ipol,dl_tmst)
-        print(downlink_json)
+        dl_tmst=decide_receive_window(NS_tmst, rx1_tmst, rx2_tmst, airtime_us(datr, "4/5", len(join_accept_packet)))
+        with time_stage("downlink_build"):
+            downlink_json = downlink_wrap_pkt_into_json(join_accept_packet,freq,rfch,powe,modu,datr,codr,ipol,dl_tmst)
+        log.debug("Join Accept downlink: %s", downlink_json)
         return downlink_json
         
 
     elif mtype in [2, 4]:
-        parsed_frame=handle_data_uplink(mtype, mhdr, mhdr_byte, mic, mac_payload)
-        dev_addr=parsed_frame["DevAddr"]
+        frame=handle_data_uplink(frame)
+        dev_eui=frame.dev_eui
         add_metadata_to_device_yaml(dev_eui,meta_data)
-        dev_eui= get_dev_eui_from_dev_addr(dev_addr)
-        mac_cmd_dict=process_mac_commands(parsed_frame,dev_eui)
-        settings_dict=build_downlink_plan_from_uplink(mac_cmd_dict)
-        freq, rfch, powe,modu, datr, codr, ipol, NS_tmst, rx1_tmst, rx2_tmst = get_meta_data_from_device_yaml(meta_data)
-        NS_tmst=meta_data["recv_clock"]
-        dl_tmst=decide_receive_window(NS_tmst, rx1_tmst, rx2_tmst,)
-        downlink_json = downlink_wrap_pkt_into_json(final_downlink_pkt_base64,freq,rfch,powe,modu,datr,codr,ipol,dl_tmst)
+        record_uplink(dev_eui, meta_data.get("lsnr"), meta_data.get("rssi"), meta_data.get("datr"), frame.adr)
+        with time_stage("mac_commands"):
+            mac_cmd_dict=process_mac_commands(frame,dev_eui)
+            # process_mac_commands returns a status dict when the frame carries no MAC commands
+            settings_dict=build_downlink_plan_from_uplink(mac_cmd_dict if isinstance(mac_cmd_dict, list) else [])
+        with time_stage("adr"):
+            for key, jobs in evaluate_adr([dev_eui]).get(dev_eui, {}).items():
+                settings_dict.setdefault(key, []).extend(jobs)
         update_device_yaml_settings_from_mac_cmds(dev_eui, settings_dict)
-        #confirmed_data_up_packet need to send an acknowledgment
+        enqueue_mac_commands(dev_eui, settings_dict)
 
-        ###### TODO: need to adjsut thsi for teh json builder and the output packet
-        if mtype ==4 :
-            #need to give it the values needed to construct the ack msg
-            send_acknowledgment(settings_dict) #fucntion used to send the acknowledgment in RX1 or RX2 window
+        freq, rfch, powe,modu, datr, codr, ipol, NS_tmst, rx1_tmst, rx2_tmst = get_meta_data_from_device_yaml(meta_data)
+        # One frame per receive window: pending MAC commands + app payload, ACK for ConfirmedDataUp.
+        # It must also fit RX2, where the scheduler may move it.
+        with time_stage("downlink_build"):
+            max_payload = min(max_frm_payload(datr), max_frm_payload(downlink_scheduler.RX2_DATR))
+            built = build_next_downlink(dev_eui, frame.dev_addr, max_payload, ack=(mtype == 4), adr=bool(frame.adr))
+        if built is None:
+            return None
+        downlink_pkt, meta_data["on_downlink_drop"] = built  # the scheduler requeues a dropped frame
+
+        NS_tmst=meta_data["recv_clock"]
+        dl_tmst=decide_receive_window(NS_tmst, rx1_tmst, rx2_tmst, airtime_us(datr, "4/5", len(downlink_pkt)))
+        with time_stage("downlink_build"):
+            downlink_json = downlink_wrap_pkt_into_json(downlink_pkt,freq,rfch,powe,modu,datr,codr,ipol,dl_tmst)
+        log.debug("Data downlink: %s", downlink_json)
+        if pending_downlinks(dev_eui) and is_class_c(dev_eui):
+            # Class C: the rest does not wait for the next uplink, only for this reply's RX2 window
+            send_class_c_downlinks(dev_eui, delay_after_class_a_reply(meta_data, len(downlink_pkt), time.perf_counter()))
+        return downlink_json
 
     else:
         raise ValueError(f"Unsupported or unexpected MType for uplink: {mtype}")
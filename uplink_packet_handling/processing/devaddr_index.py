@@ -0,0 +1,131 @@
+import time
+import threading
+from collections import OrderedDict
+from uplink_packet_handling.processing.registry_backends import get_registry_backend
+
+# In-memory DevAddr -> DevEUI index.
+# Data uplinks only carry the DevAddr, so every one of them resolves it here. The whole
+# mapping is loaded from the registry backend once (at startup or on first use); joins
+# add entries incrementally and persist them append-only through the backend.
+# Keys are uppercase hex in LSB/on-air order (what the join stores), values uppercase DevEUI.
+#
+# Reads are lock-free (a single dict.get on the current _index is atomic). Every write
+# takes _lock: inserts by joins and backend hits, and load_devaddr_index(), which replaces
+# the whole dict, so an insert never lands in a dict a reload has just thrown away.
+# A miss falls back to the backend once, so mappings written by another worker process
+# (REUSEPORT mode) are still found and then cached.
+# Misses are remembered too: DevAddrs of foreign networks / unjoined devices are normal
+# traffic on a shared gateway, and with the YAML backend every backend lookup re-parses
+# the mapping file. A miss stays cached for MISS_TTL_S (at most MISS_CACHE_SIZE DevAddrs,
+# oldest dropped first); add_devaddr_mapping() drops the DevAddr from it at once. A mapping
+# written by another worker process is therefore found at most MISS_TTL_S late.
+#
+# CFG keys (all optional):
+#   DEVADDR_MISS_TTL_S       30     how long an unknown DevAddr is not looked up again
+#   DEVADDR_MISS_CACHE_SIZE  4096   unknown DevAddrs remembered
+
+DEFAULT_MAPPING_PATH = "config/DevAddrToDevEUI.yaml"
+
+MISS_TTL_S = 30.0
+MISS_CACHE_SIZE = 4096
+
+_index: dict[str, str] = {}
+_misses: OrderedDict = OrderedDict()  # dev_addr -> expires_at (monotonic), insertion order
+_loaded_from: str | None = None
+_lock = threading.Lock()
+
+
+def configure_devaddr_miss_cache(ttl_s: float = 30, max_entries: int = 4096) -> None:
+    """Sets how long and how many unknown DevAddrs are remembered (ttl 0 disables the cache)."""
+    global MISS_TTL_S, MISS_CACHE_SIZE
+    MISS_TTL_S = max(0.0, float(ttl_s))
+    MISS_CACHE_SIZE = max(1, int(max_entries))
+    with _lock:
+        _misses.clear()
+
+
+def normalize_dev_addr(dev_addr) -> str:
+    """
+    DevAddr as uppercase hex in LSB/on-air order.
+    Accepts the hex string stored at join, raw bytes, or the int parsed from FHDR (Int32ul).
+    """
+    if isinstance(dev_addr, int):
+        return dev_addr.to_bytes(4, "little").hex().upper()
+    if isinstance(dev_addr, (bytes, bytearray)):
+        return bytes(dev_addr).hex().upper()
+    return str(dev_addr).upper()
+
+
+def load_devaddr_index(mapping_path: str = DEFAULT_MAPPING_PATH) -> int:
+    """(Re)loads the whole mapping from the registry backend; returns the number of entries."""
+    global _index, _loaded_from
+    try:
+        mapping = get_registry_backend().load_devaddr_map(mapping_path)
+    except FileNotFoundError:
+        mapping = {}
+    with _lock:
+        _index = dict(mapping)
+        _misses.clear()
+        _loaded_from = mapping_path
+    return len(mapping)
+
+
+def _ensure_loaded(mapping_path: str) -> None:
+    if _loaded_from != mapping_path:
+        load_devaddr_index(mapping_path)
+
+
+def lookup_dev_eui(dev_addr, mapping_path: str = DEFAULT_MAPPING_PATH) -> str | None:
+    """Returns the DevEUI of `dev_addr`, or None if it is not mapped."""
+    _ensure_loaded(mapping_path)
+    dev_addr = normalize_dev_addr(dev_addr)
+
+    dev_eui = _index.get(dev_addr)
+    if dev_eui is not None:
+        return dev_eui
+
+    now = time.monotonic()
+    expires_at = _misses.get(dev_addr)
+    if expires_at is not None and now < expires_at:
+        return None
+
+    try:
+        dev_eui = get_registry_backend().lookup_devaddr(dev_addr, mapping_path)
+    except FileNotFoundError:
+        dev_eui = None
+    if dev_eui is not None:
+        with _lock:
+            dev_eui = _index.setdefault(dev_addr, dev_eui)  # a join meanwhile wins
+    else:
+        _remember_miss(dev_addr, now)
+    return dev_eui
+
+
+def _remember_miss(dev_addr: str, now: float) -> None:
+    if MISS_TTL_S <= 0:
+        return
+    with _lock:
+        if dev_addr in _index:
+            return  # mapped meanwhile by a join
+        _misses[dev_addr] = now + MISS_TTL_S
+        _misses.move_to_end(dev_addr)
+        while len(_misses) > MISS_CACHE_SIZE:
+            _misses.popitem(last=False)
+
+
+def add_devaddr_mapping(dev_addr, dev_eui: str, mapping_path: str = DEFAULT_MAPPING_PATH) -> None:
+    """Persists one mapping (append-only) and makes it visible to lookups."""
+    _ensure_loaded(mapping_path)
+    dev_addr = normalize_dev_addr(dev_addr)
+    dev_eui = dev_eui.upper()
+
+    with _lock:
+        if _index.get(dev_addr) == dev_eui:
+            return  # already persisted, nothing to append
+        get_registry_backend().store_devaddr_mapping(dev_addr, dev_eui, mapping_path)
+        _index[dev_addr] = dev_eui
+        _misses.pop(dev_addr, None)
+
+
+def get_devaddr_index_size() -> int:
+    return len(_index)
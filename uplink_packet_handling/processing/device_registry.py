@@ -1,6 +1,20 @@
 import os
 import yaml
 from datetime import datetime
+from uplink_packet_handling.processing.session_store import load_device, evict_device, locked_device
+from uplink_packet_handling.processing.registry_backends import get_registry_backend
+from uplink_packet_handling.processing.devaddr_index import lookup_dev_eui, add_devaddr_mapping, normalize_dev_addr
+from features.crypto_context import create_crypto_context, get_crypto_context, evict_crypto_context
+from features.airtime import parse_datr
+from core.log import get_logger
+
+log = get_logger(__name__)
+
+# Device records (device_config/device_<DevEUI>.yaml) are served by the in-memory session
+# store: the record is loaded once, later reads/writes hit memory and changes are flushed
+# in batches by the store's background flusher.
+# Persistence goes through the pluggable registry backend (registry_backends.py):
+# the YAML files by default, or SQLite (sqlite_registry.py).
 
 def initialize_device_yaml(dev_eui, app_eui, dev_nonce, output_dir="device_config"):
     """
@@ -10,26 +24,11 @@ def initialize_device_yaml(dev_eui, app_eui, dev_nonce, output_dir="device_confi
     os.makedirs(output_dir, exist_ok=True)
     yaml_path = os.path.join(output_dir, f"device_{dev_eui}.yaml")
 
-    device_data = {}
-
-    if os.path.exists(yaml_path):
-        with open(yaml_path, "r") as f:
-            device_data = yaml.safe_load(f) or {}
-
-        if "DevNonces" not in device_data:
-            device_data["DevNonces"] = []
-
-        if dev_nonce in device_data["DevNonces"]:
-            raise ValueError(f"❌ Duplicate DevNonce '{dev_nonce}' for DevEUI {dev_eui}")
-
-        device_data["DevNonces"].append(dev_nonce)
-
-    else:
-        # New device
-        device_data = {
+    def new_device():
+        return {
             "DevEUI": dev_eui,
             "AppEUI": app_eui,
-            "DevNonces": [dev_nonce],
+            "DevNonces": [],
             "JoinStatus": "Pending",
             "DevAddr": None,
             "AppSKey": None,
@@ -49,12 +48,17 @@ def initialize_device_yaml(dev_eui, app_eui, dev_nonce, output_dir="device_confi
             "Features": {}
         }
 
-    device_data["LastUpdated"] = datetime.utcnow().isoformat() + "Z"
+    with locked_device(dev_eui, output_dir, default=new_device) as device_data:
+        if "DevNonces" not in device_data:
+            device_data["DevNonces"] = []
+
+        if dev_nonce in device_data["DevNonces"]:
+            raise ValueError(f"❌ Duplicate DevNonce '{dev_nonce}' for DevEUI {dev_eui}")
 
-    with open(yaml_path, "w") as f:
-        yaml.dump(device_data, f, sort_keys=False)
+        device_data["DevNonces"].append(dev_nonce)
+        device_data["LastUpdated"] = datetime.utcnow().isoformat() + "Z"
 
-    print(f"✅ Initialized device YAML: {yaml_path}")
+    log.info("✅ Initialized device YAML: %s", yaml_path)
 
 
 def update_device_yaml_with_join_parameters(dev_eui, params, output_dir="device_config"):
@@ -67,15 +71,7 @@ def update_device_yaml_with_join_parameters(dev_eui, params, output_dir="device_
       - RxDelay:    int
       - CFList:     list of 16 bytes as uppercase hex strings (unchanged)
     """
-    import os, yaml
-    from datetime import datetime
-
     yaml_path = os.path.join(output_dir, f"device_{dev_eui}.yaml")
-    if not os.path.exists(yaml_path):
-        raise FileNotFoundError(f"❌ Device YAML for {dev_eui} not found at {yaml_path}")
-
-    with open(yaml_path, "r", encoding="utf-8") as f:
-        device_data = yaml.safe_load(f) or {}
 
     # ---- Normalize incoming fields ----
     # AppNonce can come as int (your generator) or bytes; store as DECIMAL INT
@@ -112,20 +108,21 @@ def update_device_yaml_with_join_parameters(dev_eui, params, output_dir="device_
         cflist_list = [f"{int(b)&0xFF:02X}" for b in cflist_bytes]
 
     # ---- Write back in the canonical formats your other functions expect ----
-    device_data.update({
-        "AppNonce": app_nonce_int,          # DECIMAL INT
-        "DevAddr": devaddr_hex,             # HEX STRING (LSB/on-air)
-        "NetID": netid_int,                 # DECIMAL INT
-        "DLSettings": int(params["DLSettings"]),
-        "RxDelay": int(params["RxDelay"]),
-        "CFList": cflist_list,              # list of 16 hex bytes as strings
-        "LastUpdated": datetime.utcnow().isoformat() + "Z",
-    })
-
-    with open(yaml_path, "w", encoding="utf-8") as f:
-        yaml.dump(device_data, f, sort_keys=False)
-
-    print(f"✅ Device YAML updated with join parameters: {yaml_path}")
+    with locked_device(dev_eui, output_dir) as device_data:
+        if device_data is None:
+            raise FileNotFoundError(f"❌ Device YAML for {dev_eui} not found at {yaml_path}")
+
+        device_data.update({
+            "AppNonce": app_nonce_int,          # DECIMAL INT
+            "DevAddr": devaddr_hex,             # HEX STRING (LSB/on-air)
+            "NetID": netid_int,                 # DECIMAL INT
+            "DLSettings": int(params["DLSettings"]),
+            "RxDelay": int(params["RxDelay"]),
+            "CFList": cflist_list,              # list of 16 hex bytes as strings
+            "LastUpdated": datetime.utcnow().isoformat() + "Z",
+        })
+
+    log.info("✅ Device YAML updated with join parameters: %s", yaml_path)
 
 def update_device_yaml_with_session_keys(dev_eui, nwk_skey, app_skey, output_dir="device_config"):
     """
@@ -133,50 +130,72 @@ def update_device_yaml_with_session_keys(dev_eui, nwk_skey, app_skey, output_dir
     All fields are stored at the top level of the YAML.
     """
     yaml_path = os.path.join(output_dir, f"device_{dev_eui}.yaml")
+    with locked_device(dev_eui, output_dir) as device_data:
+        if device_data is None:
+            raise FileNotFoundError(f"❌ Device YAML for {dev_eui} not found at {yaml_path}")
+
+        device_data.update({
+            "NwkSKey": nwk_skey.hex().upper(),
+            "AppSKey": app_skey.hex().upper(),
+            "JoinStatus": "Accepted",
+            "FCntUp": 0,
+            "FCntDown": 0,
+            "LastUpdated": datetime.utcnow().isoformat() + "Z"
+        })
+        dev_addr = device_data.get("DevAddr")
 
-    if not os.path.exists(yaml_path):
-        raise FileNotFoundError(f"❌ Device YAML for {dev_eui} not found at {yaml_path}")
-
-    with open(yaml_path, "r") as f:
-        device_data = yaml.safe_load(f) or {}
-
-    device_data.update({
-        "NwkSKey": nwk_skey.hex().upper(),
-        "AppSKey": app_skey.hex().upper(),
-        "JoinStatus": "Accepted",
-        "FCntUp": 0,
-        "FCntDown": 0,
-        "LastUpdated": datetime.utcnow().isoformat() + "Z"
-    })
-
-    with open(yaml_path, "w") as f:
-        yaml.dump(device_data, f, sort_keys=False)
+    create_crypto_context(dev_eui, dev_addr, nwk_skey, app_skey)
 
-    print(f"✅ Device YAML updated with session keys: {yaml_path}")
+    log.info("✅ Device YAML updated with session keys: %s", yaml_path)
 
 
 #This fucntion is used only to update the device settings if its required by the mac command
 def update_device_yaml_settings_from_mac_cmds(dev_eui, settings_dict, output_dir="device_config"):
     yaml_path = os.path.join(output_dir, f"device_{dev_eui}.yaml")
+    with locked_device(dev_eui, output_dir) as device_data:
+        if device_data is None:
+            raise FileNotFoundError(f"YAML for {dev_eui} not found.")
+
+        device_data.setdefault("DeviceSettings", {})
+
+        # Apply updates
+        for key, value in settings_dict.items():
+            device_data["DeviceSettings"][key] = value
 
-    if not os.path.exists(yaml_path):
-        raise FileNotFoundError(f"YAML for {dev_eui} not found.")
+        device_data["LastUpdated"] = datetime.utcnow().isoformat() + "Z"
 
-    with open(yaml_path, "r") as f:
-        device_data = yaml.safe_load(f) or {}
+    log.debug("✅ Device settings updated: %s", yaml_path)
 
-    device_data.setdefault("DeviceSettings", {})
 
-    # Apply updates
-    for key, value in settings_dict.items():
-        device_data["DeviceSettings"][key] = value
+def get_and_increment_fcnt_downlink(dev_eui, output_dir="device_config"):
+    """Returns the FCntDown for the next downlink and stores FCntDown + 1 (atomically)."""
+    with locked_device(dev_eui, output_dir) as device_data:
+        if device_data is None:
+            raise FileNotFoundError(f"❌ Device YAML for {dev_eui} not found.")
 
-    device_data["LastUpdated"] = datetime.utcnow().isoformat() + "Z"
+        fcnt_down = device_data.get("FCntDown", 0)
+        device_data["FCntDown"] = fcnt_down + 1
+    return fcnt_down
 
-    with open(yaml_path, "w") as f:
-        yaml.dump(device_data, f, sort_keys=False)
 
-    print(f"✅ Device settings updated: {yaml_path}")
+def get_device_class(dev_eui, output_dir="device_config"):
+    """LoRaWAN class of the device ("A" unless set_device_class() changed it; None if unknown)."""
+    device_data = load_device(dev_eui, output_dir)
+    if device_data is None:
+        return None
+    return device_data.get("DeviceClass", "A")
+
+
+def set_device_class(dev_eui, device_class, output_dir="device_config"):
+    """Stores the device's LoRaWAN class ("A" or "C")."""
+    device_class = str(device_class).upper()
+    if device_class not in ("A", "C"):
+        raise ValueError(f"❌ Unsupported device class '{device_class}' for DevEUI {dev_eui}")
+    with locked_device(dev_eui, output_dir) as device_data:
+        if device_data is None:
+            raise FileNotFoundError(f"❌ Device YAML for {dev_eui} not found.")
+
+        device_data["DeviceClass"] = device_class
 
 
 #need to be added after the parsing of a data up packet
@@ -187,37 +206,28 @@ def validate_and_update_fcnt_up(dev_eui, incoming_fcnt, output_dir="device_confi
     Returns True if accepted, False if rejected.
     """
     yaml_path = os.path.join(output_dir, f"device_{dev_eui}.yaml")
+    with locked_device(dev_eui, output_dir) as device_data:
+        if device_data is None:
+            raise FileNotFoundError(f"❌ Device YAML for {dev_eui} not found.")
 
-    if not os.path.exists(yaml_path):
-        raise FileNotFoundError(f"❌ Device YAML for {dev_eui} not found.")
-
-    with open(yaml_path, "r") as f:
-        device_data = yaml.safe_load(f) or {}
+        stored_fcnt = device_data.get("FCntUp", 0)
 
-    stored_fcnt = device_data.get("FCntUp", 0)
+        # Check: new FCnt must be strictly greater
+        accepted = incoming_fcnt > stored_fcnt
+        if accepted:
+            device_data["FCntUp"] = incoming_fcnt
 
-    # Check: new FCnt must be strictly greater
-    if incoming_fcnt > stored_fcnt:
-        device_data["FCntUp"] = incoming_fcnt
-        with open(yaml_path, "w") as f:
-            yaml.dump(device_data, f, sort_keys=False)
-        print(f"✅ FCntUp updated: {stored_fcnt} → {incoming_fcnt}")
+    if accepted:
+        log.debug("✅ FCntUp updated: %s → %s", stored_fcnt, incoming_fcnt)
         return True
     else:
-        print(f"❌ Invalid FCntUp: {incoming_fcnt} ≤ stored {stored_fcnt}")
+        log.warning("❌ Invalid FCntUp: %s ≤ stored %s", incoming_fcnt, stored_fcnt)
         return False
 
 
 def get_app_key(dev_eui,config_path="config/network_server_device_config.yaml"):
 
-    if not os.path.exists(config_path):
-        raise FileNotFoundError(f"❌ Registry file not found: {config_path}")
-
-    with open(config_path, "r") as f:
-        registry = yaml.safe_load(f)
-
-    devices = registry.get("devices_eui", {})
-    dev_info = devices.get(dev_eui.upper()) #returns the values if it finds it else returns none
+    dev_info = get_registry_backend().load_registry_entry(dev_eui, config_path) #returns the values if it finds it else returns none
 
     if not dev_info:
         raise ValueError(f"❌ DevEUI {dev_eui} not found in device registry.")
@@ -243,13 +253,11 @@ def get_appnonce_netid_devnonce(dev_eui: str, yaml_dir="device_config") -> tuple
         Tuple of (AppNonce, NetID, DevNonce) all as bytes
     """
     yaml_path = os.path.join(yaml_dir, f"device_{dev_eui}.yaml")
+    device_data = load_device(dev_eui, yaml_dir)
 
-    if not os.path.exists(yaml_path):
+    if device_data is None:
         raise FileNotFoundError(f"❌ YAML file for {dev_eui} not found at {yaml_path}")
 
-    with open(yaml_path, "r", encoding="utf-8") as f:
-        device_data = yaml.safe_load(f)
-
     try:
         # Convert AppNonce from decimal string to 3-byte little-endian
         app_nonce = int(device_data["AppNonce"]).to_bytes(3, "little")
@@ -282,14 +290,7 @@ def get_network_ids(dev_eui: str, config_path: str = "config/network_server_devi
     Returns:
         Tuple (nwk_id, nwk_addr) as integers
     """
-    if not os.path.exists(config_path):
-        raise FileNotFoundError(f"❌ Registry file not found at {config_path}")
-
-    with open(config_path, "r", encoding="utf-8") as f:
-        registry = yaml.safe_load(f)
-
-    devices = registry.get("devices_eui", {})
-    dev_info = devices.get(dev_eui.upper())
+    dev_info = get_registry_backend().load_registry_entry(dev_eui, config_path)
 
     if not dev_info:
         raise ValueError(f"❌ DevEUI {dev_eui} not found in central registry.")
@@ -310,13 +311,11 @@ def get_device_session_keys(dev_eui, output_dir="device_config"):
     Loads a device's YAML config and returns the NwkSKey and AppSKey.
     """
     yaml_path = os.path.join(output_dir, f"device_{dev_eui}.yaml")
+    data = load_device(dev_eui, output_dir)
 
-    if not os.path.exists(yaml_path):
+    if data is None:
         raise FileNotFoundError(f"❌ YAML file for DevEUI {dev_eui} not found at {yaml_path}")
 
-    with open(yaml_path, "r") as file:
-        data = yaml.safe_load(file)
-
     nwk_skey = data.get("NwkSKey")
     app_skey = data.get("AppSKey")
 
@@ -326,49 +325,43 @@ def get_device_session_keys(dev_eui, output_dir="device_config"):
     return nwk_skey, app_skey
 
 
+def get_device_crypto_context(dev_eui, output_dir="device_config"):
+    """
+    Returns the cached crypto context of the device session (keys as bytes, prepared
+    CMAC/AES objects). Built from the stored session keys if it is not cached yet.
+    """
+    ctx = get_crypto_context(dev_eui)
+    if ctx is not None:
+        return ctx
+
+    nwk_skey, app_skey = get_device_session_keys(dev_eui, output_dir)
+    data = load_device(dev_eui, output_dir)
+    return create_crypto_context(dev_eui, data.get("DevAddr"), nwk_skey, app_skey)
+
+
 def store_devaddr_to_deveui_mapping(dev_addr: str, dev_eui: str, index_file="config/DevAddrToDevEUI.yaml"):
     """
-    Stores a mapping of DevAddr to DevEUI in a central YAML file 
+    Stores a mapping of DevAddr to DevEUI in the in-memory index, persisted append-only
+    to the registry backend (central YAML file by default)
     to be used later on as teh packets later are only identified using dev_addr.
     """
     # Normalize input (always upper-case hex)
-    dev_addr = dev_addr.upper()
+    dev_addr = normalize_dev_addr(dev_addr)
     dev_eui = dev_eui.upper()
 
-    # Ensure config file exists
-    if os.path.exists(index_file):
-        with open(index_file, "r") as f:
-            data = yaml.safe_load(f) or {}
-    else:
-        data = {}
-
-    # Ensure "DevAddrToDevEUI" section exists
-    if "DevAddrToDevEUI" not in data:
-        data["DevAddrToDevEUI"] = {}
-
-    # Update the mapping
-    data["DevAddrToDevEUI"][dev_addr] = dev_eui
-
-    # Write back to the YAML file
-    with open(index_file, "w") as f:
-        yaml.safe_dump(data, f)
+    add_devaddr_mapping(dev_addr, dev_eui, index_file)
 
-    print(f"✅ Stored mapping: DevAddr {dev_addr} → DevEUI {dev_eui}")
+    log.info("✅ Stored mapping: DevAddr %s → DevEUI %s", dev_addr, dev_eui)
 
 
 def get_dev_eui_from_dev_addr(dev_addr, mapping_file="config/DevAddrToDevEUI.yaml"):
     """
-    Returns the DevEUI corresponding to a given DevAddr from the mapping file.
+    Returns the DevEUI corresponding to a given DevAddr (hex string in on-air order,
+    or the int parsed from FHDR) from the in-memory index.
     """
-    dev_addr = dev_addr.upper()
+    dev_addr = normalize_dev_addr(dev_addr)
 
-    if not os.path.exists(mapping_file):
-        raise FileNotFoundError(f"Mapping file not found: {mapping_file}")
-
-    with open(mapping_file, "r") as f:
-        data = yaml.safe_load(f) or {}
-
-    dev_eui = data.get("DevAddrToDevEUI", {}).get(dev_addr)
+    dev_eui = lookup_dev_eui(dev_addr, mapping_file)
 
     if dev_eui is None:
         raise KeyError(f"DevAddr {dev_addr} not found in mapping.")
@@ -382,19 +375,20 @@ def delete_device_yaml_file(dev_eui, output_dir="device_config"):
     Deletes the YAML configuration file for a given DevEUI if it exists.
     """
     yaml_path = os.path.join(output_dir, f"device_{dev_eui}.yaml")
+    evict_device(dev_eui)
+    evict_crypto_context(dev_eui)
 
-    if os.path.exists(yaml_path):
-        try:
-            os.remove(yaml_path)
-            print(f"✅ Device YAML file deleted: {yaml_path}")
+    try:
+        if get_registry_backend().delete_device(dev_eui, output_dir):
+            log.info("✅ Device YAML file deleted: %s", yaml_path)
             return True
-        except Exception as e:
-            print(f"❌ Error deleting file {yaml_path}: {e}")
-            return False
-    else:
-        print(f"⚠️ Device YAML file not found: {yaml_path}")
+    except Exception as e:
+        log.error("❌ Error deleting file %s: %s", yaml_path, e)
         return False
 
+    log.warning("⚠️ Device YAML file not found: %s", yaml_path)
+    return False
+
 def update_network_server_yaml_file(tmst: int, state_path: str = "config/network_server_device_config.yaml") -> None:
     """
     Stores gateway scheduling metadata at the network-server level.
@@ -427,22 +421,17 @@ def update_network_server_yaml_file(tmst: int, state_path: str = "config/network
     with open(state_path, "w", encoding="utf-8") as f:
         yaml.safe_dump(state, f, sort_keys=False)
 
-    print(f"✅ Network server state updated at {state_path} (LastDownlinkTMST={tmst})")
+    log.debug("✅ Network server state updated at %s (LastDownlinkTMST=%s)", state_path, tmst)
 
 ################################## STORE META DATA FROM JSON OBJECT ######################################
 
 def _parse_lora_datr(datr: str | None):
-    # "SF7BW125" -> (7, 125)
+    # "SF7BW125" -> (7, 125), cached per datr string
     if not isinstance(datr, str): return None, None
-    s = datr.upper()
     try:
-        if "SF" in s and "BW" in s:
-            sf = int(s.split("SF")[1].split("BW")[0])
-            bw = int(s.split("BW")[1])
-            return sf, bw
-    except Exception:
-        pass
-    return None, None
+        return parse_datr(datr)
+    except ValueError:
+        return None, None
 
 def add_metadata_to_device_yaml(dev_eui: str, metadata: dict, output_dir="device_config"):
     """
@@ -450,20 +439,14 @@ def add_metadata_to_device_yaml(dev_eui: str, metadata: dict, output_dir="device
     Example metadata dict: {"tmst": 12345, "freq": 868100000, "dr": "SF7BW125", "rssi": -45, "snr": 5.5}
     """
     yaml_path = os.path.join(output_dir, f"device_{dev_eui}.yaml")
+    with locked_device(dev_eui, output_dir) as device_data:
+        if device_data is None:
+            raise FileNotFoundError(f"❌ Device YAML for {dev_eui} not found at {yaml_path}")
 
-    if not os.path.exists(yaml_path):
-        raise FileNotFoundError(f"❌ Device YAML for {dev_eui} not found at {yaml_path}")
-
-    with open(yaml_path, "r") as f:
-        device_data = yaml.safe_load(f) or {}
-
-    # Always overwrite with latest metadata
-    device_data["Metadata"] = metadata
-
-    with open(yaml_path, "w") as f:
-        yaml.dump(device_data, f, sort_keys=False)
+        # Always overwrite with latest metadata (copy: the caller keeps mutating its dict)
+        device_data["Metadata"] = dict(metadata)
 
-    print(f"✅ Updated metadata for {dev_eui}: {yaml_path}")
+    log.debug("✅ Updated metadata for %s: %s", dev_eui, yaml_path)
 
 #later when the ADR is setup we can also add teh datar in teh meta data under downlink so taht we can update it in teh packet entry point
 def get_meta_data_from_device_yaml(meta_data: dict):
@@ -0,0 +1,120 @@
+import os
+import yaml
+
+# Storage backends behind device_registry.py.
+# A backend persists four things:
+#   - device records   (DevEUI -> session dict: DevAddr, keys, FCnt, DeviceSettings, Metadata, ...)
+#   - registry entries (DevEUI -> AppKey, NwkID, NwkAddr, label)  [network_server_device_config.yaml]
+#   - DevAddr mapping  (DevAddr -> DevEUI)                        [DevAddrToDevEUI.yaml]
+#   - DevNonces        (kept inside the device record as "DevNonces")
+#
+# Backend interface (duck typed):
+#   load_device(dev_eui, device_dir) -> dict | None
+#   save_devices(batch: {dev_eui: (device_dir, record)}) -> None   # one batch = one transaction
+#   delete_device(dev_eui, device_dir) -> bool
+#   load_registry_entry(dev_eui, registry_path) -> dict | None
+#   load_registry_entries(registry_path) -> {dev_eui: entry}       # startup load of the join key cache
+#   store_devaddr_mapping(dev_addr, dev_eui, mapping_path) -> None
+#   lookup_devaddr(dev_addr, mapping_path) -> str | None
+#   load_devaddr_map(mapping_path) -> {dev_addr: dev_eui}           # startup load of devaddr_index
+#   close() -> None
+#
+# The *_dir / *_path arguments are the ones device_registry already takes; backends that
+# do not use files (SQLite) ignore them.
+
+
+class YamlRegistryBackend:
+    """Current on-disk layout: one YAML per device plus the two central YAML files."""
+
+    def load_device(self, dev_eui: str, device_dir: str) -> dict | None:
+        yaml_path = os.path.join(device_dir, f"device_{dev_eui}.yaml")
+        if not os.path.exists(yaml_path):
+            return None
+        with open(yaml_path, "r", encoding="utf-8") as f:
+            return yaml.safe_load(f) or {}
+
+    def save_devices(self, batch: dict) -> None:
+        for dev_eui, (device_dir, record) in batch.items():
+            os.makedirs(device_dir or ".", exist_ok=True)
+            yaml_path = os.path.join(device_dir, f"device_{dev_eui}.yaml")
+            tmp_path = yaml_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                yaml.dump(record, f, sort_keys=False)
+            os.replace(tmp_path, yaml_path)
+
+    def delete_device(self, dev_eui: str, device_dir: str) -> bool:
+        yaml_path = os.path.join(device_dir, f"device_{dev_eui}.yaml")
+        if not os.path.exists(yaml_path):
+            return False
+        os.remove(yaml_path)
+        return True
+
+    def load_registry_entry(self, dev_eui: str, registry_path: str) -> dict | None:
+        if not os.path.exists(registry_path):
+            raise FileNotFoundError(f"❌ Registry file not found at {registry_path}")
+        with open(registry_path, "r", encoding="utf-8") as f:
+            registry = yaml.safe_load(f) or {}
+        return registry.get("devices_eui", {}).get(dev_eui.upper())
+
+    def load_registry_entries(self, registry_path: str) -> dict:
+        if not os.path.exists(registry_path):
+            raise FileNotFoundError(f"❌ Registry file not found at {registry_path}")
+        with open(registry_path, "r", encoding="utf-8") as f:
+            registry = yaml.safe_load(f) or {}
+        return {str(dev_eui).upper(): entry for dev_eui, entry in (registry.get("devices_eui") or {}).items()}
+
+    def store_devaddr_mapping(self, dev_addr: str, dev_eui: str, mapping_path: str) -> None:
+        # Append-only: one "  'DevAddr': 'DevEUI'" line under the DevAddrToDevEUI section
+        # (the file's only top-level key). A re-used DevAddr is appended again and the
+        # last line wins when the file is loaded. Quoted so all-digit hex stays a string.
+        line = f"  '{dev_addr}': '{dev_eui}'\n"
+        if not os.path.exists(mapping_path) or os.path.getsize(mapping_path) == 0:
+            line = "DevAddrToDevEUI:\n" + line
+        else:
+            with open(mapping_path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    line = "\n" + line
+        # One write() on an O_APPEND descriptor, so concurrent writers do not interleave
+        fd = os.open(mapping_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line.encode("utf-8"))
+        finally:
+            os.close(fd)
+
+    def lookup_devaddr(self, dev_addr: str, mapping_path: str) -> str | None:
+        return self.load_devaddr_map(mapping_path).get(dev_addr)
+
+    def load_devaddr_map(self, mapping_path: str) -> dict:
+        if not os.path.exists(mapping_path):
+            raise FileNotFoundError(f"Mapping file not found: {mapping_path}")
+        with open(mapping_path, "r", encoding="utf-8") as f:
+            data = yaml.safe_load(f) or {}
+        return {str(k).upper(): str(v).upper() for k, v in (data.get("DevAddrToDevEUI") or {}).items()}
+
+    def close(self) -> None:
+        pass
+
+
+_backend = YamlRegistryBackend()
+
+
+def get_registry_backend():
+    return _backend
+
+
+def set_registry_backend(backend) -> None:
+    """Replaces the active backend (call before the first uplink)."""
+    global _backend
+    _backend = backend
+
+
+def configure_registry_backend(name: str = "yaml", db_path: str = "config/registry.sqlite3") -> None:
+    """Selects the backend by name: "yaml" (default) or "sqlite"."""
+    if name == "yaml":
+        set_registry_backend(YamlRegistryBackend())
+    elif name == "sqlite":
+        from uplink_packet_handling.processing.sqlite_registry import SQLiteRegistryBackend
+        set_registry_backend(SQLiteRegistryBackend(db_path))
+    else:
+        raise ValueError(f"❌ Unknown registry backend: {name}")
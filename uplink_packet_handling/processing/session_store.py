@@ -0,0 +1,165 @@
+import copy
+import atexit
+import threading
+from contextlib import contextmanager
+from uplink_packet_handling.processing.registry_backends import get_registry_backend
+from core.log import get_logger
+
+log = get_logger(__name__)
+
+# In-memory device session store (system of record for the device records).
+# Each record is loaded from the registry backend at most once per process; afterwards
+# reads and writes hit the in-memory dict and writes only mark the record dirty.
+# A background flusher hands dirty records to the backend in batches every
+# FLUSH_INTERVAL_S, so the uplink hot path never parses or dumps YAML. The logical fields
+# are unchanged (DevAddr, keys, FCnt, DeviceSettings, Metadata, ...).
+#
+# Read-modify-write updates go through locked_device(), which holds the store lock, so
+# concurrent uplink threads never hand out the same counter value and the flusher never
+# copies a record halfway through such an update.
+#
+# FLUSH_INTERVAL_S = 0 is write-through: changes made inside uplink_transaction() are
+# flushed together when the uplink finishes (one backend transaction per uplink),
+# changes made outside it are flushed immediately.
+
+FLUSH_INTERVAL_S = 1.0
+
+_records: dict[str, dict] = {}
+_locations: dict[str, str] = {}   # DevEUI -> device_dir the record belongs to
+_dirty: set[str] = set()
+_lock = threading.RLock()
+_tx = threading.local()
+_flusher: threading.Thread | None = None
+_flusher_stop = threading.Event()
+
+
+def configure_flush_interval(interval_s: float) -> None:
+    """Sets the write-behind interval; 0 writes every change through (per uplink)."""
+    global FLUSH_INTERVAL_S
+    FLUSH_INTERVAL_S = max(0.0, float(interval_s))
+
+
+def load_device(dev_eui: str, device_dir: str = "device_config") -> dict | None:
+    """
+    Returns the live record of `dev_eui` (mutate it, then call save_device),
+    loading it from the backend on first access. Returns None if the device is unknown.
+    """
+    record = _records.get(dev_eui)
+    if record is not None:
+        return record
+
+    with _lock:
+        record = _records.get(dev_eui)
+        if record is None:
+            record = get_registry_backend().load_device(dev_eui, device_dir)
+            if record is None:
+                return None
+            _records[dev_eui] = record
+            _locations[dev_eui] = device_dir
+    return record
+
+
+def save_device(dev_eui: str, record: dict, device_dir: str = "device_config") -> None:
+    """Stores `record` as the device state and schedules it for the next flush."""
+    with _lock:
+        _records[dev_eui] = record
+        _locations[dev_eui] = device_dir
+        _dirty.add(dev_eui)
+    _schedule_flush()
+
+
+@contextmanager
+def locked_device(dev_eui: str, device_dir: str = "device_config", default=None):
+    """
+    Yields the live record of `dev_eui` (None if unknown) with the store lock held, so a
+    read-modify-write (e.g. FCntDown) cannot interleave with another writer or with the
+    flusher copying the record. The record is scheduled for the next flush when the block
+    exits without an exception. For an unknown device, `default()` (if given) creates the
+    record that is yielded and stored.
+    """
+    with _lock:
+        record = load_device(dev_eui, device_dir)
+        if record is None and default is not None:
+            record = default()
+            _records[dev_eui] = record
+            _locations[dev_eui] = device_dir
+        yield record
+        if record is None:
+            return
+        _dirty.add(dev_eui)
+    _schedule_flush()
+
+
+def _schedule_flush() -> None:
+    if FLUSH_INTERVAL_S > 0:
+        _ensure_flusher()
+    elif not getattr(_tx, "depth", 0):
+        flush_dirty()
+
+
+def evict_device(dev_eui: str) -> None:
+    """Drops a record from memory without writing it (used when the device is deleted)."""
+    with _lock:
+        _records.pop(dev_eui, None)
+        _locations.pop(dev_eui, None)
+        _dirty.discard(dev_eui)
+
+
+@contextmanager
+def uplink_transaction():
+    """Groups the record changes of one uplink; in write-through mode they are flushed together."""
+    _tx.depth = getattr(_tx, "depth", 0) + 1
+    try:
+        yield
+    finally:
+        _tx.depth -= 1
+        if _tx.depth == 0 and FLUSH_INTERVAL_S == 0:
+            flush_dirty()
+
+
+def flush_dirty() -> int:
+    """Hands every dirty record to the backend as one batch; returns the batch size."""
+    with _lock:
+        if not _dirty:
+            return 0
+        # Copy under the lock, persist outside it so uplinks are not blocked by disk I/O
+        batch = {dev_eui: (_locations.get(dev_eui, "device_config"), copy.deepcopy(_records[dev_eui]))
+                 for dev_eui in _dirty if dev_eui in _records}
+        _dirty.clear()
+
+    try:
+        get_registry_backend().save_devices(batch)
+    except Exception as e:
+        log.error("❌ Session flush failed (%d records): %s", len(batch), e)
+        with _lock:
+            _dirty.update(batch)  # retry on the next flush
+        return 0
+    return len(batch)
+
+
+def _flusher_loop() -> None:
+    while not _flusher_stop.wait(FLUSH_INTERVAL_S or 1.0):
+        try:
+            flush_dirty()
+        except Exception as e:
+            log.error("❌ Session flusher error, retrying: %s", e)
+
+
+def _ensure_flusher() -> None:
+    global _flusher
+    if _flusher is not None and _flusher.is_alive():
+        return
+    with _lock:
+        if _flusher is None or not _flusher.is_alive():
+            _flusher_stop.clear()
+            _flusher = threading.Thread(target=_flusher_loop, name="session-flusher", daemon=True)
+            _flusher.start()
+
+
+def stop_flusher() -> None:
+    """Stops the background flusher and writes whatever is still dirty."""
+    _flusher_stop.set()
+    flush_dirty()
+
+
+atexit.register(stop_flusher)
@@ -0,0 +1,257 @@
+import os
+import sys
+import json
+import sqlite3
+import threading
+import yaml
+
+# SQLite registry backend (CFG["REGISTRY_BACKEND"] = "sqlite").
+# One database in WAL mode replaces the per-device YAML files and the two central YAML
+# files. Lookups use the primary keys / indexes instead of re-parsing whole files:
+#   devices     DevEUI -> AppKey, NwkID, NwkAddr, label        (network_server_device_config.yaml)
+#   sessions    DevEUI -> session record, indexed on DevAddr   (device_config/device_<DevEUI>.yaml)
+#   dev_nonces  (DevEUI, DevNonce) in arrival order            (DevNonces list)
+#   devaddr_map DevAddr -> DevEUI, indexed on DevEUI           (DevAddrToDevEUI.yaml)
+# SQL statements are module constants so sqlite3's per-connection statement cache keeps
+# them prepared. Each thread gets its own connection; every save_devices() call (one per
+# uplink in write-through mode) is a single transaction.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS devices (
+    dev_eui   TEXT PRIMARY KEY,
+    app_key   TEXT NOT NULL,
+    nwk_id    INTEGER,
+    nwk_addr  INTEGER,
+    label     TEXT
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    dev_eui        TEXT PRIMARY KEY,
+    app_eui        TEXT,
+    dev_addr       TEXT,
+    join_status    TEXT,
+    nwk_skey       TEXT,
+    app_skey       TEXT,
+    fcnt_up        INTEGER NOT NULL DEFAULT 0,
+    fcnt_down      INTEGER NOT NULL DEFAULT 0,
+    device_settings TEXT,
+    metadata       TEXT,
+    last_updated   TEXT,
+    extra          TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_dev_addr ON sessions(dev_addr);
+CREATE TABLE IF NOT EXISTS dev_nonces (
+    dev_eui   TEXT NOT NULL,
+    dev_nonce TEXT NOT NULL,
+    seq       INTEGER NOT NULL,
+    PRIMARY KEY (dev_eui, dev_nonce)
+);
+CREATE TABLE IF NOT EXISTS devaddr_map (
+    dev_addr  TEXT PRIMARY KEY,
+    dev_eui   TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_devaddr_map_dev_eui ON devaddr_map(dev_eui);
+"""
+
+SQL_SELECT_SESSION = "SELECT * FROM sessions WHERE dev_eui = ?"
+SQL_SELECT_NONCES = "SELECT dev_nonce FROM dev_nonces WHERE dev_eui = ? ORDER BY seq"
+SQL_UPSERT_SESSION = """
+INSERT INTO sessions (dev_eui, app_eui, dev_addr, join_status, nwk_skey, app_skey,
+                      fcnt_up, fcnt_down, device_settings, metadata, last_updated, extra)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(dev_eui) DO UPDATE SET
+    app_eui = excluded.app_eui, dev_addr = excluded.dev_addr,
+    join_status = excluded.join_status, nwk_skey = excluded.nwk_skey,
+    app_skey = excluded.app_skey, fcnt_up = excluded.fcnt_up,
+    fcnt_down = excluded.fcnt_down, device_settings = excluded.device_settings,
+    metadata = excluded.metadata, last_updated = excluded.last_updated,
+    extra = excluded.extra
+"""
+SQL_INSERT_NONCE = "INSERT OR IGNORE INTO dev_nonces (dev_eui, dev_nonce, seq) VALUES (?, ?, ?)"
+SQL_DELETE_SESSION = "DELETE FROM sessions WHERE dev_eui = ?"
+SQL_DELETE_NONCES = "DELETE FROM dev_nonces WHERE dev_eui = ?"
+SQL_SELECT_DEVICE = "SELECT app_key, nwk_id, nwk_addr, label FROM devices WHERE dev_eui = ?"
+SQL_SELECT_ALL_DEVICES = "SELECT dev_eui, app_key, nwk_id, nwk_addr, label FROM devices"
+SQL_UPSERT_DEVICE = """
+INSERT INTO devices (dev_eui, app_key, nwk_id, nwk_addr, label) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT(dev_eui) DO UPDATE SET
+    app_key = excluded.app_key, nwk_id = excluded.nwk_id,
+    nwk_addr = excluded.nwk_addr, label = excluded.label
+"""
+SQL_UPSERT_DEVADDR = """
+INSERT INTO devaddr_map (dev_addr, dev_eui) VALUES (?, ?)
+ON CONFLICT(dev_addr) DO UPDATE SET dev_eui = excluded.dev_eui
+"""
+SQL_SELECT_DEVADDR = "SELECT dev_eui FROM devaddr_map WHERE dev_addr = ?"
+SQL_SELECT_ALL_DEVADDR = "SELECT dev_addr, dev_eui FROM devaddr_map"
+
+# Record keys stored in their own columns; everything else goes to the `extra` JSON column
+_SESSION_COLUMNS = {
+    "AppEUI": "app_eui", "DevAddr": "dev_addr", "JoinStatus": "join_status",
+    "NwkSKey": "nwk_skey", "AppSKey": "app_skey", "FCntUp": "fcnt_up",
+    "FCntDown": "fcnt_down", "LastUpdated": "last_updated",
+}
+_JSON_COLUMNS = {"DeviceSettings": "device_settings", "Metadata": "metadata"}
+_NOT_EXTRA = set(_SESSION_COLUMNS) | set(_JSON_COLUMNS) | {"DevEUI", "DevNonces"}
+
+
+class SQLiteRegistryBackend:
+    """Registry backend on one SQLite database (WAL, per-thread connections)."""
+
+    def __init__(self, db_path: str = "config/registry.sqlite3"):
+        self.db_path = db_path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5.0, cached_statements=64)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # ---------------- device records ----------------
+    def load_device(self, dev_eui: str, device_dir: str = "") -> dict | None:
+        conn = self._conn()
+        row = conn.execute(SQL_SELECT_SESSION, (dev_eui,)).fetchone()
+        if row is None:
+            return None
+
+        record = {"DevEUI": dev_eui, "AppEUI": row["app_eui"],
+                  "DevNonces": [r[0] for r in conn.execute(SQL_SELECT_NONCES, (dev_eui,))]}
+        for key, column in _SESSION_COLUMNS.items():
+            if key != "AppEUI":
+                record[key] = row[column]
+        for key, column in _JSON_COLUMNS.items():
+            if row[column] is not None:
+                record[key] = json.loads(row[column])
+        if row["extra"]:
+            record.update(json.loads(row["extra"]))
+        return record
+
+    def save_devices(self, batch: dict) -> None:
+        conn = self._conn()
+        with conn:  # one transaction for the whole batch
+            for dev_eui, (_device_dir, record) in batch.items():
+                self._write_record(conn, dev_eui, record)
+
+    def _write_record(self, conn: sqlite3.Connection, dev_eui: str, record: dict) -> None:
+        extra = {k: v for k, v in record.items() if k not in _NOT_EXTRA}
+        conn.execute(SQL_UPSERT_SESSION, (
+            dev_eui, record.get("AppEUI"), record.get("DevAddr"), record.get("JoinStatus"),
+            record.get("NwkSKey"), record.get("AppSKey"),
+            int(record.get("FCntUp") or 0), int(record.get("FCntDown") or 0),
+            json.dumps(record.get("DeviceSettings")) if "DeviceSettings" in record else None,
+            json.dumps(record.get("Metadata")) if "Metadata" in record else None,
+            record.get("LastUpdated"),
+            json.dumps(extra) if extra else None,
+        ))
+        conn.executemany(SQL_INSERT_NONCE, [
+            (dev_eui, nonce, seq) for seq, nonce in enumerate(record.get("DevNonces") or [])
+        ])
+
+    def delete_device(self, dev_eui: str, device_dir: str = "") -> bool:
+        conn = self._conn()
+        with conn:
+            deleted = conn.execute(SQL_DELETE_SESSION, (dev_eui,)).rowcount
+            conn.execute(SQL_DELETE_NONCES, (dev_eui,))
+        return deleted > 0
+
+    # ---------------- central registry ----------------
+    def load_registry_entry(self, dev_eui: str, registry_path: str = "") -> dict | None:
+        row = self._conn().execute(SQL_SELECT_DEVICE, (dev_eui.upper(),)).fetchone()
+        if row is None:
+            return None
+        return {"AppKey": row["app_key"], "NwkID": row["nwk_id"],
+                "NwkAddr": row["nwk_addr"], "label": row["label"]}
+
+    def load_registry_entries(self, registry_path: str = "") -> dict:
+        return {row["dev_eui"]: {"AppKey": row["app_key"], "NwkID": row["nwk_id"],
+                                 "NwkAddr": row["nwk_addr"], "label": row["label"]}
+                for row in self._conn().execute(SQL_SELECT_ALL_DEVICES)}
+
+    def store_registry_entry(self, dev_eui: str, entry: dict) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute(SQL_UPSERT_DEVICE, (dev_eui.upper(), entry.get("AppKey"), entry.get("NwkID"),
+                                             entry.get("NwkAddr"), entry.get("label")))
+
+    # ---------------- DevAddr mapping ----------------
+    def store_devaddr_mapping(self, dev_addr: str, dev_eui: str, mapping_path: str = "") -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute(SQL_UPSERT_DEVADDR, (dev_addr, dev_eui))
+
+    def lookup_devaddr(self, dev_addr: str, mapping_path: str = "") -> str | None:
+        row = self._conn().execute(SQL_SELECT_DEVADDR, (dev_addr,)).fetchone()
+        return row[0] if row else None
+
+    def load_devaddr_map(self, mapping_path: str = "") -> dict:
+        return dict(self._conn().execute(SQL_SELECT_ALL_DEVADDR).fetchall())
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def import_yaml_registry(db_path: str = "config/registry.sqlite3",
+                         device_dir: str = "device_config",
+                         registry_path: str = "config/network_server_device_config.yaml",
+                         mapping_path: str = "config/DevAddrToDevEUI.yaml") -> dict:
+    """
+    One-shot import of the current YAML layout into a SQLite registry.
+    Existing rows with the same keys are overwritten. Everything is one transaction.
+
+    Returns:
+        {"devices": n, "sessions": n, "devaddr": n}
+    """
+    backend = SQLiteRegistryBackend(db_path)
+    conn = backend._conn()
+    counts = {"devices": 0, "sessions": 0, "devaddr": 0}
+
+    registry, mapping = {}, {}
+    if os.path.exists(registry_path):
+        with open(registry_path, "r", encoding="utf-8") as f:
+            registry = (yaml.safe_load(f) or {}).get("devices_eui", {}) or {}
+    if os.path.exists(mapping_path):
+        with open(mapping_path, "r", encoding="utf-8") as f:
+            mapping = (yaml.safe_load(f) or {}).get("DevAddrToDevEUI", {}) or {}
+
+    sessions = {}
+    if os.path.isdir(device_dir):
+        for name in sorted(os.listdir(device_dir)):
+            if name.startswith("device_") and name.endswith(".yaml"):
+                with open(os.path.join(device_dir, name), "r", encoding="utf-8") as f:
+                    record = yaml.safe_load(f) or {}
+                sessions[record.get("DevEUI") or name[len("device_"):-len(".yaml")]] = record
+
+    with conn:
+        for dev_eui, entry in registry.items():
+            entry = entry or {}
+            conn.execute(SQL_UPSERT_DEVICE, (str(dev_eui).upper(), entry.get("AppKey"), entry.get("NwkID"),
+                                             entry.get("NwkAddr"), entry.get("label")))
+            counts["devices"] += 1
+        for dev_eui, record in sessions.items():
+            backend._write_record(conn, dev_eui, record)
+            counts["sessions"] += 1
+        for dev_addr, dev_eui in mapping.items():
+            conn.execute(SQL_UPSERT_DEVADDR, (str(dev_addr).upper(), str(dev_eui).upper()))
+            counts["devaddr"] += 1
+
+    backend.close()
+    return counts
+
+
+if __name__ == "__main__":
+    # python -m uplink_packet_handling.processing.sqlite_registry [db_path] [registry_path]
+    db = sys.argv[1] if len(sys.argv) > 1 else "config/registry.sqlite3"
+    reg = sys.argv[2] if len(sys.argv) > 2 else "config/network_server_device_config.yaml"
+    result = import_yaml_registry(db, registry_path=reg)
+    print(f"✅ Imported {result['devices']} devices, {result['sessions']} sessions, "
+          f"{result['devaddr']} DevAddr mappings into {db}")
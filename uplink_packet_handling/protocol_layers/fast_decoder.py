@@ -0,0 +1,163 @@
+from core.metrics import inc
+from core.log import get_logger
+from uplink_packet_handling.protocol_layers.mac_layer import parse_mac_layer
+from uplink_packet_handling.protocol_layers.application_layer import parse_app_layer
+from uplink_packet_handling.join_request_parser import parse_join_request
+from uplink_packet_handling.protocol_layers.lorawan_frame import LoRaWANFrame
+
+# Hand-written uplink frame decoder (LoRaWAN 1.0.3, section 4).
+# Produces exactly the dicts of the construct parsers (mac_layer.py, application_layer.py,
+# join_request_parser.py), reading the frame through a memoryview with shifts/masks and
+# int.from_bytes instead of Struct/BitStruct parsing. Only the fields handed to callers
+# (MACPayload, FOpts, FRMPayload, MIC) are copied out as bytes.
+#
+#   PHYPayload = MHDR(1) | MACPayload | MIC(4)
+#   MHDR       = MType[7:5] | RFU[4:2] | Major[1:0]
+#   MACPayload = DevAddr(4, LE) | FCtrl(1) | FCnt(2, LE) | FOpts(0..15) | [FPort(1) | FRMPayload]
+#   FCtrl (up) = ADR[7] | ADRACKReq[6] | ACK[5] | ClassB[4] | FOptsLen[3:0]
+#
+# FRAME_DECODER (CFG key of the same name) selects the implementation:
+#   "construct"   - the construct parsers only
+#   "fast"        - this decoder; frames it rejects go to the construct parser
+#   "cross-check" - both; mismatches are counted (frame_decoder_mismatch_total) and the
+#                   construct result is used
+# The pipeline itself works on LoRaWANFrame objects (decode_frame): in "fast" mode their
+# fields are decoded lazily, in the other modes they are filled from the construct parse.
+
+log = get_logger(__name__)
+
+FRAME_DECODERS = ("construct", "fast", "cross-check")
+FRAME_DECODER = "fast"
+
+
+def configure_frame_decoder(name: str) -> None:
+    global FRAME_DECODER
+    if name not in FRAME_DECODERS:
+        raise ValueError(f"❌ Unknown frame decoder: {name} (expected one of {FRAME_DECODERS})")
+    FRAME_DECODER = name
+
+
+# ---------------- fast decoders ----------------
+def fast_decode_mac_layer(phy_payload: bytes) -> dict:
+    if not phy_payload:
+        raise ValueError("Empty PHYPayload")
+    view = memoryview(phy_payload)
+    mhdr = view[0]
+    payload_and_mic = view[1:]
+    mac_payload = payload_and_mic[:-4] if len(payload_and_mic) >= 4 else payload_and_mic
+    return {
+        "MHDR": {
+            "MType": mhdr >> 5,
+            "RFU": (mhdr >> 2) & 0x07,
+            "Major": mhdr & 0x03
+        },
+        "MACPayload": mac_payload.tobytes(),
+        "MIC": payload_and_mic[-4:].tobytes()
+    }
+
+
+def fast_decode_app_layer(mac_payload: bytes) -> dict:
+    view = memoryview(mac_payload)
+    if len(view) < 7:
+        raise ValueError(f"MACPayload too short for FHDR: {len(view)} bytes")
+    fctrl = view[4]
+    fopts_len = fctrl & 0x0F
+    fport_at = 7 + fopts_len
+    if len(view) <= fport_at:
+        raise ValueError(f"MACPayload too short: FOptsLen={fopts_len}, no FPort")
+    return {
+        "FHDR": {
+            "DevAddr": int.from_bytes(view[0:4], "little"),
+            "FCtrl": {
+                "ADR": fctrl >> 7,
+                "ADRACKReq": (fctrl >> 6) & 0x01,
+                "ACK": (fctrl >> 5) & 0x01,
+                "ClassB": (fctrl >> 4) & 0x01,
+                "FOptsLen": fopts_len
+            },
+            "FCnt": view[5] | (view[6] << 8),
+            "FOpts": view[7:fport_at].tobytes()
+        },
+        "FPort": view[fport_at],
+        "FRMPayload": view[fport_at + 1:].tobytes()
+    }
+
+
+def fast_decode_join_request(packet_data: bytes) -> dict:
+    # Like the construct Struct, bytes after the 23-byte Join Request are ignored
+    if len(packet_data) < 23:
+        raise ValueError(f"Join Request must be 23 bytes, got {len(packet_data)}")
+    hexed = memoryview(packet_data)[:23].hex().upper()
+    return {
+        "Type": "JoinRequest",
+        "MHDR": hexed[0:2],
+        "AppEUI": hexed[2:18],
+        "DevEUI": hexed[18:34],
+        "DevNonce": hexed[34:38],
+        "MIC": hexed[38:46]
+    }
+
+
+# ---------------- selected decoder ----------------
+def _decode(fast, slow, data):
+    if FRAME_DECODER == "construct":
+        return slow(data)
+    if FRAME_DECODER == "fast":
+        try:
+            return fast(data)
+        except ValueError:
+            return slow(data)
+
+    expected = slow(data)
+    try:
+        got = fast(data)
+    except ValueError as e:
+        got = e
+    if got != expected:
+        inc("frame_decoder_mismatch_total")
+        log.warning("[NS] %s mismatch for %s: %s != %s", fast.__name__, bytes(data).hex().upper(), got, expected)
+    return expected
+
+
+def decode_mac_layer(phy_payload: bytes) -> dict:
+    """MHDR / MACPayload / MIC of an uplink (same dict as parse_mac_layer)."""
+    return _decode(fast_decode_mac_layer, parse_mac_layer, phy_payload)
+
+
+def decode_app_layer(mac_payload: bytes) -> dict:
+    """FHDR / FPort / FRMPayload of a data frame (same dict as parse_app_layer)."""
+    return _decode(fast_decode_app_layer, parse_app_layer, mac_payload)
+
+
+def decode_join_request(packet_data: bytes) -> dict:
+    """Join Request fields (same dict as parse_join_request)."""
+    return _decode(fast_decode_join_request, parse_join_request, packet_data)
+
+
+def decode_frame(phy_payload: bytes) -> LoRaWANFrame:
+    """Wraps an uplink PHYPayload in a LoRaWANFrame according to FRAME_DECODER."""
+    frame = LoRaWANFrame(phy_payload)
+    if FRAME_DECODER == "fast":
+        return frame
+
+    mac = parse_mac_layer(frame.raw)
+    if frame.is_join_request:
+        expected, got = parse_join_request(frame.raw), _try(frame.join_request_dict)
+    elif frame.is_data_up:
+        app = parse_app_layer(mac["MACPayload"])
+        expected, got = app, _try(frame.app_layer_dict)
+        frame.prefill_app_layer(app)
+    else:
+        expected, got = mac, _try(frame.mac_layer_dict)
+
+    if FRAME_DECODER == "cross-check" and got != expected:
+        inc("frame_decoder_mismatch_total")
+        log.warning("[NS] LoRaWANFrame mismatch for %s: %s != %s", frame.raw.hex().upper(), got, expected)
+    return frame
+
+
+def _try(fn):
+    try:
+        return fn()
+    except ValueError as e:
+        return e
@@ -0,0 +1,238 @@
+# Uplink frame object passed through every stage of the uplink pipeline
+# (entry point -> dispatch -> data uplink / join handling -> MAC commands).
+# It wraps the raw PHYPayload and decodes each field on first access (memoryview /
+# int.from_bytes, cached in a slot), so a frame dropped early (duplicate, bad MIC,
+# unknown DevAddr) never pays for fields it did not need.
+#
+#   PHYPayload = MHDR(1) | MACPayload | MIC(4)
+#   MACPayload = DevAddr(4, LE) | FCtrl(1) | FCnt(2, LE) | FOpts(0..15) | [FPort(1) | FRMPayload]
+#   Join Request MACPayload = AppEUI(8) | DevEUI(8) | DevNonce(2)
+#
+# Stages also keep their results on the frame (dev_eui once resolved, mic_valid).
+# frame["DevAddr"], frame["FCtrl"]["ADR"], ... still work for code written against the
+# old flat dicts.
+
+_UNSET = object()
+
+JOIN_REQUEST = 0
+DATA_UP_MTYPES = (2, 4)
+
+# MHDR.MType -> legacy "Type" name (LoRaWAN 1.0.3; 6 is RFU)
+MTYPE_NAMES = ("JoinRequest", "JoinAccept", "UnconfirmedDataUp", "UnconfirmedDataDown",
+               "ConfirmedDataUp", "ConfirmedDataDown", "RFU", "Proprietary")
+
+# Legacy dict key -> attribute
+_LEGACY_KEYS = {
+    "MHDR": "mhdr", "MType": "mtype", "RFU": "rfu", "Major": "major", "MIC": "mic",
+    "MACPayload": "mac_payload", "DevAddr": "dev_addr", "FCtrl": "fctrl_dict", "FCnt": "fcnt",
+    "FOpts": "f_opts", "FOptsLen": "f_opts_len", "FPort": "f_port", "FRMPayload": "frm_payload",
+    "ADR": "adr", "ADRACKReq": "adr_ack_req", "ACK": "ack", "ClassB": "class_b",
+    "AppEUI": "app_eui", "DevEUI": "dev_eui", "DevNonce": "dev_nonce", "Type": "type_name",
+}
+
+
+class LoRaWANFrame:
+    __slots__ = ("raw", "_view", "_dev_addr", "_fcnt", "_f_opts", "_f_port", "_frm_payload",
+                 "_dev_eui", "mic_valid")
+
+    def __init__(self, phy_payload: bytes):
+        if not phy_payload:
+            raise ValueError("Empty PHYPayload")
+        self.raw = bytes(phy_payload)
+        self._view = memoryview(self.raw)
+        self._dev_addr = self._fcnt = self._f_opts = self._f_port = self._frm_payload = _UNSET
+        self._dev_eui = _UNSET
+        self.mic_valid = None
+
+    def __len__(self) -> int:
+        return len(self.raw)
+
+    def __getitem__(self, key: str):
+        try:
+            return getattr(self, _LEGACY_KEYS[key])
+        except KeyError:
+            raise KeyError(key) from None
+
+    def __repr__(self) -> str:
+        return f"LoRaWANFrame(MType={self.mtype}, {self.raw.hex().upper()})"
+
+    # ---------------- MHDR / MIC (always present) ----------------
+    @property
+    def mhdr_byte(self) -> bytes:
+        return self.raw[:1]
+
+    @property
+    def mtype(self) -> int:
+        return self.raw[0] >> 5
+
+    @property
+    def rfu(self) -> int:
+        return (self.raw[0] >> 2) & 0x07
+
+    @property
+    def major(self) -> int:
+        return self.raw[0] & 0x03
+
+    @property
+    def mhdr(self) -> dict:
+        return {"MType": self.mtype, "RFU": self.rfu, "Major": self.major}
+
+    @property
+    def mac_payload(self) -> bytes:
+        return self.raw[1:-4] if len(self.raw) >= 5 else self.raw[1:]
+
+    @property
+    def signed_part(self) -> bytes:
+        """MHDR | MACPayload, the message the MIC is computed over."""
+        return self.raw[:-4]
+
+    @property
+    def mic(self) -> bytes:
+        return self.raw[max(1, len(self.raw) - 4):]
+
+    @property
+    def is_join_request(self) -> bool:
+        return self.mtype == JOIN_REQUEST
+
+    @property
+    def is_data_up(self) -> bool:
+        return self.mtype in DATA_UP_MTYPES
+
+    @property
+    def type_name(self) -> str:
+        return MTYPE_NAMES[self.mtype]
+
+    # ---------------- FHDR (data frames) ----------------
+    def _require_fhdr(self) -> None:
+        if len(self.raw) < 12:
+            raise ValueError(f"Frame too short for FHDR: {len(self.raw)} bytes")
+
+    @property
+    def dev_addr(self) -> int:
+        """DevAddr as the int read little-endian from the frame."""
+        if self._dev_addr is _UNSET:
+            self._require_fhdr()
+            self._dev_addr = int.from_bytes(self._view[1:5], "little")
+        return self._dev_addr
+
+    @property
+    def dev_addr_bytes(self) -> bytes:
+        """DevAddr in on-air (LSB first) order."""
+        self._require_fhdr()
+        return self.raw[1:5]
+
+    @property
+    def fctrl(self) -> int:
+        self._require_fhdr()
+        return self.raw[5]
+
+    @property
+    def adr(self) -> int:
+        return self.fctrl >> 7
+
+    @property
+    def adr_ack_req(self) -> int:
+        return (self.fctrl >> 6) & 0x01
+
+    @property
+    def ack(self) -> int:
+        return (self.fctrl >> 5) & 0x01
+
+    @property
+    def class_b(self) -> int:
+        return (self.fctrl >> 4) & 0x01
+
+    @property
+    def f_opts_len(self) -> int:
+        return self.fctrl & 0x0F
+
+    @property
+    def fctrl_dict(self) -> dict:
+        return {"ADR": self.adr, "ADRACKReq": self.adr_ack_req, "ACK": self.ack,
+                "ClassB": self.class_b, "FOptsLen": self.f_opts_len}
+
+    @property
+    def fcnt(self) -> int:
+        if self._fcnt is _UNSET:
+            self._require_fhdr()
+            self._fcnt = self.raw[6] | (self.raw[7] << 8)
+        return self._fcnt
+
+    @property
+    def f_opts(self) -> bytes:
+        if self._f_opts is _UNSET:
+            end = 8 + self.f_opts_len
+            if end > len(self.raw) - 4:
+                raise ValueError(f"Frame too short for FOptsLen={self.f_opts_len}")
+            self._f_opts = self.raw[8:end]
+        return self._f_opts
+
+    @property
+    def f_port(self) -> int | None:
+        """FPort, or None if the frame carries no FRMPayload (MACPayload ends after FOpts)."""
+        if self._f_port is _UNSET:
+            at = 8 + len(self.f_opts)
+            self._f_port = self.raw[at] if at < len(self.raw) - 4 else None
+        return self._f_port
+
+    @property
+    def frm_payload(self) -> bytes:
+        if self._frm_payload is _UNSET:
+            self._frm_payload = b"" if self.f_port is None else self.raw[9 + len(self.f_opts):-4]
+        return self._frm_payload
+
+    # ---------------- Join Request ----------------
+    def _require_join(self) -> None:
+        if len(self.raw) < 23:
+            raise ValueError(f"Join Request must be 23 bytes, got {len(self.raw)}")
+
+    @property
+    def app_eui(self) -> str:
+        self._require_join()
+        return self._view[1:9].hex().upper()
+
+    @property
+    def dev_eui(self) -> str | None:
+        """DevEUI: read from a Join Request, resolved from the DevAddr (and set) for data frames."""
+        if self._dev_eui is _UNSET:
+            if not self.is_join_request:
+                return None
+            self._require_join()
+            self._dev_eui = self._view[9:17].hex().upper()
+        return self._dev_eui
+
+    @dev_eui.setter
+    def dev_eui(self, value: str) -> None:
+        self._dev_eui = value
+
+    @property
+    def dev_nonce(self) -> str:
+        self._require_join()
+        return self._view[17:19].hex().upper()
+
+    # ---------------- construct-compatible views ----------------
+    def mac_layer_dict(self) -> dict:
+        """Same dict as parse_mac_layer()."""
+        return {"MHDR": self.mhdr, "MACPayload": self.mac_payload, "MIC": self.mic}
+
+    def app_layer_dict(self) -> dict:
+        """Same dict as parse_app_layer() for frames with an FPort."""
+        return {
+            "FHDR": {"DevAddr": self.dev_addr, "FCtrl": self.fctrl_dict, "FCnt": self.fcnt, "FOpts": self.f_opts},
+            "FPort": self.f_port,
+            "FRMPayload": self.frm_payload
+        }
+
+    def join_request_dict(self) -> dict:
+        """Same dict as parse_join_request()."""
+        return {"Type": "JoinRequest", "MHDR": self.mhdr_byte.hex().upper(), "AppEUI": self.app_eui,
+                "DevEUI": self.dev_eui, "DevNonce": self.dev_nonce, "MIC": self._view[19:23].hex().upper()}
+
+    def prefill_app_layer(self, app: dict) -> None:
+        """Takes the data-frame fields from an already decoded parse_app_layer() dict."""
+        fhdr = app["FHDR"]
+        self._dev_addr = fhdr["DevAddr"]
+        self._fcnt = fhdr["FCnt"]
+        self._f_opts = bytes(fhdr["FOpts"])
+        self._f_port = app["FPort"]
+        self._frm_payload = bytes(app["FRMPayload"])
@@ -1,4 +1,7 @@
 from construct import Struct, BitStruct, BitsInteger, Bytes, GreedyBytes
+from core.log import get_logger
+
+log = get_logger(__name__)
 
 LoRaWANMacFrame = Struct(
         "MHDR" / BitStruct(
@@ -17,8 +20,7 @@ def parse_mac_layer(phy_payload: bytes):
     payload_and_mic = parsed_mac.MACPayloadAndMIC
     mac_payload = payload_and_mic[:-4] if len(payload_and_mic) >= 4 else payload_and_mic
     mic = payload_and_mic[-4:]
-    print("MACPayloadAndMIC:", payload_and_mic.hex().upper())
-    print("MACPayload len:", len(payload_and_mic))
+    log.debug("MACPayloadAndMIC: %s (%d bytes)", payload_and_mic.hex().upper(), len(payload_and_mic))
 
     return {
         "MHDR": {
@@ -1,36 +1,39 @@
 #MAC commands 
 from uplink_packet_handling.uplink_mac_cmd_handler.mac_cmd_extraction import extract_mac_commands
 from uplink_packet_handling.uplink_mac_cmd_handler.mac_cmd_handler import handle_and_dispatch_uplink_mac_command
-from features.security import decrypt_frm_payload
-from uplink_packet_handling.processing.device_registry import get_device_session_keys
+from uplink_packet_handling.processing.device_registry import get_device_crypto_context
+from features.adr import handle_link_adr_ans
 
-def process_mac_commands(parsed_frame,dev_eui):
+LINK_ADR_ANS_CID = "0x03"
+
+def process_mac_commands(frame,dev_eui):
     """
-    Parses a LoRaWAN packet and extracts MAC commands.
+    Extracts the MAC commands of a data uplink (LoRaWANFrame) and dispatches them.
     """
     try:
         direction=0  # Assuming uplink direction for MAC commands extraction
 
         # Extract needed fields from parsed layers
-        fopts       = parsed_frame["FOpts"]
-        fopts_len   = parsed_frame["FOptsLen"]
-        fport       = parsed_frame["FPort"]
-        frmpayload  = parsed_frame["FRMPayload"]
-        dev_addr    = parsed_frame["DevAddr"]
-        fcnt        = parsed_frame["FCnt"]
+        fopts       = frame.f_opts
+        fopts_len   = frame.f_opts_len
+        fport       = frame.f_port
+        frmpayload  = frame.frm_payload
+        fcnt        = frame.fcnt
 
     #Mac commands are Piggybacked in the FOpts field
         if fopts_len > 0 and fport!=0:
             mac_commands = extract_mac_commands(fopts)
+            _track_link_adr_ans(dev_eui, mac_commands)
             #TODO: SUPPOSED TO AHVE THIS FUCNTION ALSO CALL THE RESPONSE FUCNTIONS THAT NEED TO GENRATE THE MAC RESPONSES
             mac_response_fields=[handle_and_dispatch_uplink_mac_command(cmd, i, direction) for i, cmd in enumerate(mac_commands)]
 
             return mac_response_fields
     #Mac commands are in the Frmpayload after decryption    
         elif len(frmpayload) > 0 and fport==0:
-            app_skey,nwk_skey=get_device_session_keys(dev_eui)
-            decrypted_frmpayload = decrypt_frm_payload(app_skey, nwk_skey, dev_addr, fcnt, direction, frmpayload, fport)
+            crypto_ctx=get_device_crypto_context(dev_eui)
+            decrypted_frmpayload = crypto_ctx.crypt_frm_payload(fcnt, direction, frmpayload, fport)
             mac_commands = extract_mac_commands(decrypted_frmpayload)
+            _track_link_adr_ans(dev_eui, mac_commands)
             #TODO: SUPPOSED TO AHVE THIS FUCNTION ALSO CALL THE RESPONSE FUCNTIONS THAT NEED TO GENRATE THE MAC RESPONSES
             mac_response_fields=[handle_and_dispatch_uplink_mac_command(cmd, i,direction) for i, cmd in enumerate(mac_commands)]
 
@@ -40,3 +43,10 @@ def process_mac_commands(parsed_frame,dev_eui):
 
     except ValueError as e:
         return {"error": str(e)}
+
+
+def _track_link_adr_ans(dev_eui, mac_commands):
+    """Commits (or discards) the TXPower of the device's pending LinkADRReq on its LinkADRAns."""
+    for cmd in mac_commands:
+        if cmd["CID"] == LINK_ADR_ANS_CID and cmd["Payload"]:
+            handle_link_adr_ans(dev_eui, bytes.fromhex(cmd["Payload"])[0])  # status is the first byte
@@ -1,53 +1,184 @@
+
 import time
-from uplink_packet_handling.protocol_layers.mac_layer import parse_mac_layer
-from uplink_packet_handling.dispatch_by_mtype import parse_lorawan_packet_by_type  
-from NS_shim.uplink_gw_pkt__handler import lora_packet_extractor, extract_metadata_from_uplink
+import threading
+from typing import Callable
+from core.log import get_logger
+from core.metrics import observe, observe_stage, time_stage
+from uplink_packet_handling.protocol_layers.fast_decoder import decode_frame
+from uplink_packet_handling.protocol_layers.lorawan_frame import LoRaWANFrame
+from uplink_packet_handling.dispatch_by_mtype import parse_lorawan_packet_by_type
+from uplink_packet_handling.processing.session_store import uplink_transaction
+from uplink_packet_handling.data_uplink_handler import verify_data_uplink_mics
+from uplink_packet_handling.deduplication import collect_uplink_copy, merge_gateway_metadata
+from NS_shim.uplink_gw_pkt__handler import extract_rxpk_list, rxpk_to_phy_payload, rxpk_to_metadata
 from NS_shim.time_stamp import compute_rx_tmsts
+from features.join_guard import verify_join_request
+
+log = get_logger(__name__)
 
-def handle_uplink_packet(push_data_json: dict):
+
+def handle_uplink_packet(push_data_json: dict, gateway_mac: str | None = None,
+                         on_result: Callable[[dict], None] | None = None) -> list[dict] | None:
     """
-    Entry point: Parses any LoRaWAN uplink packet and returns:
-      (result_summary, downlink_json_or_none)
+    Entry point: parses every LoRaWAN frame bundled in one PUSH_DATA (the whole rxpk array).
+    The JSON is parsed once by the caller and shared by all frames; a failing frame
+    does not stop the others.
+
+    Args:
+        push_data_json: decoded PUSH_DATA body
+        gateway_mac: uppercase hex MAC of the gateway that sent it (stored in each frame's
+                     metadata so the downlink is routed back through that gateway)
+        on_result: called once per rxpk entry with its result. Frames that wait on a dedup
+                   window report from a dedup dispatch thread, so the call returns as soon
+                   as the frames are registered (returns None). Without it the call blocks
+                   until every frame is done (the windows run concurrently) and returns
+                   the results in order.
+
+    Result of each rxpk entry:
+      {"Index": i, "Downlink": downlink_json_or_None, "GatewayMAC": mac,
+       "RxWindows": get_rx_windows(meta_data), "OnDrop": requeue_callback_or_None,
+       "Error": None | "<message>"}
+    Hand "OnDrop" to the downlink scheduler: it puts the downlink's queued MAC commands and
+    payload back if the downlink is never sent.
+    """
+    rxpk_list = extract_rxpk_list(push_data_json)
+    frames = []
+    for rxpk in rxpk_list:
+        try:
+            with time_stage("phy_extract"):
+                phy_payload = rxpk_to_phy_payload(rxpk)
+            with time_stage("mac_parse"):
+                frames.append(decode_frame(phy_payload))
+        except Exception:
+            frames.append(None)  # reported by the per-frame loop below
+
+    # The data uplinks of the whole batch are MIC-checked in one call (sets frame.mic_valid)
+    verify_data_uplink_mics([frame for frame in frames if frame is not None])
+
+    collector = None
+    if on_result is None:
+        collector = _ResultCollector(len(rxpk_list))
+        on_result = collector.add
+
+    for index, rxpk in enumerate(rxpk_list):
+        meta_data = rxpk_to_metadata(rxpk)
+        meta_data["gateway_mac"] = gateway_mac
+
+        def on_done(downlink_json, error, index=index, meta_data=meta_data):
+            if error is not None:
+                log.warning("[NS] rxpk[%d] dropped: %s", index, error)
+                on_result({"Index": index, "Downlink": None, "GatewayMAC": gateway_mac,
+                           "RxWindows": None, "OnDrop": None, "Error": str(error)})
+            else:
+                on_result({"Index": index, "Downlink": downlink_json,
+                           "GatewayMAC": meta_data["gateway_mac"],
+                           "RxWindows": get_rx_windows(meta_data),
+                           "OnDrop": meta_data.get("on_downlink_drop"), "Error": None})
+
+        frame = frames[index]
+        if frame is None:
+            try:
+                frame = rxpk_to_phy_payload(rxpk)  # decoded (and its error reported) below
+            except Exception as e:
+                on_done(None, e)
+                continue
+        handle_uplink_frame(frame, meta_data, on_done)
+
+    return collector.wait() if collector is not None else None
+
+
+class _ResultCollector:
+    """Gathers the per-frame results of one PUSH_DATA for blocking callers."""
+
+    def __init__(self, n_results: int):
+        self.results: list = [None] * n_results
+        self.missing = n_results
+        self.cond = threading.Condition()
+
+    def add(self, result: dict) -> None:
+        with self.cond:
+            self.results[result["Index"]] = result
+            self.missing -= 1
+            self.cond.notify()
+
+    def wait(self) -> list[dict]:
+        with self.cond:
+            while self.missing > 0:
+                self.cond.wait()
+            return self.results
+
+def get_rx_windows(meta_data: dict) -> dict | None:
+    """RX window timing of an uplink for the downlink scheduler (None without a tmst)."""
+    dl_settings = meta_data.get("DLSettings") or {}
+    if dl_settings.get("rx1_tmst") is None or "recv_clock" not in meta_data:
+        return None
+    return {"recv_clock": meta_data["recv_clock"], "uplink_tmst": meta_data["tmst"],
+            "rx1_tmst": dl_settings["rx1_tmst"], "rx2_tmst": dl_settings["rx2_tmst"]}
+
+def handle_uplink_frame(frame: LoRaWANFrame | bytes, meta_data: dict,
+                        on_done: Callable[[dict | None, Exception | None], None]) -> None:
+    """
+    Handles one LoRaWAN uplink frame (LoRaWANFrame or raw PHYPayload). Frame fields are
+    only decoded by the stages that read them.
+    on_done(downlink_json_or_None, error_or_None) is called exactly once: right away for
+    duplicates (copies heard by other gateways are merged into the first copy, see
+    deduplication.py) and rejected frames, otherwise from a dedup dispatch thread once the
+    frame's collection window has closed.
 
     This version *only* computes RX1/RX2 tmst and forwards them;
     window selection is deferred to `dispatch_by_mtype`.
     """
-    # 1) Extract raw bytes + metadata from the concentrator JSON
-    lorawan_packet_bytes = lora_packet_extractor(push_data_json)
-    meta_data = extract_metadata_from_uplink(push_data_json)  # should include 'tmst' (uplink)
-    meta_data["recv_clock"] = time.perf_counter()
-    # 2) Pre-compute RX1/RX2 tmst (no choice here)
-    uplink_tmst = meta_data.get("tmst")
-    if uplink_tmst is not None:
-        rx1_tmst, rx2_tmst = compute_rx_tmsts(uplink_tmst, rx1_delay_s=1)
-        # stash both for downstream decision
-        meta_data["DLSettings"] = {
-            "rx1_tmst": rx1_tmst,
-            "rx2_tmst": rx2_tmst
-        }
-    else:
-        meta_data["DlSettings"] = {"rx1_tmst": None, "rx2_tmst": None}
-
-    # 3) Parse the LoRaWAN MAC
-    mac_result = parse_mac_layer(lorawan_packet_bytes)
-
-    # 4) Rebuild MHDR byte for downstream MIC logic
-    mhdr = mac_result["MHDR"]
-    mhdr_byte = bytes([
-        (mhdr["MType"] & 0x07) |
-        ((mhdr["RFU"] & 0x07) << 3) |
-        ((mhdr["Major"] & 0x03) << 6)
-    ])
-
-    # 5) Dispatch by MType — pass meta_data (with dl_sched but no 'chosen')
-    mtype = mhdr["MType"]
-    mac_payload = mac_result["MACPayload"]
-    mic = mac_result["MIC"]
-
-    #parse_lorawan_packet_by_type(mtype,lorawan_packet_bytes,mhdr,mhdr_byte,mac_payload,mic,meta_data)
-    downlink_json=parse_lorawan_packet_by_type(mtype,lorawan_packet_bytes,mhdr,mhdr_byte,mac_payload,mic,meta_data)
-    
-    return downlink_json
-
-
-    
\ No newline at end of file
+    try:
+        # 1) Radio metadata comes from the frame's own rxpk entry (should include 'tmst')
+        meta_data["recv_clock"] = time.perf_counter()
+        # 2) Pre-compute RX1/RX2 tmst (no choice here)
+        uplink_tmst = meta_data.get("tmst")
+        if uplink_tmst is not None:
+            rx1_tmst, rx2_tmst = compute_rx_tmsts(uplink_tmst, rx1_delay_s=1)
+            # stash both for downstream decision
+            meta_data["DLSettings"] = {
+                "rx1_tmst": rx1_tmst,
+                "rx2_tmst": rx2_tmst
+            }
+        else:
+            meta_data["DlSettings"] = {"rx1_tmst": None, "rx2_tmst": None}
+
+        if not isinstance(frame, LoRaWANFrame):
+            frame = decode_frame(frame)
+        # 2a) Join-Requests are authenticated from the in-memory AppKey cache before anything
+        #     else (no dedup window, no registry access for forged or corrupted joins)
+        if frame.is_join_request:
+            with time_stage("mic"):
+                reason = verify_join_request(frame)
+            if reason is not None:
+                raise ValueError(f"❌ Join-Request rejected: {reason}")
+
+        # 2b) Cross-gateway dedup: only the first copy goes on, after the collection window,
+        #     carrying the best gateway's radio metadata and every gateway's rssi/lsnr
+        opened_at = time.perf_counter()
+        dedup_entry = collect_uplink_copy(
+            frame.raw, meta_data,
+            lambda copies: _finish_uplink_frame(frame, meta_data, copies, opened_at, on_done))
+    except Exception as e:
+        on_done(None, e)
+        return
+    if dedup_entry is None:
+        on_done(None, None)
+
+
+def _finish_uplink_frame(frame: LoRaWANFrame, meta_data: dict, copies: list[dict],
+                         opened_at: float, on_done) -> None:
+    """Second half of handle_uplink_frame, run once the frame's dedup window has closed."""
+    try:
+        observe_stage("dedup_wait", time.perf_counter() - opened_at)
+        merge_gateway_metadata(meta_data, copies)
+
+        # 3) Dispatch by MType — pass meta_data (with dl_sched but no 'chosen')
+        # All registry changes of this uplink are persisted together
+        with uplink_transaction():
+            downlink_json = parse_lorawan_packet_by_type(frame, meta_data)
+        observe("uplink_processing_seconds", time.perf_counter() - meta_data["recv_clock"])
+    except Exception as e:
+        on_done(None, e)
+        return
+    on_done(downlink_json, None)